@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Registro diferido de actividad (last_login)
+Las lecturas de perfil solo anotan la marca de tiempo en memoria; un hilo la
+vuelca a la base de datos en lotes cada LAST_LOGIN_FLUSH_INTERVAL segundos,
+con una sola sentencia executemany. Varias lecturas de la misma wallet dentro
+de la ventana se funden en una única escritura.
+"""
+
+import os
+import atexit
+import threading
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityTracker:
+    """Buffer de marcas de actividad por wallet con volcado periódico"""
+
+    def __init__(self, flush, interval=None):
+        """flush(items) recibe [(wallet_address, datetime), ...] y los persiste"""
+        self.flush_fn = flush
+        self.interval = interval or float(os.getenv('LAST_LOGIN_FLUSH_INTERVAL', 5))
+        self._lock = threading.Lock()
+        self._pending = {}  # {wallet: datetime}
+        self._started = False
+
+        # Métricas
+        self.touches = 0
+        self.writes = 0
+        self.flushes = 0
+
+    def touch(self, wallet_address, when=None):
+        """Anota actividad; devuelve la marca registrada"""
+        when = when or datetime.utcnow()
+        with self._lock:
+            self.touches += 1
+            current = self._pending.get(wallet_address)
+            if current is None or when > current:
+                self._pending[wallet_address] = when
+            return self._pending[wallet_address]
+
+    def pending(self, wallet_address):
+        """Marca aún no volcada para la wallet (o None)"""
+        with self._lock:
+            return self._pending.get(wallet_address)
+
+    def flush(self):
+        with self._lock:
+            items, self._pending = list(self._pending.items()), {}
+        if not items:
+            return 0
+        try:
+            self.flush_fn(items)
+        except Exception as e:
+            logger.error(f"Error volcando last_login: {e}")
+            # Reintegrar sin pisar marcas más nuevas llegadas mientras tanto
+            with self._lock:
+                for wallet_address, when in items:
+                    current = self._pending.get(wallet_address)
+                    if current is None or when > current:
+                        self._pending[wallet_address] = when
+            return 0
+        with self._lock:
+            self.writes += len(items)
+            self.flushes += 1
+        return len(items)
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+
+        def schedule():
+            timer = threading.Timer(self.interval, run)
+            timer.daemon = True
+            timer.start()
+
+        def run():
+            self.flush()
+            schedule()
+
+        schedule()
+        # No perder las marcas pendientes al apagar
+        atexit.register(self.flush)
+
+    def get_metrics(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'touches': self.touches,
+                'writes': self.writes,
+                'flushes': self.flushes,
+                'coalesced': max(self.touches - self.writes - len(self._pending), 0),
+                'interval': self.interval
+            }
@@ -1,13 +1,16 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response, stream_with_context
 from flask_socketio import SocketIO, emit, join_room, leave_room
 import random
 import time
 import threading
 import json
 import os
+import csv
+import io
 from datetime import datetime
 import requests
-from sqlalchemy import create_engine, Column, String, Integer, Float, DateTime
+from sqlalchemy import create_engine, Column, String, Integer, Float, DateTime, Index, text, update, insert, select, bindparam, or_, func
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, declarative_base
 from helius_integration import initialize_helius, get_helius_client, get_wallet_info_for_game
 from dotenv import load_dotenv
@@ -16,9 +19,26 @@ from security_integration import (
     validate_withdrawal_security, update_withdrawal_security,
     get_security_status
 )
+from audit_archive import start_audit_retention
+from webhook_queue import WebhookQueue
+from signature_cache import SignatureDedupCache
+from deposit_backfill import DepositBackfill
+from wallet_registry import WalletSocketRegistry, wallet_room
+from wallet_auth import WalletAuthenticator
+from balance_cache import BalanceCache
+from withdrawal_worker import WithdrawalWorker
+from payout_builder import is_valid_destination
+from blockhash_cache import BlockhashCache
+from signing_pool import SigningService
+from chip_ledger import ChipLedger, HOUSE, CUSTODIAL, player_account, pot_account
+from activity_tracker import ActivityTracker
+from profile_cache import ProfileCache, PROFILE_FIELDS
+from pagination import keyset_page, page_size, CountCache
+from deposit_metrics import DepositMetrics
 from functools import wraps
 import hashlib
 import hmac
+import uuid
 
 # Cargar variables de entorno
 load_dotenv()
@@ -40,6 +60,20 @@ except Exception as e:
     print(f"❌ Error inicializando Helius: {e}")
     helius_client = None
 
+# Caché de balances SOL (TTL + single-flight) delante de get_sol_balance
+balance_cache = BalanceCache(
+    lambda wallet_address: helius_client.get_sol_balance(wallet_address, raise_errors=True)
+) if helius_client else None
+
+def warm_balance_cache(wallet_addresses):
+    """Consulta balances en lote (getMultipleAccounts) y los guarda en la caché"""
+    if not helius_client:
+        return {}
+    balances = helius_client.get_sol_balances(wallet_addresses)
+    for wallet_address, balance in balances.items():
+        balance_cache.set(wallet_address, balance)
+    return balances
+
 # ----------------- Blockchain & Database Setup -----------------
 CUSTODIAL_ADDRESS = os.getenv('CUSTODIAL_ADDRESS', 'YOUR_CUSTODIAL_SOL_ADDRESS')
 COMMISSION_ADDRESS = os.getenv('COMMISSION_ADDRESS', '')
@@ -94,6 +128,16 @@ class UserTransaction(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     description = Column(String(200), nullable=True)
     
+    # Un depósito on-chain solo puede acreditarse una vez
+    __table_args__ = (
+        Index('uq_user_transactions_deposit_signature', 'signature', unique=True,
+              sqlite_where=text("transaction_type = 'deposit'"),
+              postgresql_where=text("transaction_type = 'deposit'")),
+        # Paginación por clave de los historiales: (wallet[, tipo], created_at, id)
+        Index('ix_user_transactions_wallet_created', 'wallet_address', 'created_at', 'id'),
+        Index('ix_user_transactions_wallet_type_created', 'wallet_address', 'transaction_type', 'created_at', 'id'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -107,10 +151,116 @@ class UserTransaction(Base):
         }
 
 Base.metadata.create_all(bind=engine)
+# create_all no agrega índices a tablas existentes
+deposit_signature_index_error = None
+for index in UserTransaction.__table__.indexes:
+    try:
+        index.create(bind=engine, checkfirst=True)
+    except Exception as e:
+        print(f"⚠️ No se pudo crear el índice {index.name}: {e}")
+        if index.name == 'uq_user_transactions_deposit_signature':
+            deposit_signature_index_error = e
+
+# Libro mayor de fichas en partida doble
+chip_ledger = ChipLedger(engine)
+
+def open_ledger_balances():
+    """Asiento de apertura con los saldos existentes si el libro mayor está vacío"""
+    if not chip_ledger.is_empty():
+        return
+    db = SessionLocal()
+    try:
+        rows = db.query(UserProfile.wallet_address, UserProfile.chips).yield_per(10000)
+        opened = chip_ledger.open_balances((player_account(row.wallet_address), row.chips) for row in rows)
+        if opened:
+            print(f"📒 Libro mayor abierto con {opened} saldos existentes")
+    finally:
+        db.close()
+
+try:
+    open_ledger_balances()
+    chip_ledger.start_checkpoints()
+except Exception as e:
+    print(f"⚠️ Error inicializando libro mayor: {e}")
+
+def flush_last_login(items):
+    """Vuelca en lote las marcas de last_login acumuladas en memoria"""
+    profiles = UserProfile.__table__
+    with engine.begin() as conn:
+        conn.execute(
+            profiles.update()
+            .where(profiles.c.wallet_address == bindparam('b_wallet'))
+            .where(or_(profiles.c.last_login.is_(None), profiles.c.last_login < bindparam('b_last_login')))
+            .values(last_login=bindparam('b_last_login')),
+            [{'b_wallet': wallet_address, 'b_last_login': when} for wallet_address, when in items]
+        )
+
+# last_login se escribe en lotes: las lecturas de perfil no escriben
+activity_tracker = ActivityTracker(flush_last_login)
+activity_tracker.start()
+
+# Perfiles recientes en memoria; las rutas que escriben invalidan tras el commit
+profile_cache = ProfileCache()
+
+# Totales de los historiales paginados; se invalidan al añadir transacciones
+history_counts = CountCache()
+
+# Contadores de depósitos en memoria para /api/webhook/metrics
+deposit_metrics = DepositMetrics(engine, UserTransaction.__table__)
+try:
+    deposit_metrics.load()
+except Exception as e:
+    print(f"⚠️ Error cargando métricas de depósitos: {e}")
+
+def history_page(query, wallet_address, count_key, cursor, limit):
+    """Página por clave (created_at, id) del historial y su total cacheado"""
+    rows, next_cursor = keyset_page(query, UserTransaction.created_at, UserTransaction.id, cursor, limit)
+    total_count = history_counts.get(wallet_address, count_key, lambda: query.order_by(None).count())
+    return rows, next_cursor, total_count
+
+def _select_profile():
+    return select(*(getattr(UserProfile, field) for field in PROFILE_FIELDS))
+
+def profile_snapshot(row):
+    """Dict de PROFILE_FIELDS a partir de una fila o instancia de UserProfile"""
+    return {field: getattr(row, field) for field in PROFILE_FIELDS}
+
+def load_profile(wallet_address):
+    with engine.connect() as conn:
+        row = conn.execute(_select_profile().where(UserProfile.wallet_address == wallet_address)).first()
+    return profile_snapshot(row) if row else None
+
+def load_profile_by_username(username):
+    with engine.connect() as conn:
+        row = conn.execute(_select_profile().where(UserProfile.username == username).limit(1)).first()
+    return profile_snapshot(row) if row else None
+
+def load_signature_cache():
+    """Reconstruye el filtro de signatures procesadas desde la base de datos"""
+    db = SessionLocal()
+    try:
+        total = db.query(UserTransaction).filter(UserTransaction.signature.isnot(None)).count()
+        rows = db.query(UserTransaction.signature).filter(
+            UserTransaction.signature.isnot(None)
+        ).yield_per(10000)
+        signature_cache.rebuild((row.signature for row in rows), expected_count=total)
+    finally:
+        db.close()
+
+signature_cache = SignatureDedupCache()
+if deposit_signature_index_error is not None:
+    # Sin el índice único nada impide acreditar dos veces: comprobar siempre en la BD
+    signature_cache.disable_fast_path(f"sin índice único de depósitos ({deposit_signature_index_error})")
+try:
+    load_signature_cache()
+except Exception as e:
+    print(f"⚠️ Error cargando caché de signatures: {e}")
 # Inicializar sistema de seguridad avanzada
 try:
     security_manager = SecurityManager()
     # Las tablas se inicializan automáticamente en __init__
+    # Rotación diaria de audit_logs hacia el archivo comprimido
+    start_audit_retention(security_manager.audit_archiver)
     print("✅ Sistema de seguridad avanzada inicializado")
 except Exception as e:
     print(f"⚠️ Error inicializando seguridad: {e}")
@@ -118,31 +268,146 @@ except Exception as e:
 
 
 
-def sync_all_players_chips(players):
-    """Sincroniza las fichas de todos los jugadores proporcionados."""
-    db = SessionLocal()
-    for p in players:
-        if not getattr(p, 'is_bot', False):
-            profile = db.query(UserProfile).filter_by(username=p.name).first()
-            if profile:
-                profile.chips = p.chips
-    db.commit()
-    db.close()
-
-def load_user_chips(username):
-    """Carga las fichas del usuario desde la base de datos."""
+def sync_all_players_chips(players, room_id):
+    """
+    Sincroniza las fichas de los jugadores con la base de datos.
+    Se aplica la variación desde la última sincronización (o desde que se
+    sentaron) con apply_chip_delta, sin sobrescribir el saldo: lo que la wallet
+    reciba o gaste fuera de la mesa mientras tanto se conserva. La misma
+    variación se asienta contra el pozo de la sala.
+    """
+    if room_id is None:
+        raise ValueError("sync_all_players_chips requiere room_id")
     db = SessionLocal()
+    synced = []
+    applied = []
     try:
-        profile = db.query(UserProfile).filter_by(username=username).first()
-        if profile:
-            return profile.chips
-        return 100  # Fichas por defecto si no existe el perfil
+        for p in players:
+            if getattr(p, 'is_bot', False):
+                continue
+            delta = p.chips - p.synced_chips
+            if delta == 0:
+                continue
+            wallet_address = db.query(UserProfile.wallet_address).filter_by(username=p.name).scalar()
+            if wallet_address is None:
+                continue
+            if apply_chip_delta(db, wallet_address, delta) is None:
+                print(f"⚠️ No se sincronizaron {delta} fichas de {p.name}: saldo insuficiente")
+                continue
+            # La diferencia sale del pozo de la mesa (o entra en él)
+            chip_ledger.post(db, [(player_account(wallet_address), delta),
+                                  (pot_account(room_id), -delta)], 'game', reference=room_id)
+            synced.append(wallet_address)
+            applied.append((p, p.chips))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
+    for p, chips in applied:
+        p.synced_chips = chips
+    profile_cache.invalidate(*synced)
+
+# ================= MUTACIONES ATÓMICAS DE FICHAS =================
+
+def apply_chip_delta(db, wallet_address, delta, touch_login=False):
+    """
+    Suma delta a las fichas de la wallet con un único UPDATE condicional:
+        UPDATE user_profiles SET chips = chips + :delta
+        WHERE wallet_address = :wallet AND chips + :delta >= 0 RETURNING chips
+    Devuelve el nuevo saldo, o None si el perfil no existe o quedaría negativo.
+    Se ejecuta dentro de la transacción de db, así que el registro de
+    user_transactions añadido a la misma sesión se confirma en el mismo commit.
+    """
+    values = {'chips': UserProfile.chips + delta}
+    if touch_login:
+        values['last_login'] = datetime.utcnow()
+    return db.execute(
+        update(UserProfile)
+        .where(UserProfile.wallet_address == wallet_address)
+        .where(UserProfile.chips + delta >= 0)
+        .values(**values)
+        .returning(UserProfile.chips)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+
+def credit_chips(db, wallet_address, delta, touch_login=True):
+    """Acredita fichas creando el perfil (con las fichas iniciales) si no existe"""
+    new_balance = apply_chip_delta(db, wallet_address, delta, touch_login)
+    if new_balance is not None:
+        return new_balance
+    try:
+        with db.begin_nested():
+            db.add(UserProfile(
+                wallet_address=wallet_address,
+                username=f"User_{wallet_address[:8]}",
+                chips=100 + delta  # Fichas iniciales
+            ))
+            post_initial_grant(db, wallet_address)
+        return 100 + delta
+    except IntegrityError:
+        # Otro proceso creó el perfil en paralelo
+        return apply_chip_delta(db, wallet_address, delta, touch_login)
+
+def credit_chips_batch(db, credits, touch_login=True):
+    """
+    Acredita {wallet: fichas} en la transacción de db: un UPDATE en lote
+    (executemany) para los perfiles existentes y un INSERT en lote, con las
+    fichas iniciales, para los que no existen. Devuelve las wallets creadas
+    (sus asientos de fichas iniciales los registra el llamador). Si otro
+    proceso crea uno de esos perfiles en paralelo se lanza IntegrityError.
+    """
+    profiles = UserProfile.__table__
+    existing = {
+        row.wallet_address for row in db.execute(
+            select(profiles.c.wallet_address).where(profiles.c.wallet_address.in_(list(credits)))
+        )
+    }
+    now = datetime.utcnow()
+    updates = [{'b_wallet': wallet_address, 'b_delta': delta}
+               for wallet_address, delta in credits.items() if wallet_address in existing]
+    if updates:
+        values = {'chips': profiles.c.chips + bindparam('b_delta')}
+        if touch_login:
+            values['last_login'] = now
+        db.execute(profiles.update().where(profiles.c.wallet_address == bindparam('b_wallet')).values(**values),
+                   updates)
+    created = [wallet_address for wallet_address in credits if wallet_address not in existing]
+    if created:
+        db.execute(insert(profiles), [
+            {'wallet_address': wallet_address, 'username': f"User_{wallet_address[:8]}",
+             'chips': 100 + credits[wallet_address]}  # Fichas iniciales
+            for wallet_address in created
+        ])
+    return created
+
+def post_initial_grant(db, wallet_address, chips=100):
+    """Asiento de las fichas iniciales que la casa regala a un perfil nuevo"""
+    chip_ledger.post(db, [(HOUSE, -chips), (player_account(wallet_address), chips)], 'grant')
+
+def withdrawal_ledger_lines(wallet_address, chip_amount, lamports):
+    """
+    Líneas de un retiro: el jugador entrega chip_amount, la custodia paga el
+    neto en SOL y la comisión queda para la casa
+    """
+    tokens_per_sol = int(os.getenv('TOKENS_PER_SOL', 100000))
+    net_chips = min(chip_amount, round(lamports * tokens_per_sol / 1_000_000_000))
+    return [(player_account(wallet_address), -chip_amount),
+            (CUSTODIAL, net_chips),
+            (HOUSE, chip_amount - net_chips)]
+
+def load_user_chips(username):
+    """Carga las fichas del usuario (caché de perfiles o base de datos)."""
+    profile = profile_cache.get_by_username(username, load_profile_by_username)
+    if profile:
+        return profile['chips']
+    return 100  # Fichas por defecto si no existe el perfil
 
 TOKENS_PER_SOL = 100_000  # 1 SOL = 100 000 fichas
 MIN_WITHDRAW_TOKENS = 1_000  # mínimo para retirar (reducido a 1,000 fichas)
 WITHDRAW_FEE_PERCENT = 5
+PROFILE_UPDATE_ATTEMPTS = 3  # Reintentos de update_user_profile si el saldo cambia a la vez
 
 # Clases del juego "La Más Alta Gana"
 class Card:
@@ -169,6 +434,7 @@ class Player:
         self.sid = sid
         self.name = name
         self.chips = chips
+        self.synced_chips = chips  # Fichas en la base de datos al sentarse / última sincronización
         self.hand = []
         self.is_folded = False
         self.is_bot = False
@@ -423,7 +689,7 @@ class GameRoom:
                     'total_winnings': winner_share + self.final_pot
                 }, room=self.room_id)
                 # Sincronizar fichas finales con la base de datos
-                sync_all_players_chips(self.players)
+                sync_all_players_chips(self.players, self.room_id)
             else:
                 socketio.emit('round_over', {
                     'winner_id': self.winner.sid, 
@@ -433,7 +699,7 @@ class GameRoom:
                     'win_streak': self.win_streaks[self.winner.sid]
                 }, room=self.room_id)
                 # Sincronizar fichas con la base de datos después de cada ronda
-                sync_all_players_chips(self.players)
+                sync_all_players_chips(self.players, self.room_id)
                 # Iniciar automáticamente la siguiente ronda después de 4 segundos
                 threading.Timer(4.0, self.start_round).start()
 
@@ -463,6 +729,8 @@ class GameRoom:
 game_rooms = {}
 player_queue = {}  # {table_bet: [{'sid': sid, 'username': username, 'timestamp': time}]}
 queue_timers = {}  # {table_bet: timer_object}
+wallet_sockets = WalletSocketRegistry()  # wallet -> sids para notificaciones dirigidas
+wallet_auth = WalletAuthenticator(app.config['SECRET_KEY'])  # firma de nonce antes de asociar la wallet
 
 def emit_game_state(room_id):
     if room_id in game_rooms:
@@ -548,8 +816,8 @@ def game(room_id):
 def get_wallet_balance(wallet_address):
     """Obtiene el balance de SOL de una wallet"""
     try:
-        if helius_client:
-            balance = helius_client.get_sol_balance(wallet_address)
+        if balance_cache:
+            balance = balance_cache.get(wallet_address)
             return jsonify({
                 'sol_balance': balance,
                 'wallet_address': wallet_address
@@ -559,46 +827,107 @@ def get_wallet_balance(wallet_address):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/wallet/presence')
+def get_wallet_presence():
+    """Conteo de wallets y sesiones conectadas por Socket.IO"""
+    wallet_address = request.args.get('wallet')
+    presence = wallet_sockets.get_presence()
+    if wallet_address:
+        presence['wallet_address'] = wallet_address
+        presence['sessions'] = wallet_sockets.session_count(wallet_address)
+    return jsonify(presence)
+
+@app.route('/api/wallet/balance-cache')
+def get_balance_cache_metrics():
+    """Tasa de aciertos y llamadas RPC ahorradas por la caché de balances"""
+    if not balance_cache:
+        return jsonify({'error': 'Helius client not available'}), 500
+    return jsonify(balance_cache.get_metrics())
+
+@app.route('/api/helius/metrics')
+def get_helius_metrics():
+    """Latencia y reintentos por método del cliente Helius"""
+    if not helius_client:
+        return jsonify({'error': 'Helius client not available'}), 500
+    return jsonify(helius_client.get_metrics())
+
 @app.route('/api/user/profile/<wallet_address>')
 def get_user_profile(wallet_address):
     """Obtiene o crea el perfil de usuario para una wallet"""
     try:
-        db = SessionLocal()
-        profile = db.query(UserProfile).filter_by(wallet_address=wallet_address).first()
+        profile = profile_cache.get(wallet_address, load_profile)
         
         if not profile:
             # Crear nuevo perfil si no existe
-            profile = UserProfile(
+            db = SessionLocal()
+            new_profile = UserProfile(
                 wallet_address=wallet_address,
                 username=f"User_{wallet_address[:8]}",
                 chips=100,  # Fichas iniciales
                 total_games=0,
                 total_wins=0
             )
-            db.add(profile)
+            db.add(new_profile)
+            post_initial_grant(db, wallet_address)
             db.commit()
-            db.refresh(profile)
+            db.refresh(new_profile)
+            profile = profile_snapshot(new_profile)
+            db.close()
+            profile_cache.set(profile)
         
-        # Actualizar last_login
-        profile.last_login = datetime.utcnow()
-        db.commit()
+        # last_login se anota en memoria y se vuelca en lote
+        last_login = activity_tracker.touch(wallet_address)
         
         result = {
-            'wallet_address': profile.wallet_address,
-            'username': profile.username,
-            'game_tokens': profile.chips,
-            'total_games': profile.total_games,
-            'total_wins': profile.total_wins,
-            'created_at': profile.created_at.isoformat() if profile.created_at else None,
-            'last_login': profile.last_login.isoformat() if profile.last_login else None
+            'wallet_address': profile['wallet_address'],
+            'username': profile['username'],
+            'game_tokens': profile['chips'],
+            'total_games': profile['total_games'],
+            'total_wins': profile['total_wins'],
+            'created_at': profile['created_at'].isoformat() if profile['created_at'] else None,
+            'last_login': last_login.isoformat()
         }
         
-        db.close()
         return jsonify(result)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/ledger/balance/<path:account>')
+def get_ledger_balance(account):
+    """Saldo de una cuenta del libro mayor, opcionalmente histórico (?as_of_entry_id= o ?as_of=<epoch>)"""
+    try:
+        as_of_entry_id = request.args.get('as_of_entry_id', type=int)
+        as_of = request.args.get('as_of', type=float)
+        if as_of_entry_id is None and as_of is not None:
+            as_of_entry_id = chip_ledger.entry_id_at(as_of)
+        return jsonify(chip_ledger.balance(account, as_of_entry_id))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/ledger/audit')
+def get_ledger_audit():
+    """Verifica que los asientos cuadran y que los checkpoints son correctos"""
+    try:
+        return jsonify(chip_ledger.audit())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/user/profile-cache')
+def get_profile_cache_metrics():
+    """Tasa de aciertos de la caché de perfiles"""
+    return jsonify(profile_cache.get_metrics())
+
+@app.route('/api/history/count-cache')
+def get_history_count_metrics():
+    """Tasa de aciertos de la caché de totales de historial"""
+    return jsonify(history_counts.get_metrics())
+
+@app.route('/api/user/activity')
+def get_activity_metrics():
+    """Métricas del volcado en lote de last_login"""
+    return jsonify(activity_tracker.get_metrics())
+
 @app.route('/api/user/profile', methods=['POST'])
 def update_user_profile():
     """Actualiza el perfil de usuario"""
@@ -610,31 +939,63 @@ def update_user_profile():
         
         if not wallet_address:
             return jsonify({'error': 'wallet_address requerido'}), 400
+        if chips is not None and (isinstance(chips, bool) or not isinstance(chips, int) or chips < 0):
+            return jsonify({'error': 'chips debe ser un entero mayor o igual a 0'}), 400
             
         db = SessionLocal()
-        profile = db.query(UserProfile).filter_by(wallet_address=wallet_address).first()
+        returning = (UserProfile.wallet_address, UserProfile.username, UserProfile.chips,
+                     UserProfile.total_games, UserProfile.total_wins,
+                     UserProfile.created_at, UserProfile.last_login)
+        
+        # Fichas, username y last_login en un solo UPDATE ... RETURNING. Fijar
+        # fichas es un ajuste contra la casa: el UPDATE solo aplica si el saldo
+        # sigue siendo el leído, así la diferencia asentada en el libro mayor es
+        # exactamente la que cambió (si otra escritura se adelanta, se reintenta)
+        profile = None
+        for _ in range(PROFILE_UPDATE_ATTEMPTS):
+            values = {'last_login': datetime.utcnow()}
+            if username:
+                values['username'] = username
+            stmt = update(UserProfile).where(UserProfile.wallet_address == wallet_address)
+            delta = 0
+            if chips is not None:
+                current_chips = db.execute(
+                    select(UserProfile.chips).where(UserProfile.wallet_address == wallet_address)
+                ).scalar()
+                if current_chips is None:
+                    break
+                delta = chips - current_chips
+                stmt = stmt.where(UserProfile.chips == current_chips)
+                values['chips'] = chips
+            profile = db.execute(
+                stmt.values(**values).returning(*returning).execution_options(synchronize_session=False)
+            ).first()
+            if profile or chips is None:
+                break
+        else:
+            db.close()
+            return jsonify({'error': 'El saldo cambió mientras se actualizaba, reintenta'}), 409
+        
+        if profile and delta:
+            chip_ledger.post(db, [(HOUSE, -delta), (player_account(wallet_address), delta)], 'adjustment')
         
         if not profile:
             # Crear nuevo perfil si no existe
-            profile = UserProfile(
-                wallet_address=wallet_address,
-                username=username or f"User_{wallet_address[:8]}",
-                chips=100,  # Fichas iniciales
-                total_games=0,
-                total_wins=0
-            )
-            db.add(profile)
-        else:
-            # Actualizar username si se proporciona
-            if username:
-                profile.username = username
-            # Actualizar fichas si se proporciona
-            if chips is not None:
-                profile.chips = chips
-            profile.last_login = datetime.utcnow()
+            profile = db.execute(
+                insert(UserProfile).values(
+                    wallet_address=wallet_address,
+                    username=username or f"User_{wallet_address[:8]}",
+                    chips=100,  # Fichas iniciales
+                    total_games=0,
+                    total_wins=0,
+                    created_at=datetime.utcnow(),
+                    last_login=datetime.utcnow()
+                ).returning(*returning)
+            ).first()
+            post_initial_grant(db, wallet_address)
         
         db.commit()
-        db.refresh(profile)
+        profile_cache.invalidate(wallet_address)
         
         result = {
             'wallet_address': profile.wallet_address,
@@ -654,9 +1015,10 @@ def update_user_profile():
 
 @app.route('/api/wallet/transactions/<wallet_address>')
 def get_wallet_transactions(wallet_address):
-    """Obtiene las transacciones de una wallet"""
+    """Obtiene las transacciones de una wallet (paginadas con ?cursor=)"""
     try:
-        limit = request.args.get('limit', 20, type=int)
+        limit = page_size(request.args.get('limit', 20, type=int))
+        cursor = request.args.get('cursor')
         transaction_type = request.args.get('type', None)
         
         db = SessionLocal()
@@ -671,16 +1033,23 @@ def get_wallet_transactions(wallet_address):
             else:
                 query = query.filter_by(transaction_type=transaction_type)
         
-        transactions = query.order_by(UserTransaction.created_at.desc()).limit(limit).all()
+        try:
+            transactions, next_cursor, total_count = history_page(
+                query, wallet_address, f'transactions:{transaction_type or ""}', cursor, limit)
+        finally:
+            db.close()
         
         result = {
             'transactions': [tx.to_dict() for tx in transactions],
-            'total': len(transactions)
+            'total': len(transactions),
+            'total_count': total_count,
+            'next_cursor': next_cursor
         }
         
-        db.close()
         return jsonify(result)
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -734,28 +1103,24 @@ def process_deposit():
         tokens_per_sol = int(os.getenv('TOKENS_PER_SOL', 100000))
         chips_to_add = int(sol_amount * tokens_per_sol)
         
+        # Duplicado reciente: se rechaza sin consultar la base de datos
+        if signature_cache.is_duplicate(signature):
+            return jsonify({'error': 'Transacción ya procesada'}), 400
+        
         db = SessionLocal()
         
         # Verificar que no se haya procesado esta transacción antes
-        existing_tx = db.query(UserTransaction).filter_by(signature=signature).first()
-        if existing_tx:
-            db.close()
-            return jsonify({'error': 'Transacción ya procesada'}), 400
-        
-        # Obtener o crear perfil de usuario
-        profile = db.query(UserProfile).filter_by(wallet_address=wallet_address).first()
-        if not profile:
-            profile = UserProfile(
-                wallet_address=wallet_address,
-                username=f"User_{wallet_address[:8]}",
-                chips=100  # Fichas iniciales
-            )
-            db.add(profile)
-            db.flush()  # Para obtener el ID
+        if signature_cache.needs_db_check(signature):
+            existing_tx = db.query(UserTransaction).filter_by(signature=signature).first()
+            if existing_tx:
+                signature_cache.add(signature)
+                db.close()
+                return jsonify({'error': 'Transacción ya procesada'}), 400
         
-        # Agregar fichas al perfil
-        profile.chips += chips_to_add
-        profile.last_login = datetime.utcnow()
+        # Agregar fichas (crea el perfil si no existe) con un UPDATE atómico
+        new_chip_balance = credit_chips(db, wallet_address, chips_to_add)
+        chip_ledger.post(db, [(CUSTODIAL, -chips_to_add), (player_account(wallet_address), chips_to_add)],
+                         'deposit', reference=signature)
         
         # Crear registro de transacción
         transaction = UserTransaction(
@@ -768,14 +1133,27 @@ def process_deposit():
         )
         db.add(transaction)
         
-        db.commit()
+        db.execute(deposit_metrics.build_update(1, chips_to_add))
+        
+        try:
+            db.commit()
+        except IntegrityError:
+            # El índice único detectó un depósito procesado en paralelo
+            db.rollback()
+            db.close()
+            signature_cache.add(signature)
+            return jsonify({'error': 'Transacción ya procesada'}), 400
+        signature_cache.add(signature)
+        profile_cache.invalidate(wallet_address)
+        history_counts.invalidate(wallet_address)
+        deposit_metrics.record(1, chips_to_add)
         
         result = {
             'success': True,
             'wallet_address': wallet_address,
             'sol_deposited': sol_amount,
             'chips_added': chips_to_add,
-            'new_chip_balance': profile.chips,
+            'new_chip_balance': new_chip_balance,
             'transaction_signature': signature
         }
         
@@ -787,29 +1165,62 @@ def process_deposit():
 
 @app.route('/api/deposit/history/<wallet_address>')
 def get_deposit_history(wallet_address):
-    """Obtiene el historial de depósitos de un usuario"""
+    """Obtiene el historial de depósitos de un usuario (paginado con ?cursor=)"""
     try:
-        limit = request.args.get('limit', 10, type=int)
+        limit = page_size(request.args.get('limit', 10, type=int))
+        cursor = request.args.get('cursor')
         
         db = SessionLocal()
-        deposits = db.query(UserTransaction).filter_by(
+        query = db.query(UserTransaction).filter_by(
             wallet_address=wallet_address,
             transaction_type='deposit'
-        ).order_by(UserTransaction.created_at.desc()).limit(limit).all()
+        )
+        try:
+            deposits, next_cursor, total_count = history_page(query, wallet_address, 'deposit', cursor, limit)
+        finally:
+            db.close()
         
         result = {
             'deposits': [tx.to_dict() for tx in deposits],
-            'total': len(deposits)
+            'total': len(deposits),
+            'total_count': total_count,
+            'next_cursor': next_cursor
         }
         
-        db.close()
         return jsonify(result)
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # ================= FASE 4: WEBHOOKS AUTOMÁTICOS =================
 
+@app.route('/api/deposit/backfill', methods=['POST'])
+def run_deposit_backfill():
+    """Lanza en segundo plano el backfill de depósitos desde el último cursor"""
+    try:
+        if not deposit_backfill:
+            return jsonify({'error': 'Backfill no disponible'}), 500
+        if deposit_backfill.running:
+            return jsonify({'error': 'Backfill ya en ejecución'}), 409
+        
+        threading.Thread(target=deposit_backfill.run_once, daemon=True).start()
+        return jsonify({'success': True, 'message': 'Backfill iniciado'})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/deposit/backfill/status')
+def deposit_backfill_status():
+    """Estado y cursor del backfill de depósitos"""
+    try:
+        if not deposit_backfill:
+            return jsonify({'error': 'Backfill no disponible'}), 500
+        return jsonify(deposit_backfill.get_status())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/webhook/helius', methods=['POST'])
 def helius_webhook():
     """Endpoint para recibir webhooks automáticos de Helius"""
@@ -817,23 +1228,24 @@ def helius_webhook():
         # Obtener datos del webhook
         webhook_data = request.get_json()
         
-        # Log del webhook recibido
-        print(f"📨 Webhook recibido: {json.dumps(webhook_data, indent=2)}")
-        
         # Validar estructura del webhook
         if not webhook_data or 'type' not in webhook_data:
             return jsonify({'error': 'Webhook inválido'}), 400
         
-        # Procesar diferentes tipos de webhooks
         webhook_type = webhook_data.get('type')
-        
-        if webhook_type == 'enhanced':
-            return process_enhanced_webhook(webhook_data)
-        elif webhook_type == 'transaction':
-            return process_transaction_webhook(webhook_data)
-        else:
+        if webhook_type not in ('enhanced', 'transaction'):
             print(f"⚠️ Tipo de webhook no soportado: {webhook_type}")
             return jsonify({'message': 'Webhook type not supported'}), 200
+        
+        # Guardar el payload y responder de inmediato; los workers procesan los depósitos
+        queue_id = webhook_queue.enqueue(webhook_data)
+        print(f"📨 Webhook {webhook_type} encolado: #{queue_id}")
+        
+        return jsonify({
+            'success': True,
+            'queued': True,
+            'queue_id': queue_id
+        })
             
     except Exception as e:
         print(f"❌ Error procesando webhook: {e}")
@@ -845,10 +1257,8 @@ def process_enhanced_webhook(webhook_data):
         # Extraer información de la transacción
         transactions = webhook_data.get('transactions', [])
         
-        processed_count = 0
-        for tx_data in transactions:
-            if process_webhook_transaction(tx_data):
-                processed_count += 1
+        # Todos los depósitos del payload se acreditan en un solo lote
+        processed_count = process_webhook_transactions_batch(transactions)
         
         return jsonify({
             'success': True,
@@ -872,44 +1282,71 @@ def process_transaction_webhook(webhook_data):
         print(f"❌ Error procesando transaction webhook: {e}")
         return jsonify({'error': str(e)}), 500
 
+def extract_webhook_deposit(tx_data):
+    """Extrae (wallet, sol_amount, signature) si la transacción es un depósito a la custodial"""
+    # Extraer datos de la transacción
+    signature = tx_data.get('signature')
+    if not signature:
+        print("⚠️ Transacción sin signature")
+        return None
+    
+    # Verificar si es una transacción hacia nuestra dirección custodial
+    custodial_address = os.getenv('CUSTODIAL_ADDRESS')
+    if not custodial_address:
+        print("⚠️ CUSTODIAL_ADDRESS no configurada")
+        return None
+    
+    # Buscar transferencias SOL hacia la dirección custodial
+    native_transfers = tx_data.get('nativeTransfers', [])
+    
+    for transfer in native_transfers:
+        to_address = transfer.get('toUserAccount')
+        from_address = transfer.get('fromUserAccount')
+        amount_lamports = transfer.get('amount', 0)
+        
+        # Verificar si es un depósito hacia nuestra dirección
+        if to_address == custodial_address and amount_lamports > 0:
+            # Convertir lamports a SOL
+            sol_amount = amount_lamports / 1_000_000_000  # 1 SOL = 1B lamports
+            return from_address, sol_amount, signature
+    
+    return None
+
 def process_webhook_transaction(tx_data):
     """Procesa una transacción individual del webhook"""
     try:
-        # Extraer datos de la transacción
-        signature = tx_data.get('signature')
-        if not signature:
-            print("⚠️ Transacción sin signature")
+        deposit = extract_webhook_deposit(tx_data)
+        if not deposit:
             return False
         
-        # Verificar si es una transacción hacia nuestra dirección custodial
-        custodial_address = os.getenv('CUSTODIAL_ADDRESS')
-        if not custodial_address:
-            print("⚠️ CUSTODIAL_ADDRESS no configurada")
-            return False
-        
-        # Buscar transferencias SOL hacia la dirección custodial
-        native_transfers = tx_data.get('nativeTransfers', [])
-        
-        for transfer in native_transfers:
-            to_address = transfer.get('toUserAccount')
-            from_address = transfer.get('fromUserAccount')
-            amount_lamports = transfer.get('amount', 0)
-            
-            # Verificar si es un depósito hacia nuestra dirección
-            if to_address == custodial_address and amount_lamports > 0:
-                # Convertir lamports a SOL
-                sol_amount = amount_lamports / 1_000_000_000  # 1 SOL = 1B lamports
-                
-                # Procesar el depósito automáticamente
-                return auto_process_deposit(from_address, sol_amount, signature)
-        
-        return False
+        # Procesar el depósito automáticamente
+        return auto_process_deposit(*deposit)
         
     except Exception as e:
         print(f"❌ Error procesando transacción del webhook: {e}")
         return False
 
-def auto_process_deposit(wallet_address, sol_amount, signature):
+def process_webhook_transactions_batch(transactions, raise_errors=False):
+    """
+    Procesa todas las transacciones de un webhook con un único lote de depósitos.
+    Las transacciones mal formadas se descartan; con raise_errors los errores
+    de base de datos se propagan para que la cola reintente el payload.
+    """
+    deposits = []
+    for tx_data in transactions:
+        try:
+            deposit = extract_webhook_deposit(tx_data)
+        except Exception as e:
+            print(f"❌ Error procesando transacción del webhook: {e}")
+            continue
+        if deposit:
+            deposits.append(deposit)
+    
+    if not deposits:
+        return 0
+    return auto_process_deposits_batch(deposits, raise_errors=raise_errors)
+
+def auto_process_deposit(wallet_address, sol_amount, signature, raise_errors=False):
     """Procesa automáticamente un depósito detectado por webhook"""
     try:
         # Validar monto mínimo
@@ -921,29 +1358,26 @@ def auto_process_deposit(wallet_address, sol_amount, signature):
         tokens_per_sol = int(os.getenv('TOKENS_PER_SOL', 100000))
         chips_to_add = int(sol_amount * tokens_per_sol)
         
+        # Reintentos y replays recientes se rechazan sin leer la base de datos
+        if signature_cache.is_duplicate(signature):
+            print(f"⚠️ Transacción ya procesada: {signature}")
+            return False
+        
         db = SessionLocal()
         
         try:
             # Verificar que no se haya procesado antes
-            existing_tx = db.query(UserTransaction).filter_by(signature=signature).first()
-            if existing_tx:
-                print(f"⚠️ Transacción ya procesada: {signature}")
-                return False
-            
-            # Obtener o crear perfil de usuario
-            profile = db.query(UserProfile).filter_by(wallet_address=wallet_address).first()
-            if not profile:
-                profile = UserProfile(
-                    wallet_address=wallet_address,
-                    username=f"User_{wallet_address[:8]}",
-                    chips=100  # Fichas iniciales
-                )
-                db.add(profile)
-                db.flush()
+            if signature_cache.needs_db_check(signature):
+                existing_tx = db.query(UserTransaction).filter_by(signature=signature).first()
+                if existing_tx:
+                    signature_cache.add(signature)
+                    print(f"⚠️ Transacción ya procesada: {signature}")
+                    return False
             
-            # Agregar fichas
-            profile.chips += chips_to_add
-            profile.last_login = datetime.utcnow()
+            # Agregar fichas (crea el perfil si no existe) con un UPDATE atómico
+            credit_chips(db, wallet_address, chips_to_add)
+            chip_ledger.post(db, [(CUSTODIAL, -chips_to_add), (player_account(wallet_address), chips_to_add)],
+                             'deposit', reference=signature)
             
             # Crear registro de transacción
             transaction = UserTransaction(
@@ -956,7 +1390,19 @@ def auto_process_deposit(wallet_address, sol_amount, signature):
             )
             db.add(transaction)
             
-            db.commit()
+            db.execute(deposit_metrics.build_update(1, chips_to_add))
+            
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                signature_cache.add(signature)
+                print(f"⚠️ Transacción ya procesada: {signature}")
+                return False
+            signature_cache.add(signature)
+            profile_cache.invalidate(wallet_address)
+            history_counts.invalidate(wallet_address)
+            deposit_metrics.record(1, chips_to_add)
             
             print(f"✅ Depósito automático procesado: {wallet_address} +{chips_to_add} fichas")
             
@@ -970,8 +1416,107 @@ def auto_process_deposit(wallet_address, sol_amount, signature):
             
     except Exception as e:
         print(f"❌ Error procesando depósito automático: {e}")
+        if raise_errors:
+            raise
         return False
 
+def auto_process_deposits_batch(deposits, raise_errors=False):
+    """
+    Acredita un lote de depósitos [(wallet, sol_amount, signature), ...] con
+    una consulta de signatures, una de perfiles y un único commit.
+    Devuelve el número de depósitos acreditados.
+    """
+    try:
+        tokens_per_sol = int(os.getenv('TOKENS_PER_SOL', 100000))
+        
+        # Filtrar montos mínimos y signatures repetidas dentro del mismo payload
+        pending = {}
+        for wallet_address, sol_amount, signature in deposits:
+            if sol_amount < 0.001:
+                print(f"⚠️ Depósito muy pequeño: {sol_amount} SOL")
+                continue
+            if signature in pending or signature_cache.is_duplicate(signature):
+                continue
+            pending[signature] = (wallet_address, sol_amount, int(sol_amount * tokens_per_sol))
+        
+        if not pending:
+            return 0
+        
+        db = SessionLocal()
+        
+        try:
+            # Una sola consulta IN, solo para las signatures que el filtro no descarta
+            to_check = [signature for signature in pending if signature_cache.needs_db_check(signature)]
+            existing = set()
+            if to_check:
+                existing = {
+                    row.signature for row in db.query(UserTransaction.signature)
+                    .filter(UserTransaction.signature.in_(to_check))
+                }
+            for signature in existing:
+                print(f"⚠️ Transacción ya procesada: {signature}")
+                signature_cache.add(signature)
+                del pending[signature]
+            
+            if not pending:
+                return 0
+            
+            # Un UPDATE en lote con la suma por wallet, un INSERT de asientos y un commit
+            credits = {}
+            for wallet_address, _, chips_to_add in pending.values():
+                credits[wallet_address] = credits.get(wallet_address, 0) + chips_to_add
+            
+            try:
+                created = credit_chips_batch(db, credits)
+                journals = [([(HOUSE, -100), (player_account(wallet_address), 100)], 'grant', None)
+                            for wallet_address in created]
+                transactions = []
+                for signature, (wallet_address, sol_amount, chips_to_add) in pending.items():
+                    journals.append(([(CUSTODIAL, -chips_to_add), (player_account(wallet_address), chips_to_add)],
+                                     'deposit', signature))
+                    transactions.append(UserTransaction(
+                        wallet_address=wallet_address,
+                        transaction_type='deposit',
+                        amount=chips_to_add,
+                        signature=signature,
+                        status='success',
+                        description=f'Depósito automático: {sol_amount} SOL = {chips_to_add} fichas'
+                    ))
+                chip_ledger.post_many(db, journals)
+                db.add_all(transactions)
+                db.execute(deposit_metrics.build_update(len(pending), sum(credits.values())))
+                db.commit()
+            except IntegrityError:
+                # Otra vía acreditó alguna signature o creó algún perfil en paralelo: procesar uno a uno
+                db.rollback()
+                db.close()
+                return sum(
+                    1 for signature, (wallet_address, sol_amount, _) in pending.items()
+                    if auto_process_deposit(wallet_address, sol_amount, signature, raise_errors)
+                )
+            for signature in pending:
+                signature_cache.add(signature)
+            profile_cache.invalidate(*credits)
+            history_counts.invalidate(*credits)
+            deposit_metrics.record(len(pending), sum(credits.values()))
+            
+            print(f"✅ Lote de depósitos procesado: {len(pending)} depósitos")
+        
+        finally:
+            db.close()
+        
+        # Notificar fuera de la sesión para no retener la conexión
+        for wallet_address, sol_amount, chips_to_add in pending.values():
+            send_deposit_notification(wallet_address, sol_amount, chips_to_add)
+        
+        return len(pending)
+        
+    except Exception as e:
+        print(f"❌ Error procesando lote de depósitos: {e}")
+        if raise_errors:
+            raise
+        return 0
+
 def send_deposit_notification(wallet_address, sol_amount, chips_added):
     """Envía notificación en tiempo real al usuario sobre el depósito"""
     try:
@@ -985,14 +1530,40 @@ def send_deposit_notification(wallet_address, sol_amount, chips_added):
             'message': f'¡Depósito confirmado! +{chips_added} fichas'
         }
         
-        # Emitir notificación a todos los clientes (se puede optimizar para enviar solo al usuario específico)
-        socketio.emit('deposit_notification', notification_data, broadcast=True)
+        # Solo se envía a las sesiones de esa wallet (sala wallet:<address>)
+        if not wallet_sockets.is_online(wallet_address):
+            return
+        socketio.emit('deposit_notification', notification_data, room=wallet_room(wallet_address))
         
         print(f"📢 Notificación enviada: {wallet_address} +{chips_added} fichas")
         
     except Exception as e:
         print(f"❌ Error enviando notificación: {e}")
 
+def process_queued_transactions(transactions):
+    """
+    Handler de los workers de la cola de webhooks. Los errores de base de datos
+    (p. ej. "database is locked") llegan al worker, que reintenta el payload
+    hasta WEBHOOK_MAX_ATTEMPTS; reprocesar es seguro por la deduplicación.
+    """
+    return process_webhook_transactions_batch(transactions, raise_errors=True)
+
+# Cola durable de webhooks: el endpoint solo encola y los workers procesan
+webhook_queue = WebhookQueue(engine, process_queued_transactions)
+webhook_queue.start()
+
+def enqueue_backfill_transactions(transactions):
+    """Entrega las transacciones recuperadas al mismo pipeline que los webhooks"""
+    webhook_queue.enqueue({'type': 'enhanced', 'transactions': transactions})
+
+# Backfill de depósitos perdidos (p. ej. durante caídas del webhook)
+deposit_backfill = None
+if helius_client and CUSTODIAL_ADDRESS != 'YOUR_CUSTODIAL_SOL_ADDRESS':
+    deposit_backfill = DepositBackfill(helius_client, CUSTODIAL_ADDRESS, enqueue_backfill_transactions)
+    backfill_interval = int(os.getenv('DEPOSIT_BACKFILL_INTERVAL', 0))
+    if backfill_interval > 0:
+        deposit_backfill.start_background(backfill_interval)
+
 @app.route('/api/webhook/setup', methods=['POST'])
 def setup_webhook_endpoint():
     """Configura un webhook de Helius para monitoreo automático"""
@@ -1046,6 +1617,16 @@ def webhook_status():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/webhook/queue')
+def webhook_queue_metrics():
+    """Profundidad y retraso de la cola de ingesta de webhooks"""
+    try:
+        metrics = webhook_queue.get_metrics()
+        metrics['signature_cache'] = signature_cache.get_metrics()
+        return jsonify(metrics)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/webhook-admin')
 def webhook_admin():
     """Interfaz de administración de webhooks"""
@@ -1092,43 +1673,57 @@ def delete_webhook_api(webhook_id):
 
 @app.route('/api/webhook/metrics')
 def webhook_metrics():
-    """Obtiene métricas del sistema de webhooks"""
+    """Obtiene métricas del sistema de webhooks (contadores en memoria, sin consultas)"""
     try:
-        db = SessionLocal()
-        
-        # Contar depósitos de hoy
-        today = datetime.utcnow().date()
-        deposits_today = db.query(UserTransaction).filter(
-            UserTransaction.transaction_type == 'deposit',
-            UserTransaction.created_at >= today
-        ).count()
-        
-        # Total de transacciones procesadas
-        total_processed = db.query(UserTransaction).filter(
-            UserTransaction.transaction_type == 'deposit'
-        ).count()
-        
-        # Última actividad
-        last_transaction = db.query(UserTransaction).filter(
-            UserTransaction.transaction_type == 'deposit'
-        ).order_by(UserTransaction.created_at.desc()).first()
-        
-        last_activity = None
-        if last_transaction:
-            last_activity = last_transaction.created_at.isoformat()
-        
-        db.close()
-        
-        return jsonify({
-            'deposits_today': deposits_today,
-            'total_processed': total_processed,
-            'last_activity': last_activity,
-            'timestamp': datetime.utcnow().isoformat()
-        })
+        metrics = deposit_metrics.get_metrics()
+        metrics['timestamp'] = datetime.utcnow().isoformat()
+        return jsonify(metrics)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@socketio.on('authenticate_wallet')
+def on_authenticate_wallet(data):
+    """
+    Asocia la sesión a su wallet para recibir notificaciones dirigidas.
+    Hace falta probar la propiedad de la wallet: un token de una autenticación
+    anterior o la firma del desafío emitido con 'wallet_auth_challenge'. Sin
+    ninguno de los dos se emite el desafío a firmar.
+    """
+    data = data or {}
+    wallet_address = data.get('wallet_address')
+    if not wallet_address or len(wallet_address) < 32 or len(wallet_address) > 44:
+        socketio.emit('error', {'message': 'Dirección de wallet inválida'}, room=request.sid)
+        return
+    
+    token = data.get('token')
+    signature = data.get('signature')
+    if token and wallet_auth.verify_token(wallet_address, token):
+        pass
+    elif signature:
+        if not wallet_auth.verify(request.sid, wallet_address, signature):
+            socketio.emit('wallet_auth_failed', {'message': 'Firma de wallet inválida o caducada'}, room=request.sid)
+            return
+        token = wallet_auth.issue_token(wallet_address)
+    else:
+        socketio.emit('wallet_auth_challenge', {
+            'wallet_address': wallet_address,
+            'message': wallet_auth.issue(request.sid, wallet_address)
+        }, room=request.sid)
+        return
+    
+    previous = wallet_sockets.register(request.sid, wallet_address)
+    if previous:
+        leave_room(wallet_room(previous))
+    join_room(wallet_room(wallet_address))
+    socketio.emit('wallet_authenticated', {'wallet_address': wallet_address, 'token': token}, room=request.sid)
+
+@socketio.on('deauthenticate_wallet')
+def on_deauthenticate_wallet():
+    wallet_address = wallet_sockets.unregister(request.sid)
+    if wallet_address:
+        leave_room(wallet_room(wallet_address))
+
 @socketio.on('join_room')
 def on_join_room(data):
     room_id = data['room_id']
@@ -1226,6 +1821,8 @@ def handle_cancel_find():
 @socketio.on('disconnect')
 def handle_disconnect():
     print(f'Client {request.sid} disconnected')
+    wallet_sockets.unregister(request.sid)
+    wallet_auth.discard(request.sid)
     
     # Remover jugador de las colas de búsqueda
     for table_bet, queue in player_queue.items():
@@ -1251,6 +1848,66 @@ def handle_disconnect():
 # ENDPOINTS DE RETIROS
 # ============================================================
 
+def finalize_withdrawals(conn, results):
+    """
+    Refleja en user_transactions los retiros confirmados o fallidos por el worker.
+    Corre en la transacción del worker que marca el estado final, así que un
+    error deja el retiro pendiente de finalizar en lugar de perder el reembolso.
+    """
+    transactions = UserTransaction.__table__
+    refunded = []
+    for result in results:
+        withdrawal_tx = conn.execute(
+            select(transactions.c.id, transactions.c.wallet_address, transactions.c.amount)
+            .where(transactions.c.id == result['user_transaction_id'])
+            .where(transactions.c.status == 'pending')
+        ).first()
+        if not withdrawal_tx:
+            continue
+        if result['status'] == 'confirmed':
+            conn.execute(transactions.update().where(transactions.c.id == withdrawal_tx.id)
+                         .values(status='completed', signature=result['signature']))
+        else:
+            # La transacción no movió fondos: devolver las fichas descontadas
+            conn.execute(transactions.update().where(transactions.c.id == withdrawal_tx.id)
+                         .values(status='failed'))
+            apply_chip_delta(conn, withdrawal_tx.wallet_address, int(withdrawal_tx.amount))
+            chip_ledger.post(conn, [
+                (account, -amount) for account, amount in withdrawal_ledger_lines(
+                    withdrawal_tx.wallet_address, int(withdrawal_tx.amount), result['lamports'])
+            ], 'refund', reference=str(withdrawal_tx.id))
+            refunded.append(withdrawal_tx.wallet_address)
+    return lambda: profile_cache.invalidate(*refunded)
+
+# Retiros durables: la petición HTTP solo encola; el worker firma, envía y confirma
+# Blockhash y comisión de prioridad en memoria: firmar un lote no requiere RPC
+blockhash_cache = BlockhashCache(
+    helius_client,
+    fee_accounts=[CUSTODIAL_ADDRESS] if CUSTODIAL_ADDRESS != 'YOUR_CUSTODIAL_SOL_ADDRESS' else []
+) if helius_client else None
+if blockhash_cache:
+    blockhash_cache.start()
+
+# La firma de lotes de pago usa todos los núcleos
+signing_service = SigningService() if helius_client else None
+
+withdrawal_worker = WithdrawalWorker(engine, helius_client, on_final=finalize_withdrawals,
+                                     blockhash_cache=blockhash_cache, signing_service=signing_service)
+withdrawal_worker.start()
+
+def withdrawal_state_response(row, message):
+    """Respuesta de /api/withdraw/request a partir de una fila de withdrawal_queue"""
+    return jsonify({
+        'success': True,
+        'message': message,
+        'status': row.status,
+        'withdrawal_id': row.user_transaction_id,
+        'idempotency_key': row.idempotency_key,
+        'chip_amount': row.chip_amount,
+        'net_amount': row.lamports / 1_000_000_000,
+        'transaction_id': row.signature
+    })
+
 @app.route('/api/withdraw/request', methods=['POST'])
 @rate_limit(max_requests=5, window_seconds=600)  # Máximo 5 retiros cada 10 minutos
 @audit_log(action='withdrawal_request')
@@ -1269,32 +1926,35 @@ def request_withdrawal():
         
         wallet_address = data['wallet_address']
         destination_address = data['destination_address']
+        # Reintentos del cliente con la misma clave no generan un segundo retiro
+        idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key') or uuid.uuid4().hex
         
         try:
             chip_amount = int(data['chip_amount'])
         except (ValueError, TypeError):
             return jsonify({'error': 'chip_amount debe ser un número entero'}), 400
         
-        # Validar dirección de destino (básica validación de longitud)
-        if len(destination_address) < 32 or len(destination_address) > 44:
+        # Validar dirección de destino: una dirección inválida no llega a la cola
+        if not isinstance(destination_address, str) or not is_valid_destination(destination_address):
             return jsonify({'error': 'Dirección de destino inválida'}), 400
         
+        # Con Helius pero sin wallet custodial los retiros no pueden firmarse
+        if withdrawal_worker.unavailable_reason:
+            return jsonify({'error': f'Retiros no disponibles: {withdrawal_worker.unavailable_reason}'}), 503
+        
         # Validar monto mínimo (1000 fichas = 0.01 SOL)
         if chip_amount < 1000:
             return jsonify({'error': 'Monto mínimo de retiro: 1000 fichas (0.01 SOL)'}), 400
         
         db = SessionLocal()
         
-        # Obtener perfil de usuario
-        profile = db.query(UserProfile).filter_by(wallet_address=wallet_address).first()
-        if not profile:
+        existing = withdrawal_worker.get_by_idempotency_key(db, wallet_address, idempotency_key)
+        if existing:
             db.close()
-            return jsonify({'error': 'Usuario no encontrado'}), 404
-        
-        # Verificar saldo suficiente
-        if profile.chips < chip_amount:
+            return withdrawal_state_response(existing, 'Retiro ya registrado')
+        if withdrawal_worker.idempotency_key_taken(db, wallet_address, idempotency_key):
             db.close()
-            return jsonify({'error': f'Saldo insuficiente. Disponible: {profile.chips} fichas'}), 400
+            return jsonify({'error': 'Idempotency-Key ya usada por otra wallet'}), 409
         
         # Calcular SOL a enviar (1 SOL = 100,000 fichas)
         tokens_per_sol = int(os.getenv('TOKENS_PER_SOL', 100000))
@@ -1310,8 +1970,14 @@ def request_withdrawal():
             db.close()
             return jsonify({'error': 'Monto de retiro muy pequeño después de comisiones'}), 400
         
-        # Descontar fichas del perfil
-        profile.chips -= chip_amount
+        # Descontar fichas con un UPDATE condicional: nunca deja saldo negativo
+        new_chip_balance = apply_chip_delta(db, wallet_address, -chip_amount)
+        if new_chip_balance is None:
+            db.close()
+            profile = profile_cache.get(wallet_address, load_profile)
+            if profile is None:
+                return jsonify({'error': 'Usuario no encontrado'}), 404
+            return jsonify({'error': f'Saldo insuficiente. Disponible: {profile["chips"]} fichas'}), 400
         
         # Crear registro de transacción
         withdrawal_tx = UserTransaction(
@@ -1323,22 +1989,49 @@ def request_withdrawal():
             description=f'Retiro de {chip_amount} fichas = {net_sol_amount:.4f} SOL (fee: {fee_amount:.4f} SOL)'
         )
         db.add(withdrawal_tx)
+        db.flush()
+        
+        if not withdrawal_worker.enabled:
+            # Sin Helius (modo desarrollo) se simula el envío exitoso
+            withdrawal_tx.status = 'completed'
+        
+        # Fichas, libro mayor, historial y cola de retiros en una sola transacción
+        payout_lamports = round(net_sol_amount * 1_000_000_000)
+        chip_ledger.post(db, withdrawal_ledger_lines(wallet_address, chip_amount, payout_lamports),
+                         'withdraw', reference=str(withdrawal_tx.id))
+        db.execute(withdrawal_worker.build_insert(
+            idempotency_key, withdrawal_tx.id, wallet_address, destination_address,
+            payout_lamports, chip_amount,
+            status='queued' if withdrawal_worker.enabled else 'confirmed',
+            signature=None if withdrawal_worker.enabled else withdrawal_tx.signature
+        ))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Otra petición con la misma clave ganó la carrera
+            db.rollback()
+            existing = withdrawal_worker.get_by_idempotency_key(db, wallet_address, idempotency_key)
+            db.close()
+            if existing is None:
+                return jsonify({'error': 'Idempotency-Key ya usada por otra wallet'}), 409
+            return withdrawal_state_response(existing, 'Retiro ya registrado')
+        profile_cache.invalidate(wallet_address)
+        history_counts.invalidate(wallet_address)
         
-        # TODO: Implementar envío real de SOL usando Helius
-        # Por ahora simulamos el envío exitoso
-        withdrawal_tx.status = 'completed'
-        
-        # Guardar datos antes de hacer commit
-        new_chip_balance = profile.chips
+        # Guardar datos antes de cerrar la sesión
         transaction_signature = withdrawal_tx.signature
-        
-        # Hacer commit y cerrar sesión
-        db.commit()
+        withdrawal_id = withdrawal_tx.id
+        withdrawal_status = withdrawal_tx.status
         db.close()
         
+        withdrawal_worker.notify()
+        
         return jsonify({
             'success': True,
-            'message': 'Retiro procesado exitosamente',
+            'message': 'Retiro procesado exitosamente' if withdrawal_status == 'completed' else 'Retiro en proceso',
+            'status': withdrawal_status,
+            'withdrawal_id': withdrawal_id,
+            'idempotency_key': idempotency_key,
             'chip_amount': chip_amount,
             'sol_amount': sol_amount,
             'fee_amount': fee_amount,
@@ -1350,20 +2043,59 @@ def request_withdrawal():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/withdraw/status/<int:withdrawal_id>')
+def get_withdrawal_status(withdrawal_id):
+    """Estado de un retiro individual (queued, signed, submitted, confirmed, failed)"""
+    try:
+        row = withdrawal_worker.get_by_user_transaction(withdrawal_id)
+        if not row:
+            return jsonify({'error': 'Retiro no encontrado'}), 404
+        
+        return jsonify({
+            'withdrawal_id': withdrawal_id,
+            'state': row.status,
+            'signature': row.signature,
+            'destination': row.destination,
+            'lamports': row.lamports,
+            'attempts': row.attempts,
+            'error': row.error
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/withdraw/queue')
+def get_withdrawal_queue_metrics():
+    """Retiros por estado y métricas del worker"""
+    try:
+        metrics = withdrawal_worker.get_metrics()
+        metrics['blockhash_cache'] = blockhash_cache.get_metrics() if blockhash_cache else None
+        metrics['signing'] = signing_service.get_metrics() if signing_service else None
+        return jsonify(metrics)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/withdraw/history/<wallet_address>')
 def get_withdrawal_history(wallet_address):
-    """Retorna el historial de retiros de un usuario"""
+    """Retorna el historial de retiros de un usuario (paginado con ?cursor=)"""
     try:
         if not wallet_address:
             return jsonify({'error': 'Dirección de wallet requerida'}), 400
+        
+        limit = page_size(request.args.get('limit', 50, type=int))
+        cursor = request.args.get('cursor')
             
         db = SessionLocal()
         
         # Obtener historial de retiros
-        withdrawals = db.query(UserTransaction).filter_by(
+        query = db.query(UserTransaction).filter_by(
             wallet_address=wallet_address,
             transaction_type='withdraw'
-        ).order_by(UserTransaction.created_at.desc()).limit(50).all()
+        )
+        try:
+            withdrawals, next_cursor, total_count = history_page(query, wallet_address, 'withdraw', cursor, limit)
+        finally:
+            db.close()
         
         withdrawal_list = []
         for tx in withdrawals:
@@ -1376,13 +2108,15 @@ def get_withdrawal_history(wallet_address):
                 'type': 'withdraw'
             })
         
-        db.close()
-        
         return jsonify({
             'withdrawals': withdrawal_list,
-            'total_withdrawals': len(withdrawal_list)
+            'total_withdrawals': len(withdrawal_list),
+            'total_count': total_count,
+            'next_cursor': next_cursor
         })
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1419,7 +2153,17 @@ def get_audit_logs(wallet_address):
         if not security_manager:
             return jsonify({'error': 'Sistema de seguridad no disponible'}), 503
             
-        logs = security_manager.get_audit_logs(wallet_address, limit=50)
+        include_archive = request.args.get('include_archive', 'false').lower() == 'true'
+        since = request.args.get('since') or None
+        until = request.args.get('until') or None
+        for day in (since, until):
+            if day is not None:
+                try:
+                    datetime.strptime(day, '%Y-%m-%d')
+                except ValueError:
+                    return jsonify({'error': 'since/until deben tener formato YYYY-MM-DD'}), 400
+        logs = security_manager.get_audit_logs(wallet_address, limit=50, include_archive=include_archive,
+                                               since=since, until=until)
         return jsonify({'audit_logs': logs})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1439,28 +2183,65 @@ def get_suspicious_activities():
 
 # ================= ENDPOINTS DE ADMINISTRACIÓN =================
 
+USER_EXPORT_FIELDS = ('id', 'username', 'wallet_address', 'balance', 'total_games', 'total_wins',
+                      'created_at', 'last_login')
+USERS_PAGE_SIZE = 100
+USERS_MAX_PAGE_SIZE = 1000
+USERS_EXPORT_CHUNK = 1000
+
+def user_row_dict(user):
+    """Fila de user_profiles en el formato de /api/users"""
+    # Actividad aún no volcada a la base de datos
+    last_login = activity_tracker.pending(user.wallet_address) or user.last_login
+    return {
+        'id': user.id,
+        'username': user.username,
+        'wallet_address': user.wallet_address,
+        'balance': user.chips,
+        'total_games': user.total_games,
+        'total_wins': user.total_wins,
+        'created_at': user.created_at.isoformat() if user.created_at else None,
+        'last_login': last_login.isoformat() if last_login else None
+    }
+
+def _users_select():
+    return select(UserProfile.id, UserProfile.username, UserProfile.wallet_address, UserProfile.chips,
+                  UserProfile.total_games, UserProfile.total_wins, UserProfile.created_at,
+                  UserProfile.last_login).order_by(UserProfile.id)
+
 @app.route('/api/users')
 def get_all_users():
-    """Obtener lista de todos los usuarios registrados"""
+    """Página de usuarios registrados por id (?limit=, ?after_id= con el next_after_id anterior)"""
     try:
-        db_session = SessionLocal()
-        users = db_session.query(UserProfile).all()
+        include_sol = request.args.get('include_sol', 'false').lower() == 'true'
+        limit = max(1, min(request.args.get('limit', USERS_PAGE_SIZE, type=int), USERS_MAX_PAGE_SIZE))
+        after_id = request.args.get('after_id', 0, type=int)
+        
+        with engine.connect() as conn:
+            users = conn.execute(_users_select().where(UserProfile.id > after_id).limit(limit + 1)).fetchall()
+            # El total solo se calcula con la primera página
+            total_count = conn.execute(
+                select(func.count()).select_from(UserProfile.__table__)
+            ).scalar() if not after_id else None
+        
+        has_more = len(users) > limit
+        users = users[:limit]
+        
+        # Balances on-chain de la página en unas pocas llamadas RPC
+        sol_balances = warm_balance_cache([user.wallet_address for user in users]) if include_sol else {}
         
         users_data = []
         for user in users:
-            users_data.append({
-                'id': user.id,
-                'username': user.username,
-                'wallet_address': user.wallet_address,
-                'balance': user.chips,
-                'total_games': user.total_games,
-                'total_wins': user.total_wins,
-                'created_at': user.created_at.isoformat() if user.created_at else None,
-                'last_login': user.last_login.isoformat() if user.last_login else None
-            })
+            users_data.append(user_row_dict(user))
+            if include_sol:
+                users_data[-1]['sol_balance'] = sol_balances.get(user.wallet_address)
         
-        db_session.close()
-        return jsonify(users_data)
+        return jsonify({
+            'users': users_data,
+            'count': len(users_data),
+            'total_count': total_count,
+            'next_after_id': users[-1].id if has_more else None
+        })
         
     except Exception as e:
         return jsonify({
@@ -1468,6 +2249,55 @@ def get_all_users():
             'error': str(e)
         }), 500
 
+@app.route('/api/users/export')
+def export_users():
+    """
+    Exporta todos los usuarios en streaming (?format=ndjson|csv) desde un cursor
+    del servidor: memoria constante sea cual sea el número de usuarios
+    """
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'Formato no soportado (ndjson o csv)'}), 400
+    include_sol = request.args.get('include_sol', 'false').lower() == 'true'
+    fields = USER_EXPORT_FIELDS + (('sol_balance',) if include_sol else ())
+    
+    def iter_chunks():
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(_users_select())
+            while True:
+                rows = result.fetchmany(USERS_EXPORT_CHUNK)
+                if not rows:
+                    return
+                sol_balances = warm_balance_cache([row.wallet_address for row in rows]) if include_sol else {}
+                chunk = []
+                for row in rows:
+                    item = user_row_dict(row)
+                    if include_sol:
+                        item['sol_balance'] = sol_balances.get(row.wallet_address)
+                    chunk.append(item)
+                yield chunk
+    
+    def generate():
+        if export_format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=fields)
+            writer.writeheader()
+            for chunk in iter_chunks():
+                writer.writerows(chunk)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            for chunk in iter_chunks():
+                yield ''.join(json.dumps(item) + '\n' for item in chunk)
+    
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    filename = f"users.{'csv' if export_format == 'csv' else 'ndjson'}"
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
 
 if __name__ == '__main__':
-    socketio.run(app, debug=True)
+    # Los procesos del pool de firma (spawn) importan el script principal al
+    # arrancar; importar app.py volvería a levantar la aplicación en cada uno
+    raise SystemExit("Inicia el servidor con: python run.py")
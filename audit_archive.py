@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Almacenamiento particionado por día para los logs de auditoría
+La tabla audit_logs actúa como ventana "caliente" (últimos AUDIT_HOT_DAYS días).
+Los días más antiguos se mueven a archivos comprimidos por día
+(audit_archive/audit_YYYY-MM-DD.jsonl.gz) y se eliminan de la base de datos.
+"""
+
+import os
+import gzip
+import json
+import sqlite3
+import threading
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+AUDIT_DB_PATH = 'casino.db'
+AUDIT_COLUMNS = ('id', 'wallet_address', 'action', 'details', 'ip_address',
+                 'user_agent', 'risk_level', 'created_at')
+
+
+class AuditArchiver:
+    """Gestiona la retención de audit_logs y el archivo comprimido por día"""
+
+    def __init__(self, db_path=AUDIT_DB_PATH, archive_dir=None, hot_days=None):
+        self.db_path = db_path
+        self.archive_dir = archive_dir or os.getenv('AUDIT_ARCHIVE_DIR', 'audit_archive')
+        self.hot_days = hot_days if hot_days is not None else int(os.getenv('AUDIT_HOT_DAYS', 7))
+        self._lock = threading.Lock()
+        self.ensure_partition_index()
+
+    def ensure_partition_index(self):
+        """Crea el índice por fecha usado para seleccionar particiones diarias"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_audit_logs_created_at ON audit_logs (created_at)')
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"❌ Error creando índice de auditoría: {e}")
+
+    def partition_path(self, day):
+        """Ruta del archivo comprimido de un día (day: 'YYYY-MM-DD')"""
+        return os.path.join(self.archive_dir, f'audit_{day}.jsonl.gz')
+
+    def cold_partitions(self):
+        """Devuelve los días en la base de datos que quedan fuera de la ventana caliente"""
+        cutoff = (datetime.utcnow().date() - timedelta(days=self.hot_days)).isoformat()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute('''
+                SELECT DISTINCT DATE(created_at) FROM audit_logs
+                WHERE created_at < ?
+                ORDER BY 1
+            ''', (cutoff,)).fetchall()
+            return [row[0] for row in rows if row[0]]
+        finally:
+            conn.close()
+
+    def archive_partition(self, day):
+        """
+        Mueve un día completo de audit_logs a su archivo comprimido.
+        El archivo se reescribe en uno temporal que sustituye al anterior con
+        os.replace, y las filas con id ya archivado se omiten: si el proceso cae
+        entre el renombrado y el DELETE, la siguiente rotación no las duplica.
+        """
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = self.partition_path(day)
+        tmp_path = path + '.tmp'
+        start = day
+        end = (datetime.strptime(day, '%Y-%m-%d').date() + timedelta(days=1)).isoformat()
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.execute(f'''
+                SELECT {', '.join(AUDIT_COLUMNS)} FROM audit_logs
+                WHERE created_at >= ? AND created_at < ?
+                ORDER BY id
+            ''', (start, end))
+
+            archived = 0
+            last_archived_id = 0
+            last_read_id = None
+            with open(tmp_path, 'wb') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+                    # Copiar lo ya archivado de ese día y recordar su id más alto
+                    if os.path.exists(path):
+                        with gzip.open(path, 'rb') as previous:
+                            for line in previous:
+                                if not line.strip():
+                                    continue
+                                archive.write(line.rstrip(b'\n') + b'\n')
+                                last_archived_id = max(last_archived_id, json.loads(line)['id'])
+                    while True:
+                        rows = cursor.fetchmany(1000)
+                        if not rows:
+                            break
+                        for row in rows:
+                            last_read_id = row[0]
+                            if row[0] <= last_archived_id:
+                                continue
+                            line = json.dumps(dict(zip(AUDIT_COLUMNS, row)), ensure_ascii=False)
+                            archive.write(line.encode('utf-8') + b'\n')
+                            archived += 1
+                raw.flush()
+                os.fsync(raw.fileno())
+            os.replace(tmp_path, path)
+
+            # Solo se borra una vez que el archivo está en su sitio, y solo lo leído
+            if last_read_id is not None:
+                conn.execute('DELETE FROM audit_logs WHERE created_at >= ? AND created_at < ? AND id <= ?',
+                             (start, end, last_read_id))
+                conn.commit()
+            return archived
+        finally:
+            conn.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def rotate(self):
+        """Archiva todas las particiones fuera de la ventana caliente"""
+        with self._lock:
+            total = 0
+            try:
+                for day in self.cold_partitions():
+                    count = self.archive_partition(day)
+                    total += count
+                    logger.info(f"📦 Auditoría {day} archivada: {count} registros")
+            except Exception as e:
+                logger.error(f"❌ Error rotando logs de auditoría: {e}")
+            return total
+
+    def archived_days(self, since=None, until=None):
+        """Lista los días archivados (ordenados) dentro del rango opcional"""
+        if not os.path.isdir(self.archive_dir):
+            return []
+        days = []
+        for name in os.listdir(self.archive_dir):
+            if name.startswith('audit_') and name.endswith('.jsonl.gz'):
+                day = name[len('audit_'):-len('.jsonl.gz')]
+                if (since is None or day >= since) and (until is None or day <= until):
+                    days.append(day)
+        return sorted(days)
+
+    def scan_archive(self, wallet_address=None, action=None, since=None, until=None):
+        """Recorre los archivos comprimidos en streaming, registro a registro"""
+        for day in self.archived_days(since, until):
+            with gzip.open(self.partition_path(day), 'rt', encoding='utf-8') as archive:
+                for line in archive:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if wallet_address and entry.get('wallet_address') != wallet_address:
+                        continue
+                    if action and entry.get('action') != action:
+                        continue
+                    yield entry
+
+    def scan(self, wallet_address=None, action=None, since=None, until=None):
+        """Historial completo: archivos comprimidos y luego la tabla caliente"""
+        yield from self.scan_archive(wallet_address, action, since, until)
+
+        query = f'SELECT {", ".join(AUDIT_COLUMNS)} FROM audit_logs WHERE 1=1'
+        params = []
+        if wallet_address:
+            query += ' AND wallet_address = ?'
+            params.append(wallet_address)
+        if action:
+            query += ' AND action = ?'
+            params.append(action)
+        if since:
+            query += ' AND created_at >= ?'
+            params.append(since)
+        if until:
+            query += ' AND DATE(created_at) <= ?'
+            params.append(until)
+        query += ' ORDER BY id'
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(zip(AUDIT_COLUMNS, row))
+        finally:
+            conn.close()
+
+
+def start_audit_retention(archiver, interval_seconds=None):
+    """Lanza la rotación periódica en un hilo en segundo plano"""
+    interval = interval_seconds or int(os.getenv('AUDIT_ROTATION_INTERVAL', 3600))
+
+    def schedule(delay):
+        timer = threading.Timer(delay, run)
+        timer.daemon = True
+        timer.start()
+
+    def run():
+        archiver.rotate()
+        schedule(interval)
+
+    schedule(0)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caché TTL de balances SOL por wallet
+- Coalescencia single-flight: peticiones concurrentes para la misma wallet
+  comparten una sola llamada RPC.
+- Stale-while-revalidate: pasado el TTL se sirve el valor anterior mientras
+  un hilo en segundo plano lo refresca.
+- Si la llamada falla (p. ej. circuito abierto) se sirve el último valor
+  conocido aunque esté vencido.
+"""
+
+import os
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """Llamada RPC en curso que otros hilos pueden esperar"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class BalanceCache:
+    """Caché de balances con TTL, single-flight y servicio de datos obsoletos"""
+
+    def __init__(self, fetch, ttl=None, stale_ttl=None, max_entries=None):
+        """
+        fetch(wallet_address) realiza la llamada RPC real.
+        ttl: segundos en que el valor es fresco.
+        stale_ttl: segundos adicionales en que se sirve obsoleto mientras se refresca.
+        """
+        self.fetch = fetch
+        self.ttl = ttl if ttl is not None else float(os.getenv('BALANCE_CACHE_TTL', 15))
+        self.stale_ttl = stale_ttl if stale_ttl is not None else float(os.getenv('BALANCE_CACHE_STALE_TTL', 60))
+        self.max_entries = max_entries or int(os.getenv('BALANCE_CACHE_MAX_ENTRIES', 100_000))
+        self._lock = threading.Lock()
+        self._entries = {}  # {wallet: (balance, fetched_at)}
+        self._flights = {}  # {wallet: _Flight}
+
+        # Métricas
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.rpc_calls = 0
+        self.fallbacks = 0
+
+    def get(self, wallet_address):
+        """Devuelve el balance de la wallet usando la caché"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(wallet_address)
+            if entry:
+                balance, fetched_at = entry
+                age = now - fetched_at
+                if age < self.ttl:
+                    self.hits += 1
+                    return balance
+                if age < self.ttl + self.stale_ttl:
+                    self.stale_hits += 1
+                    if wallet_address not in self._flights:
+                        self._flights[wallet_address] = _Flight()
+                        threading.Thread(target=self._refresh, args=(wallet_address,), daemon=True).start()
+                    return balance
+
+            flight = self._flights.get(wallet_address)
+            if flight:
+                self.coalesced += 1
+                leader = False
+            else:
+                self.misses += 1
+                flight = self._flights[wallet_address] = _Flight()
+                leader = True
+
+        if leader:
+            self._refresh(wallet_address)
+        else:
+            flight.event.wait()
+        if flight.error:
+            # Respaldo: último valor conocido aunque esté vencido
+            if entry:
+                with self._lock:
+                    self.fallbacks += 1
+                return entry[0]
+            raise flight.error
+        return flight.value
+
+    def _refresh(self, wallet_address):
+        with self._lock:
+            flight = self._flights[wallet_address]
+            self.rpc_calls += 1
+        try:
+            flight.value = self.fetch(wallet_address)
+            self.set(wallet_address, flight.value)
+        except Exception as e:
+            logger.error(f"Error refrescando balance de {wallet_address}: {e}")
+            flight.error = e
+        finally:
+            with self._lock:
+                self._flights.pop(wallet_address, None)
+            flight.event.set()
+
+    def set(self, wallet_address, balance):
+        """Guarda un balance obtenido por otra vía (p. ej. consultas masivas)"""
+        with self._lock:
+            if len(self._entries) >= self.max_entries and wallet_address not in self._entries:
+                self._evict_expired()
+            self._entries[wallet_address] = (balance, time.monotonic())
+
+    def invalidate(self, wallet_address):
+        with self._lock:
+            self._entries.pop(wallet_address, None)
+
+    def _evict_expired(self):
+        """Elimina entradas vencidas; si no basta, la más antigua"""
+        now = time.monotonic()
+        limit = self.ttl + self.stale_ttl
+        expired = [w for w, (_, fetched_at) in self._entries.items() if now - fetched_at >= limit]
+        for wallet in expired:
+            del self._entries[wallet]
+        if len(self._entries) >= self.max_entries:
+            oldest = min(self._entries, key=lambda w: self._entries[w][1])
+            del self._entries[oldest]
+
+    def get_metrics(self):
+        with self._lock:
+            requests_total = self.hits + self.stale_hits + self.misses + self.coalesced
+            served_from_cache = self.hits + self.stale_hits + self.coalesced
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'rpc_calls': self.rpc_calls,
+                'fallbacks': self.fallbacks,
+                'hit_rate': round(served_from_cache / requests_total, 4) if requests_total else 0.0,
+                'rpc_saved': max(requests_total - self.rpc_calls, 0)
+            }
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caché en segundo plano de blockhash reciente y comisión de prioridad
+Un hilo refresca cada BLOCKHASH_REFRESH_INTERVAL segundos el blockhash (con su
+lastValidBlockHeight), la altura de bloque y una estimación de la comisión de
+prioridad, de modo que construir una transacción de pago no requiere ninguna
+llamada RPC.
+"""
+
+import os
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Duración aproximada de un slot de Solana
+SLOT_SECONDS = 0.4
+
+
+class BlockhashCache:
+    """Blockhash, altura de bloque y comisión de prioridad siempre a mano"""
+
+    def __init__(self, helius, fee_accounts=None, refresh_interval=None, safety_margin=None,
+                 fee_percentile=None, max_priority_fee=None):
+        """
+        fee_accounts: cuentas escribibles de los pagos (la custodial) para
+        estimar la comisión de prioridad local.
+        safety_margin: bloques antes de lastValidBlockHeight en que el blockhash
+        deja de usarse para firmar.
+        """
+        self.helius = helius
+        self.fee_accounts = fee_accounts or []
+        self.refresh_interval = refresh_interval or float(os.getenv('BLOCKHASH_REFRESH_INTERVAL', 5))
+        self.safety_margin = safety_margin if safety_margin is not None else int(os.getenv('BLOCKHASH_SAFETY_MARGIN', 30))
+        self.fee_percentile = fee_percentile if fee_percentile is not None else float(os.getenv('PRIORITY_FEE_PERCENTILE', 75))
+        self.max_priority_fee = max_priority_fee if max_priority_fee is not None else int(os.getenv('PRIORITY_FEE_MAX_MICROLAMPORTS', 1_000_000))
+
+        self._lock = threading.Lock()
+        self._blockhash = None
+        self._last_valid_block_height = 0
+        self._block_height = 0
+        self._observed_at = 0.0
+        self._priority_fee = 0
+        self._started = False
+
+        # Métricas
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.hits = 0
+        self.sync_refreshes = 0
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        threading.Thread(target=self._run, daemon=True, name='blockhash-cache').start()
+        print(f"🧱 Caché de blockhash iniciada (refresco cada {self.refresh_interval}s)")
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                with self._lock:
+                    self.refresh_errors += 1
+                logger.error(f"Error refrescando blockhash: {e}")
+            time.sleep(self.refresh_interval)
+
+    def refresh(self):
+        """Consulta blockhash, altura y comisiones recientes"""
+        blockhash, last_valid_block_height = self.helius.get_latest_blockhash()
+        block_height = self.helius.get_block_height()
+        try:
+            priority_fee = self._estimate_priority_fee(self.helius.get_recent_prioritization_fees(self.fee_accounts))
+        except Exception as e:
+            # Sin estimación nueva se conserva la anterior
+            logger.warning(f"No se pudo estimar la comisión de prioridad: {e}")
+            priority_fee = None
+
+        with self._lock:
+            self._blockhash = blockhash
+            self._last_valid_block_height = last_valid_block_height
+            self._block_height = max(self._block_height, block_height)
+            self._observed_at = time.monotonic()
+            if priority_fee is not None:
+                self._priority_fee = priority_fee
+            self.refreshes += 1
+
+    def _estimate_priority_fee(self, fees):
+        """Percentil de las comisiones de prioridad recientes (micro-lamports por CU)"""
+        values = sorted(int(fee.get('prioritizationFee', 0)) for fee in fees or [])
+        if not values:
+            return 0
+        index = min(len(values) - 1, int(len(values) * self.fee_percentile / 100))
+        return min(values[index], self.max_priority_fee)
+
+    def _estimated_height(self):
+        return self._block_height + int((time.monotonic() - self._observed_at) / SLOT_SECONDS)
+
+    def get(self):
+        """
+        Devuelve (blockhash, lastValidBlockHeight) sin RPC. Solo si el blockhash
+        está cerca de expirar (o aún no hay ninguno) se refresca en línea.
+        """
+        with self._lock:
+            if self._blockhash and self._estimated_height() + self.safety_margin < self._last_valid_block_height:
+                self.hits += 1
+                return self._blockhash, self._last_valid_block_height
+            self.sync_refreshes += 1
+        self.refresh()
+        with self._lock:
+            return self._blockhash, self._last_valid_block_height
+
+    def priority_fee(self):
+        """Comisión de prioridad estimada en micro-lamports por unidad de cómputo"""
+        with self._lock:
+            return self._priority_fee
+
+    def block_height(self):
+        """
+        Última altura de bloque observada. Nunca va por delante de la real, por lo
+        que es segura para decidir que un blockhash ya expiró.
+        """
+        with self._lock:
+            if self._observed_at:
+                return self._block_height
+        self.refresh()
+        with self._lock:
+            return self._block_height
+
+    def get_metrics(self):
+        with self._lock:
+            return {
+                'blockhash': self._blockhash,
+                'last_valid_block_height': self._last_valid_block_height,
+                'observed_block_height': self._block_height,
+                'estimated_block_height': self._estimated_height() if self._observed_at else 0,
+                'age_seconds': round(time.monotonic() - self._observed_at, 2) if self._observed_at else None,
+                'priority_fee_microlamports': self._priority_fee,
+                'refreshes': self.refreshes,
+                'refresh_errors': self.refresh_errors,
+                'hits': self.hits,
+                'sync_refreshes': self.sync_refreshes
+            }
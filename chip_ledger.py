@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Libro mayor de fichas en partida doble
+Cada movimiento de fichas es un asiento (journal) con varias líneas enteras
+cuya suma es cero, entre cuentas:
+
+    house             casa (fichas iniciales regaladas, comisiones, ajustes)
+    custodial         SOL en custodia convertido a fichas (depósitos/retiros)
+    player:<wallet>   saldo de cada jugador
+    pot:<room_id>     fichas en juego en una mesa
+
+Periódicamente se guarda un checkpoint del saldo de cada cuenta que cambió;
+el saldo histórico de una cuenta es el checkpoint más cercano más una cola
+acotada de líneas, y una auditoría completa es un recorrido lineal.
+"""
+
+import os
+import time
+import uuid
+import threading
+import logging
+
+from sqlalchemy import (Table, Column, Integer, BigInteger, Float, String, MetaData, Index,
+                        select, func, and_, text)
+
+logger = logging.getLogger(__name__)
+
+HOUSE = 'house'
+CUSTODIAL = 'custodial'
+
+metadata = MetaData()
+
+ledger_entries = Table(
+    'ledger_entries', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('journal_id', String(32), nullable=False, index=True),
+    Column('account', String(80), nullable=False),
+    Column('amount', BigInteger, nullable=False),  # fichas, positivo = entra en la cuenta
+    Column('entry_type', String(20), nullable=False),  # grant, deposit, withdraw, refund, game, adjustment, opening
+    Column('reference', String(100), nullable=True),  # signature u otro identificador externo
+    Column('created_at', Float, nullable=False),
+    Index('ix_ledger_entries_account_id', 'account', 'id'),
+)
+
+ledger_checkpoints = Table(
+    'ledger_checkpoints', metadata,
+    Column('account', String(80), primary_key=True),
+    Column('entry_id', Integer, primary_key=True),  # última línea incluida en el saldo
+    Column('balance', BigInteger, nullable=False),
+    Column('created_at', Float, nullable=False),
+)
+
+
+def player_account(wallet_address):
+    return f'player:{wallet_address}'
+
+
+def pot_account(room_id):
+    return f'pot:{room_id}'
+
+
+class ChipLedger:
+    """Asientos en partida doble y checkpoints de saldo"""
+
+    def __init__(self, engine, checkpoint_interval=None, chunk_size=None):
+        self.engine = engine
+        self.checkpoint_interval = checkpoint_interval or int(os.getenv('LEDGER_CHECKPOINT_INTERVAL', 300))
+        self.chunk_size = chunk_size or int(os.getenv('LEDGER_CHUNK_SIZE', 10_000))
+        self._checkpoint_lock = threading.Lock()
+        self.last_checkpoint = None
+
+        metadata.create_all(bind=engine)
+
+    # ----------------- Asientos -----------------
+
+    def post(self, conn, lines, entry_type, reference=None):
+        """
+        Registra un asiento [(cuenta, fichas), ...] en la transacción de conn
+        (Connection o Session), junto con la mutación de saldo que lo acompaña.
+        Las líneas deben ser enteras y sumar cero.
+        """
+        return self.post_many(conn, [(lines, entry_type, reference)])[0]
+
+    def post_many(self, conn, journals):
+        """
+        Registra varios asientos [(líneas, tipo, referencia), ...] con un único
+        INSERT. Devuelve sus journal_id (None para los asientos sin líneas).
+        """
+        now = time.time()
+        rows = []
+        journal_ids = []
+        for lines, entry_type, reference in journals:
+            lines = [(account, int(amount)) for account, amount in lines if int(amount) != 0]
+            if not lines:
+                journal_ids.append(None)
+                continue
+            if sum(amount for _, amount in lines) != 0:
+                raise ValueError(f"Asiento desbalanceado ({entry_type}): {lines}")
+            journal_id = uuid.uuid4().hex
+            journal_ids.append(journal_id)
+            rows.extend(
+                {'journal_id': journal_id, 'account': account, 'amount': amount,
+                 'entry_type': entry_type, 'reference': reference, 'created_at': now}
+                for account, amount in lines
+            )
+        if rows:
+            conn.execute(ledger_entries.insert(), rows)
+        return journal_ids
+
+    def is_empty(self):
+        with self.engine.connect() as conn:
+            return conn.execute(select(ledger_entries.c.id).limit(1)).first() is None
+
+    def open_balances(self, balances):
+        """
+        Asiento de apertura para saldos previos al libro mayor.
+        balances: iterable de (cuenta, saldo); la contrapartida es la casa.
+        """
+        opened = 0
+        chunk = []
+        for account, balance in balances:
+            if balance:
+                chunk.append((account, balance))
+            if len(chunk) >= self.chunk_size:
+                opened += self._open_chunk(chunk)
+                chunk = []
+        if chunk:
+            opened += self._open_chunk(chunk)
+        return opened
+
+    def _open_chunk(self, chunk):
+        lines = list(chunk) + [(HOUSE, -sum(balance for _, balance in chunk))]
+        with self.engine.begin() as conn:
+            self.post(conn, lines, 'opening')
+        return len(chunk)
+
+    # ----------------- Saldos -----------------
+
+    def _latest_checkpoint(self, conn, account, as_of_entry_id=None):
+        query = select(ledger_checkpoints.c.entry_id, ledger_checkpoints.c.balance) \
+            .where(ledger_checkpoints.c.account == account)
+        if as_of_entry_id is not None:
+            query = query.where(ledger_checkpoints.c.entry_id <= as_of_entry_id)
+        return conn.execute(query.order_by(ledger_checkpoints.c.entry_id.desc()).limit(1)).first()
+
+    def balance(self, account, as_of_entry_id=None):
+        """Saldo de la cuenta (opcionalmente hasta una línea dada): checkpoint + cola"""
+        with self.engine.connect() as conn:
+            checkpoint = self._latest_checkpoint(conn, account, as_of_entry_id)
+            base_id, base_balance = (checkpoint.entry_id, checkpoint.balance) if checkpoint else (0, 0)
+
+            tail = select(func.coalesce(func.sum(ledger_entries.c.amount), 0), func.count()) \
+                .where(ledger_entries.c.account == account) \
+                .where(ledger_entries.c.id > base_id)
+            if as_of_entry_id is not None:
+                tail = tail.where(ledger_entries.c.id <= as_of_entry_id)
+            tail_sum, tail_rows = conn.execute(tail).first()
+
+        return {
+            'account': account,
+            'balance': int(base_balance) + int(tail_sum),
+            'as_of_entry_id': as_of_entry_id,
+            'checkpoint_entry_id': base_id,
+            'tail_entries': tail_rows
+        }
+
+    def entry_id_at(self, timestamp):
+        """Última línea registrada antes de un instante (para saldos por fecha)"""
+        with self.engine.connect() as conn:
+            return conn.execute(select(func.max(ledger_entries.c.id))
+                                .where(ledger_entries.c.created_at <= timestamp)).scalar() or 0
+
+    # ----------------- Checkpoints -----------------
+
+    def checkpoint(self):
+        """
+        Guarda el saldo de cada cuenta con movimientos desde el último checkpoint.
+        Solo lee las líneas nuevas, agrupadas por cuenta.
+        """
+        with self._checkpoint_lock, self.engine.begin() as conn:
+            if not self._lock_entries(conn):
+                return 0
+            watermark = conn.execute(select(func.max(ledger_checkpoints.c.entry_id))).scalar() or 0
+            head = conn.execute(select(func.max(ledger_entries.c.id))).scalar() or 0
+            if head <= watermark:
+                return 0
+
+            changes = conn.execute(
+                select(ledger_entries.c.account, func.sum(ledger_entries.c.amount))
+                .where(ledger_entries.c.id > watermark)
+                .where(ledger_entries.c.id <= head)
+                .group_by(ledger_entries.c.account)
+            ).fetchall()
+
+            now = time.time()
+            written = 0
+            for start in range(0, len(changes), self.chunk_size):
+                chunk = changes[start:start + self.chunk_size]
+                previous = self._previous_balances(conn, [account for account, _ in chunk])
+                conn.execute(ledger_checkpoints.insert(), [
+                    {'account': account, 'entry_id': head,
+                     'balance': previous.get(account, 0) + int(delta), 'created_at': now}
+                    for account, delta in chunk
+                ])
+                written += len(chunk)
+
+        self.last_checkpoint = {'entry_id': head, 'accounts': written, 'at': now}
+        logger.info(f"Checkpoint del libro mayor en la línea {head}: {written} cuentas")
+        return written
+
+    def _lock_entries(self, conn):
+        """
+        Garantiza que ninguna línea con id <= MAX(id) se confirme después de
+        leerlo: una transacción abierta con un id menor quedaría fuera del
+        checkpoint y su saldo no volvería a contarse.
+        - PostgreSQL: LOCK TABLE en modo SHARE espera a las transacciones que
+          están insertando y bloquea nuevas inserciones hasta el commit.
+        - SQLite: un único escritor; los ids se confirman en orden.
+        En otros motores no se hacen checkpoints (los saldos siguen siendo
+        correctos, con una cola más larga).
+        """
+        dialect = conn.dialect.name
+        if dialect == 'postgresql':
+            conn.execute(text(f'LOCK TABLE {ledger_entries.name} IN SHARE MODE'))
+            return True
+        if dialect == 'sqlite':
+            return True
+        logger.warning(f"Checkpoints del libro mayor no soportados en {dialect}")
+        return False
+
+    def _previous_balances(self, conn, accounts):
+        latest = select(ledger_checkpoints.c.account, func.max(ledger_checkpoints.c.entry_id).label('entry_id')) \
+            .where(ledger_checkpoints.c.account.in_(accounts)) \
+            .group_by(ledger_checkpoints.c.account).subquery()
+        rows = conn.execute(
+            select(ledger_checkpoints.c.account, ledger_checkpoints.c.balance)
+            .join(latest, and_(ledger_checkpoints.c.account == latest.c.account,
+                               ledger_checkpoints.c.entry_id == latest.c.entry_id))
+        ).fetchall()
+        return {account: int(balance) for account, balance in rows}
+
+    def start_checkpoints(self):
+        """Lanza los checkpoints periódicos en un hilo en segundo plano"""
+        def schedule(delay):
+            timer = threading.Timer(delay, run)
+            timer.daemon = True
+            timer.start()
+
+        def run():
+            try:
+                self.checkpoint()
+            except Exception as e:
+                logger.error(f"Error creando checkpoint del libro mayor: {e}")
+            schedule(self.checkpoint_interval)
+
+        schedule(self.checkpoint_interval)
+
+    # ----------------- Auditoría -----------------
+
+    def iter_balances(self, prefix=None):
+        """Saldos actuales de todas las cuentas, en bloques y ordenados por cuenta"""
+        last_account = ''
+        while True:
+            with self.engine.connect() as conn:
+                query = select(ledger_entries.c.account, func.sum(ledger_entries.c.amount)) \
+                    .where(ledger_entries.c.account > last_account)
+                if prefix:
+                    query = query.where(ledger_entries.c.account.like(f'{prefix}%'))
+                rows = conn.execute(query.group_by(ledger_entries.c.account)
+                                    .order_by(ledger_entries.c.account)
+                                    .limit(self.chunk_size)).fetchall()
+            if not rows:
+                return
+            for account, balance in rows:
+                yield account, int(balance)
+            last_account = rows[-1][0]
+
+    def audit(self):
+        """
+        Verifica en un recorrido lineal que todos los asientos cuadran y que los
+        checkpoints coinciden con la suma de las líneas.
+        """
+        with self.engine.connect() as conn:
+            total = conn.execute(select(func.coalesce(func.sum(ledger_entries.c.amount), 0))).scalar()
+            unbalanced = conn.execute(
+                select(ledger_entries.c.journal_id, func.sum(ledger_entries.c.amount))
+                .group_by(ledger_entries.c.journal_id)
+                .having(func.sum(ledger_entries.c.amount) != 0)
+                .limit(100)
+            ).fetchall()
+            entries = conn.execute(select(func.count()).select_from(ledger_entries)).scalar()
+            watermark = conn.execute(select(func.max(ledger_checkpoints.c.entry_id))).scalar()
+
+            checkpoint_mismatches = []
+            if watermark:
+                actual = dict(conn.execute(
+                    select(ledger_entries.c.account, func.sum(ledger_entries.c.amount))
+                    .where(ledger_entries.c.id <= watermark)
+                    .group_by(ledger_entries.c.account)
+                ).fetchall())
+                accounts = list(actual)
+                for start in range(0, len(accounts), self.chunk_size):
+                    chunk = accounts[start:start + self.chunk_size]
+                    stored = self._previous_balances(conn, chunk)
+                    checkpoint_mismatches.extend(
+                        {'account': account, 'checkpoint': stored.get(account), 'entries': int(actual[account])}
+                        for account in chunk if stored.get(account) != int(actual[account])
+                    )
+                checkpoint_mismatches = checkpoint_mismatches[:100]
+
+        return {
+            'entries': entries,
+            'total': int(total),
+            'balanced': int(total) == 0 and not unbalanced,
+            'unbalanced_journals': [{'journal_id': j, 'sum': int(s)} for j, s in unbalanced],
+            'checkpoint_entry_id': watermark or 0,
+            'checkpoint_mismatches': checkpoint_mismatches,
+            'last_checkpoint': self.last_checkpoint
+        }
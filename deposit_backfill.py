@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Backfill incremental de depósitos con cursor persistido
+Recorre el historial de la dirección custodial hacia atrás con
+getSignaturesForAddress (before/until), descarga las transacciones enhanced
+en paralelo y las entrega al mismo pipeline que los webhooks. El cursor se
+guarda tras cada página, así que una ejecución interrumpida se reanuda donde
+quedó y las siguientes solo recorren lo nuevo desde la última completada.
+"""
+
+import os
+import json
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+PARSE_CHUNK_SIZE = 100  # Máximo de signatures por llamada a /v0/transactions
+
+
+class DepositBackfill:
+    """Worker reanudable que recupera depósitos perdidos durante caídas de webhooks"""
+
+    def __init__(self, helius, address, sink, cursor_path=None, page_size=1000,
+                 fetch_workers=None, max_pages=None):
+        """
+        sink(transactions) recibe una lista de transacciones enhanced de Helius,
+        con el mismo formato que el campo 'transactions' de un webhook.
+        """
+        self.helius = helius
+        self.address = address
+        self.sink = sink
+        self.cursor_path = cursor_path or os.getenv('DEPOSIT_BACKFILL_CURSOR', 'deposit_backfill_cursor.json')
+        self.page_size = page_size
+        self.fetch_workers = fetch_workers or int(os.getenv('DEPOSIT_BACKFILL_WORKERS', 4))
+        self.max_pages = max_pages
+        self._lock = threading.Lock()
+        self.running = False
+        self.last_run = {}
+
+    # ----------------- Cursor -----------------
+
+    def load_cursor(self):
+        """
+        until: signature más reciente de la última ejecución completa
+        before: punto de reanudación de la ejecución en curso
+        head: signature más reciente vista en la ejecución en curso
+        """
+        try:
+            with open(self.cursor_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {'until': None, 'before': None, 'head': None}
+
+    def save_cursor(self, cursor):
+        tmp_path = f'{self.cursor_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cursor, f, indent=2)
+        os.replace(tmp_path, self.cursor_path)
+
+    # ----------------- Ejecución -----------------
+
+    def _fetch_transactions(self, signatures):
+        """Descarga las transacciones enhanced en bloques de 100, en paralelo"""
+        chunks = [signatures[i:i + PARSE_CHUNK_SIZE] for i in range(0, len(signatures), PARSE_CHUNK_SIZE)]
+        with ThreadPoolExecutor(max_workers=self.fetch_workers) as pool:
+            results = pool.map(self.helius.get_parsed_transactions, chunks)
+            transactions = []
+            for chunk in results:
+                transactions.extend(chunk)
+        return transactions
+
+    def run_once(self):
+        """Procesa páginas hasta alcanzar el cursor 'until' (o max_pages)"""
+        if not self._lock.acquire(blocking=False):
+            return {'error': 'Backfill ya en ejecución'}
+        self.running = True
+        cursor = self.load_cursor()
+        pages = 0
+        signatures_seen = 0
+        transactions_sent = 0
+
+        try:
+            while self.max_pages is None or pages < self.max_pages:
+                page = self.helius.get_signatures_for_address(
+                    self.address,
+                    before=cursor.get('before'),
+                    until=cursor.get('until'),
+                    limit=self.page_size
+                )
+
+                if not page:
+                    # Ejecución completa: lo más reciente visto pasa a ser el nuevo límite
+                    if cursor.get('head'):
+                        cursor['until'] = cursor['head']
+                    cursor['before'] = None
+                    cursor['head'] = None
+                    self.save_cursor(cursor)
+                    break
+
+                if not cursor.get('head'):
+                    cursor['head'] = page[0]['signature']
+
+                signatures = [item['signature'] for item in page if item.get('err') is None]
+                transactions = self._fetch_transactions(signatures)
+                if transactions:
+                    self.sink(transactions)
+
+                # Solo se avanza el cursor cuando la página ya está en el pipeline
+                cursor['before'] = page[-1]['signature']
+                self.save_cursor(cursor)
+
+                pages += 1
+                signatures_seen += len(page)
+                transactions_sent += len(transactions)
+
+            logger.info(f"✅ Backfill de depósitos: {pages} páginas, {transactions_sent} transacciones")
+        except Exception as e:
+            logger.error(f"❌ Error en backfill de depósitos: {e}")
+            self.last_run = {'error': str(e)}
+            return self.last_run
+        finally:
+            self.running = False
+            self._lock.release()
+
+        self.last_run = {
+            'pages': pages,
+            'signatures_seen': signatures_seen,
+            'transactions_sent': transactions_sent,
+            'cursor': cursor
+        }
+        return self.last_run
+
+    def start_background(self, interval_seconds):
+        """Ejecuta run_once periódicamente en un hilo en segundo plano"""
+        def schedule(delay):
+            timer = threading.Timer(delay, run)
+            timer.daemon = True
+            timer.start()
+
+        def run():
+            self.run_once()
+            schedule(interval_seconds)
+
+        schedule(0)
+
+    def get_status(self):
+        return {
+            'running': self.running,
+            'cursor': self.load_cursor(),
+            'last_run': self.last_run
+        }
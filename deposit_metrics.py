@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Contadores materializados de depósitos
+El pipeline de depósitos suma cada depósito acreditado a contadores en memoria
+(total, hoy, fichas, última actividad y cubetas por minuto), de modo que
+/api/webhook/metrics responde sin consultar user_transactions.
+
+Los totales persistidos en la tabla deposit_metrics se actualizan con
+build_update() dentro de la misma transacción que acredita el depósito: o se
+guardan ambos o ninguno. Al arrancar se cargan de ahí; solo la primera vez (sin
+fila guardada) se cuentan los depósitos de user_transactions.
+"""
+
+import time
+import threading
+import logging
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import Table, Column, Integer, BigInteger, Float, MetaData, select, func, case
+
+logger = logging.getLogger(__name__)
+
+RATE_WINDOWS = (1, 5, 15, 60)  # Minutos de las tasas reportadas
+
+metadata = MetaData()
+
+deposit_metrics = Table(
+    'deposit_metrics', metadata,
+    Column('id', Integer, primary_key=True),  # fila única (id = 1)
+    Column('total_processed', BigInteger, nullable=False, default=0),
+    Column('total_chips', BigInteger, nullable=False, default=0),
+    Column('last_activity', Float, nullable=True),
+    Column('updated_at', Float, nullable=False),
+)
+
+
+class DepositMetrics:
+    """Contadores de depósitos en memoria, persistidos junto con cada depósito"""
+
+    def __init__(self, engine, transactions):
+        """transactions: tabla user_transactions (UserTransaction.__table__)"""
+        self.engine = engine
+        self.transactions = transactions
+        self._lock = threading.Lock()
+
+        self.total_processed = 0
+        self.total_chips = 0
+        self.today = datetime.utcnow().date()
+        self.deposits_today = 0
+        self.last_activity = None  # epoch
+        self.started_at = time.time()
+        self._minutes = deque(maxlen=max(RATE_WINDOWS))  # [[minuto, depósitos, fichas], ...]
+
+        metadata.create_all(bind=engine)
+
+    # ----------------- Carga inicial -----------------
+
+    def load(self):
+        """Carga los totales guardados; sin fila, los cuenta una vez y la crea"""
+        tx = self.transactions
+        is_deposit = tx.c.transaction_type == 'deposit'
+        with self.engine.begin() as conn:
+            saved = conn.execute(select(deposit_metrics).where(deposit_metrics.c.id == 1)).first()
+            if saved is None:
+                count, chips, last_created = conn.execute(
+                    select(func.count(), func.coalesce(func.sum(tx.c.amount), 0), func.max(tx.c.created_at))
+                    .where(is_deposit)
+                ).first()
+                last_activity = ((last_created - datetime(1970, 1, 1)).total_seconds()
+                                 if last_created is not None else None)
+                conn.execute(deposit_metrics.insert().values(
+                    id=1, total_processed=count, total_chips=int(chips),
+                    last_activity=last_activity, updated_at=time.time()
+                ))
+                saved = conn.execute(select(deposit_metrics).where(deposit_metrics.c.id == 1)).first()
+                logger.info(f"Métricas de depósitos inicializadas desde user_transactions: {count} depósitos")
+            # Los depósitos de hoy se cuentan una vez al arrancar
+            today_start = datetime.combine(self.today, datetime.min.time())
+            deposits_today = conn.execute(
+                select(func.count()).where(is_deposit).where(tx.c.created_at >= today_start)
+            ).scalar()
+
+        with self._lock:
+            self.total_processed = saved.total_processed
+            self.total_chips = saved.total_chips
+            self.deposits_today = deposits_today
+            self.last_activity = saved.last_activity
+        logger.info(f"Métricas de depósitos cargadas: {self.total_processed} depósitos")
+
+    # ----------------- Registro -----------------
+
+    def build_update(self, deposits, chips, when=None):
+        """
+        UPDATE que suma depósitos a los totales guardados. Ejecutarlo en la
+        transacción que acredita los depósitos, antes del commit.
+        """
+        when = when or time.time()
+        return (
+            deposit_metrics.update()
+            .where(deposit_metrics.c.id == 1)
+            .values(
+                total_processed=deposit_metrics.c.total_processed + deposits,
+                total_chips=deposit_metrics.c.total_chips + int(chips),
+                last_activity=case(
+                    (deposit_metrics.c.last_activity > when, deposit_metrics.c.last_activity),
+                    else_=when
+                ),
+                updated_at=when
+            )
+        )
+
+    def record(self, deposits=1, chips=0, when=None):
+        """Suma depósitos acreditados a los contadores en memoria (llamar después del commit)"""
+        if deposits <= 0:
+            return
+        when = when or time.time()
+        minute = int(when // 60)
+        day = datetime.utcfromtimestamp(when).date()
+        with self._lock:
+            self.total_processed += deposits
+            self.total_chips += int(chips)
+            if day != self.today:
+                self.today = day
+                self.deposits_today = 0
+            self.deposits_today += deposits
+            self.last_activity = max(self.last_activity or 0, when)
+            if self._minutes and self._minutes[-1][0] == minute:
+                self._minutes[-1][1] += deposits
+                self._minutes[-1][2] += int(chips)
+            else:
+                self._minutes.append([minute, deposits, int(chips)])
+
+    # ----------------- Lectura -----------------
+
+    def get_metrics(self):
+        """Instantánea O(1) de los contadores y tasas por minuto"""
+        now = time.time()
+        current_minute = int(now // 60)
+        uptime_minutes = max((now - self.started_at) / 60, 1 / 60)
+        with self._lock:
+            today = datetime.utcfromtimestamp(now).date()
+            deposits_today = self.deposits_today if today == self.today else 0
+            rates = {}
+            for window in RATE_WINDOWS:
+                deposits = sum(count for minute, count, _ in self._minutes if minute > current_minute - window)
+                rates[f'{window}m'] = round(deposits / min(window, uptime_minutes), 3)
+            return {
+                'deposits_today': deposits_today,
+                'total_processed': self.total_processed,
+                'total_chips': self.total_chips,
+                'last_activity': datetime.utcfromtimestamp(self.last_activity).isoformat() if self.last_activity else None,
+                'deposits_per_minute': rates
+            }
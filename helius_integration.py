@@ -1,7 +1,12 @@
 import os
 import json
+import base64
+import time
+import random
+import threading
 import requests
-from typing import Optional, Dict, List, Any
+from requests.adapters import HTTPAdapter
+from typing import Optional, Dict, List, Any, Iterator
 from dataclasses import dataclass
 from decimal import Decimal
 import logging
@@ -12,6 +17,10 @@ from solders.pubkey import Pubkey as PublicKey
 from solders.system_program import transfer, TransferParams
 from solana.rpc.types import TokenAccountOpts
 import base58
+from collections import OrderedDict
+from helius_resilience import HeliusGovernor
+from payout_builder import load_custodial_keypair, build_transfer_transaction
+from helius_parser import ParsedTransaction, parse_transaction, iter_parse_transactions
 # from solders.transaction import Transaction
 # from solders.pubkey import Pubkey as PublicKey
 # from solana.system_program import transfer, TransferParams
@@ -27,6 +36,43 @@ class WalletBalance:
     sol_balance: float
     wallet_address: str
 
+HELIUS_API_URL = "https://api.helius.xyz/v0"
+HELIUS_RPC_URL = "https://rpc.helius.xyz"
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class RequestStats:
+    """Latencia y reintentos acumulados por método de HeliusIntegration"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+    
+    def record(self, method: str, latency: float, retries: int, failed: bool):
+        with self._lock:
+            stats = self._stats.setdefault(method, {
+                'calls': 0, 'errors': 0, 'retries': 0,
+                'total_latency': 0.0, 'max_latency': 0.0
+            })
+            stats['calls'] += 1
+            stats['retries'] += retries
+            stats['total_latency'] += latency
+            stats['max_latency'] = max(stats['max_latency'], latency)
+            if failed:
+                stats['errors'] += 1
+    
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                method: {
+                    'calls': stats['calls'],
+                    'errors': stats['errors'],
+                    'retries': stats['retries'],
+                    'avg_latency_ms': round(stats['total_latency'] / stats['calls'] * 1000, 2),
+                    'max_latency_ms': round(stats['max_latency'] * 1000, 2)
+                }
+                for method, stats in self._stats.items()
+            }
+
 @dataclass
 class Transaction:
     """Estructura para transacciones"""
@@ -46,8 +92,10 @@ class HeliusIntegration:
             raise ValueError("Helius API key is required.")
         self.api_key = api_key
         self.network = network
-        self.base_url = f"https://api.helius.xyz/v0"
-        self.rpc_url = f"https://rpc.helius.xyz/?api-key={self.api_key}"
+        # HELIUS_API_URL / HELIUS_RPC_URL permiten apuntar a mock_helius_server.py
+        self.base_url = os.getenv('HELIUS_API_URL', HELIUS_API_URL)
+        self.rpc_base_url = os.getenv('HELIUS_RPC_URL', HELIUS_RPC_URL)
+        self.rpc_url = f"{self.rpc_base_url}/?api-key={self.api_key}"
         
 
         
@@ -59,61 +107,242 @@ class HeliusIntegration:
             "Authorization": f"Bearer {api_key}"
         }
         
+        # Sesión compartida con pool de conexiones keep-alive
+        pool_size = int(os.getenv('HELIUS_POOL_SIZE', 20))
+        self.timeout = (float(os.getenv('HELIUS_CONNECT_TIMEOUT', 3.05)),
+                        float(os.getenv('HELIUS_READ_TIMEOUT', 10)))
+        self.max_retries = int(os.getenv('HELIUS_MAX_RETRIES', 3))
+        self.backoff_base = float(os.getenv('HELIUS_BACKOFF_BASE', 0.25))
+        self.backoff_max = float(os.getenv('HELIUS_BACKOFF_MAX', 8))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.stats = RequestStats()
+        
+        # Cuota del plan y circuit breakers por clase de endpoint (RPC / REST)
+        self.governor = HeliusGovernor()
+        # Últimas respuestas válidas, usadas como respaldo si Helius falla
+        self._history_fallback = OrderedDict()
+        self._lock = threading.Lock()  # protege _history_fallback entre hilos
+        self._history_fallback_size = int(os.getenv('HELIUS_FALLBACK_CACHE_SIZE', 1000))
+        # Keypair custodial, cargado en el primer envío
+        self._custodial_keypair = None
+        
         logger.info(f"HeliusIntegration inicializada para {network} (modo desarrollo)")
     
+    def _backoff_delay(self, attempt: int, response=None) -> float:
+        """Backoff exponencial con jitter completo; respeta Retry-After si viene"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+    
+    def _endpoint_class(self, url: str) -> str:
+        """
+        Clase de endpoint ('rpc' o 'rest') de una URL. La base REST se compara
+        primero: con el mock local (HELIUS_RPC_URL=http://host:puerto y
+        HELIUS_API_URL=http://host:puerto/v0) toda URL REST empieza también por
+        la base RPC.
+        """
+        if url.startswith(self.base_url):
+            return 'rest'
+        if url.startswith(self.rpc_base_url):
+            return 'rpc'
+        return 'rest'
+    
+    def _request(self, method_name: str, http_method: str, url: str,
+                 retry: bool = True, endpoint_class: Optional[str] = None, **kwargs) -> requests.Response:
+        """
+        Realiza una petición con la sesión compartida, timeout y reintentos
+        en 429/5xx/errores de conexión. Registra latencia y reintentos por método.
+        endpoint_class ('rpc' o 'rest') elige cuota y circuit breaker; si no se
+        indica se deduce de la URL.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        max_retries = self.max_retries if retry else 0
+        endpoint_class = endpoint_class or self._endpoint_class(url)
+        breaker = self.governor.breakers[endpoint_class]
+        start = time.monotonic()
+        retries = 0
+        failed = True
+        
+        try:
+            while True:
+                # Falla rápido (HeliusUnavailableError) si no hay cuota o el circuito está abierto
+                self.governor.before_request(endpoint_class)
+                try:
+                    response = self.session.request(http_method, url, **kwargs)
+                except (requests.ConnectionError, requests.Timeout):
+                    breaker.record_failure()
+                    if retries >= max_retries:
+                        raise
+                    time.sleep(self._backoff_delay(retries))
+                    retries += 1
+                    continue
+                
+                if response.status_code in RETRY_STATUS_CODES:
+                    breaker.record_failure()
+                    if retries < max_retries:
+                        time.sleep(self._backoff_delay(retries, response))
+                        retries += 1
+                        continue
+                else:
+                    breaker.record_success()
+                
+                failed = response.status_code >= 400
+                return response
+        finally:
+            self.stats.record(method_name, time.monotonic() - start, retries, failed)
+    
+    def get_metrics(self) -> Dict:
+        """Latencia y reintentos por método, cuota y estado de los circuitos"""
+        metrics = self.governor.snapshot()
+        metrics['methods'] = self.stats.snapshot()
+        return metrics
+    
+    def _rpc_call(self, method_name: str, method: str, params: list):
+        """Llamada JSON-RPC simple; lanza excepción si la respuesta trae error"""
+        payload = {
+            "jsonrpc": "2.0",
+            "id": 1,
+            "method": method,
+            "params": params
+        }
+        response = self._request(method_name, 'POST', self.rpc_url, json=payload, headers=self.headers)
+        response.raise_for_status()
+        data = response.json()
+        if "error" in data:
+            raise RuntimeError(f"{method}: {data['error']}")
+        return data.get("result")
+    
+    def get_latest_blockhash(self) -> tuple:
+        """Devuelve (blockhash, lastValidBlockHeight) reciente"""
+        result = self._rpc_call('get_latest_blockhash', 'getLatestBlockhash', [{"commitment": "confirmed"}])
+        value = result["value"]
+        return value["blockhash"], value["lastValidBlockHeight"]
+    
+    def get_block_height(self) -> int:
+        """Altura de bloque actual (para detectar blockhash expirados)"""
+        return self._rpc_call('get_block_height', 'getBlockHeight', [{"commitment": "confirmed"}])
+    
+    def get_signature_statuses(self, signatures: List[str]) -> List[Optional[Dict]]:
+        """Estados de hasta 256 firmas en una sola llamada; None si la firma no se conoce"""
+        result = self._rpc_call('get_signature_statuses', 'getSignatureStatuses',
+                                [signatures, {"searchTransactionHistory": True}])
+        return result["value"]
+    
+    def get_recent_prioritization_fees(self, accounts: Optional[List[str]] = None) -> List[Dict]:
+        """Comisiones de prioridad de los últimos slots para las cuentas dadas"""
+        return self._rpc_call('get_recent_prioritization_fees', 'getRecentPrioritizationFees', [accounts or []]) or []
+    
+    def send_raw_transaction(self, raw_transaction: bytes) -> str:
+        """
+        Envía una transacción ya firmada. Reenviar los mismos bytes es idempotente
+        (misma firma), por lo que los reintentos son seguros.
+        """
+        encoded = base64.b64encode(raw_transaction).decode('ascii')
+        return self._rpc_call('send_raw_transaction', 'sendTransaction',
+                              [encoded, {"encoding": "base64", "preflightCommitment": "confirmed"}])
+    
+    def _get_custodial_keypair(self):
+        if self._custodial_keypair is None:
+            self._custodial_keypair = load_custodial_keypair()
+        return self._custodial_keypair
+    
+    def send_sol_batch(self, transfers: List[tuple], recent_blockhash: Optional[str] = None,
+                       compute_unit_price: Optional[int] = None) -> str:
+        """
+        Envía varias transferencias [(destino, lamports), ...] desde la cuenta
+        custodial en una sola transacción y devuelve su firma.
+        Si se pasa recent_blockhash (p. ej. de BlockhashCache) no se consulta.
+        """
+        if recent_blockhash is None:
+            recent_blockhash, _ = self.get_latest_blockhash()
+        signature, raw_transaction = build_transfer_transaction(self._get_custodial_keypair(), transfers,
+                                                                recent_blockhash, compute_unit_price)
+        self.send_raw_transaction(raw_transaction)
+        logger.info(f"Transacción enviada con {len(transfers)} transferencias: {signature}")
+        return signature
+    
     def send_sol(self, destination: str, lamports: int) -> str:
         """Envía SOL desde la cuenta custodial al destino y devuelve la firma de la transacción"""
-        # Temporalmente deshabilitado para evitar problemas con Client
-        logger.warning("send_sol temporalmente deshabilitado")
-        return "mock_transaction_signature"
-        # try:
-        #     # Configurar la transacción real
-        #     custodial_wallet = Keypair.from_seed(os.getenv('CUSTODIAL_WALLET_SEED'))
-        #     recent_blockhash = self.client.get_latest_blockhash().value.blockhash
-        #     
-        #     # Crear instrucción de transferencia
-        #     transfer_ix = transfer(TransferParams(
-        #         from_pubkey=custodial_wallet.pubkey(),
-        #         to_pubkey=PublicKey.from_string(destination),
-        #         lamports=lamports
-        #     ))
-        #     
-        #     # Construir y firmar transacción
-        #     txn = Transaction().add(transfer_ix)
-        #     txn.recent_blockhash = recent_blockhash
-        #     txn.sign(custodial_wallet)
-        #     
-        #     # Enviar transacción
-        #     txn_sig = self.client.send_transaction(txn).value
-        #     logger.info(f"Transacción enviada: {txn_sig}")
-        #     return str(txn_sig)
-        # except Exception as e:
-        #     logger.error(f"Error enviando SOL: {e}")
-        #     raise
-    
-    def get_sol_balance(self, wallet_address: str) -> float:
-        """Obtiene el balance real de SOL de una wallet"""
+        return self.send_sol_batch([(destination, lamports)])
+    
+    def get_sol_balance(self, wallet_address: str, raise_errors: bool = False) -> float:
+        """
+        Obtiene el balance real de SOL de una wallet.
+        Con raise_errors=True propaga los errores en lugar de devolver 0.0,
+        para que las cachés puedan servir el último valor conocido.
+        """
         try:
-            # Usar requests HTTP en lugar del Client para evitar problemas
+            # getBalance devuelve solo los lamports, sin los datos de la cuenta
             payload = {
                 "jsonrpc": "2.0",
                 "id": 1,
-                "method": "getAccountInfo",
+                "method": "getBalance",
                 "params": [wallet_address]
             }
             
-            response = requests.post(self.rpc_url, json=payload, headers=self.headers)
+            response = self._request('get_sol_balance', 'POST', self.rpc_url, json=payload, headers=self.headers)
             response.raise_for_status()
             
             data = response.json()
-            if not data.get('result') or not data['result'].get('value'):
+            if not data.get('result') or data['result'].get('value') is None:
                 return 0.0
-            return data['result']['value']['lamports'] / 1_000_000_000
+            return data['result']['value'] / 1_000_000_000
         except Exception as e:
             logger.error(f"Error obteniendo balance SOL para {wallet_address}: {e}")
+            if raise_errors:
+                raise
             return 0.0
     
-
+    def get_sol_balances(self, wallet_addresses: List[str]) -> Dict[str, float]:
+        """
+        Obtiene el balance SOL de muchas wallets con pocas llamadas HTTP.
+        Agrupa las wallets en getMultipleAccounts de hasta HELIUS_MULTIPLE_ACCOUNTS_LIMIT
+        direcciones (sin datos de cuenta, dataSlice vacío) y empaqueta esas
+        llamadas en batches JSON-RPC de hasta HELIUS_RPC_BATCH_SIZE peticiones.
+        Las wallets sin cuenta on-chain devuelven 0.0; las que fallan no se incluyen.
+        """
+        accounts_limit = int(os.getenv('HELIUS_MULTIPLE_ACCOUNTS_LIMIT', 100))
+        batch_size = int(os.getenv('HELIUS_RPC_BATCH_SIZE', 10))
+        
+        wallets = list(dict.fromkeys(wallet_addresses))
+        chunks = [wallets[i:i + accounts_limit] for i in range(0, len(wallets), accounts_limit)]
+        balances = {}
+        
+        for batch_start in range(0, len(chunks), batch_size):
+            batch = chunks[batch_start:batch_start + batch_size]
+            payload = [
+                {
+                    "jsonrpc": "2.0",
+                    "id": index,
+                    "method": "getMultipleAccounts",
+                    "params": [chunk, {"encoding": "base64", "dataSlice": {"offset": 0, "length": 0}}]
+                }
+                for index, chunk in enumerate(batch)
+            ]
+            
+            try:
+                response = self._request('get_sol_balances', 'POST', self.rpc_url, json=payload, headers=self.headers)
+                response.raise_for_status()
+                results = response.json()
+            except Exception as e:
+                logger.error(f"Error obteniendo balances SOL en lote: {e}")
+                continue
+            
+            for item in results:
+                index = item.get('id')
+                if item.get('error') or not isinstance(index, int) or index >= len(batch):
+                    logger.error(f"Error en getMultipleAccounts: {item.get('error')}")
+                    continue
+                accounts = (item.get('result') or {}).get('value') or []
+                for wallet_address, account in zip(batch[index], accounts):
+                    balances[wallet_address] = account['lamports'] / 1_000_000_000 if account else 0.0
+        
+        return balances
     
     def get_wallet_balance(self, wallet_address: str) -> WalletBalance:
         """Obtiene el balance completo de una wallet"""
@@ -128,13 +357,13 @@ class HeliusIntegration:
         """Obtiene el historial de transacciones de una wallet usando Helius API"""
         try:
             # Usar la API de Helius para obtener transacciones
-            url = f"https://api.helius.xyz/v0/addresses/{wallet_address}/transactions"
+            url = f"{self.base_url}/addresses/{wallet_address}/transactions"
             params = {
                 "api-key": self.api_key,
                 "limit": limit
             }
             
-            response = requests.get(url, params=params, headers=self.headers)
+            response = self._request('get_transaction_history', 'GET', url, params=params, headers=self.headers)
             response.raise_for_status()
             
             transactions_data = response.json()
@@ -142,79 +371,83 @@ class HeliusIntegration:
             
             for tx_data in transactions_data:
                 # Procesar cada transacción
-                tx = Transaction(
-                    signature=tx_data.get("signature", ""),
-                    transaction_type=self._determine_transaction_type(tx_data),
-                    amount=self._extract_amount(tx_data, wallet_address),
-                    timestamp=tx_data.get("timestamp", 0),
-                    status="success" if tx_data.get("err") is None else "failed",
-                    from_address=self._extract_from_address(tx_data),
-                    to_address=self._extract_to_address(tx_data)
-                )
-                transactions.append(tx)
+                transactions.append(self._build_transaction(tx_data, wallet_address))
             
+            with self._lock:
+                self._history_fallback[(wallet_address, limit)] = transactions
+                self._history_fallback.move_to_end((wallet_address, limit))
+                if len(self._history_fallback) > self._history_fallback_size:
+                    self._history_fallback.popitem(last=False)
             return transactions
             
         except Exception as e:
             logger.error(f"Error obteniendo historial de transacciones para {wallet_address}: {e}")
-            return []
+            # Respaldo: último historial obtenido para esta wallet
+            with self._lock:
+                return self._history_fallback.get((wallet_address, limit), [])
     
-    def _determine_transaction_type(self, tx_data: Dict) -> str:
-        """Determina el tipo de transacción basado en los datos"""
-        # Lógica simplificada para determinar el tipo
-        if "tokenTransfers" in tx_data and tx_data["tokenTransfers"]:
-            return "Token Transfer"
-        elif "nativeTransfers" in tx_data and tx_data["nativeTransfers"]:
-            return "SOL Transfer"
-        else:
-            return "Other"
+    def get_signatures_for_address(self, wallet_address: str, before: Optional[str] = None,
+                                   until: Optional[str] = None, limit: int = 1000) -> List[Dict]:
+        """Obtiene una página de signatures (más recientes primero) vía getSignaturesForAddress"""
+        options = {"limit": limit}
+        if before:
+            options["before"] = before
+        if until:
+            options["until"] = until
+        payload = {
+            "jsonrpc": "2.0",
+            "id": 1,
+            "method": "getSignaturesForAddress",
+            "params": [wallet_address, options]
+        }
+        
+        response = self._request('get_signatures_for_address', 'POST', self.rpc_url,
+                                 json=payload, headers=self.headers)
+        response.raise_for_status()
+        
+        data = response.json()
+        if "error" in data:
+            raise RuntimeError(f"getSignaturesForAddress: {data['error']}")
+        return data.get("result") or []
     
-    def _extract_amount(self, tx_data: Dict, wallet_address: str) -> float:
-        """Extrae la cantidad de la transacción"""
-        try:
-            # Buscar en transferencias nativas (SOL)
-            if "nativeTransfers" in tx_data:
-                for transfer in tx_data["nativeTransfers"]:
-                    if transfer["fromUserAccount"] == wallet_address:
-                        return -float(transfer["amount"]) / 1_000_000_000  # Negativo para salidas
-                    elif transfer["toUserAccount"] == wallet_address:
-                        return float(transfer["amount"]) / 1_000_000_000   # Positivo para entradas
-            
-            # Buscar en transferencias de tokens
-            if "tokenTransfers" in tx_data:
-                for transfer in tx_data["tokenTransfers"]:
-                    if transfer["fromUserAccount"] == wallet_address:
-                        return -float(transfer["tokenAmount"])  # Negativo para salidas
-                    elif transfer["toUserAccount"] == wallet_address:
-                        return float(transfer["tokenAmount"])   # Positivo para entradas
-            
-            return 0.0
-            
-        except Exception as e:
-            logger.error(f"Error extrayendo cantidad de transacción: {e}")
-            return 0.0
+    def get_parsed_transactions(self, signatures: List[str]) -> List[Dict]:
+        """Obtiene transacciones enhanced de Helius para hasta 100 signatures"""
+        if not signatures:
+            return []
+        url = f"{self.base_url}/transactions"
+        
+        response = self._request('get_parsed_transactions', 'POST', url, params={"api-key": self.api_key},
+                                 json={"transactions": signatures}, headers=self.headers)
+        response.raise_for_status()
+        return response.json() or []
     
-    def _extract_from_address(self, tx_data: Dict) -> str:
-        """Extrae la dirección de origen de la transacción"""
-        try:
-            if "nativeTransfers" in tx_data and tx_data["nativeTransfers"]:
-                return tx_data["nativeTransfers"][0].get("fromUserAccount", "")
-            elif "tokenTransfers" in tx_data and tx_data["tokenTransfers"]:
-                return tx_data["tokenTransfers"][0].get("fromUserAccount", "")
-            return ""
-        except:
-            return ""
-    
-    def _extract_to_address(self, tx_data: Dict) -> str:
-        """Extrae la dirección de destino de la transacción"""
+    def iter_transaction_history(self, wallet_address: str, limit: int = 100) -> Iterator[ParsedTransaction]:
+        """
+        Modo streaming del historial: parsea cada transacción conforme llega del
+        socket sin materializar la página completa en memoria.
+        """
+        url = f"{self.base_url}/addresses/{wallet_address}/transactions"
+        response = self._request('iter_transaction_history', 'GET', url, stream=True,
+                                 params={"api-key": self.api_key, "limit": limit}, headers=self.headers)
         try:
-            if "nativeTransfers" in tx_data and tx_data["nativeTransfers"]:
-                return tx_data["nativeTransfers"][0].get("toUserAccount", "")
-            elif "tokenTransfers" in tx_data and tx_data["tokenTransfers"]:
-                return tx_data["tokenTransfers"][0].get("toUserAccount", "")
-            return ""
-        except:
-            return ""
+            response.raise_for_status()
+            yield from iter_parse_transactions(response.iter_content(chunk_size=64 * 1024), wallet_address)
+        finally:
+            response.close()
+    
+    @staticmethod
+    def _build_transaction(tx_data: Dict, wallet_address: str) -> Transaction:
+        """Convierte una transacción enhanced de Helius en Transaction (una sola pasada)"""
+        parsed = parse_transaction(tx_data, wallet_address)
+        return Transaction(
+            signature=parsed.signature,
+            transaction_type=parsed.transaction_type,
+            amount=parsed.amount,
+            timestamp=parsed.timestamp,
+            status=parsed.status,
+            from_address=parsed.from_address,
+            to_address=parsed.to_address
+        )
     
     def validate_wallet_address(self, wallet_address: str) -> bool:
         """Valida si una dirección de wallet es válida"""
@@ -231,7 +464,7 @@ class HeliusIntegration:
                 "params": [wallet_address]
             }
             
-            response = requests.post(self.rpc_url, json=payload, headers=self.headers)
+            response = self._request('validate_wallet_address', 'POST', self.rpc_url, json=payload, headers=self.headers)
             response.raise_for_status()
             
             data = response.json()
@@ -248,7 +481,7 @@ class HeliusIntegration:
         """Configura un webhook para monitorear wallets"""
         try:
             # URL de la API de Helius para webhooks
-            helius_webhook_url = f"https://api.helius.xyz/v0/webhooks?api-key={self.api_key}"
+            helius_webhook_url = f"{self.base_url}/webhooks?api-key={self.api_key}"
             
             # Configuración del webhook
             webhook_config = {
@@ -263,9 +496,11 @@ class HeliusIntegration:
             logger.info(f"URL: {webhook_url}")
             logger.info(f"Direcciones: {wallet_addresses}")
             
-            # Realizar petición a Helius
-            response = requests.post(
+            # Realizar petición a Helius (sin reintentos: un POST repetido duplicaría el webhook)
+            response = self._request(
+                'setup_webhook', 'POST',
                 helius_webhook_url,
+                retry=False,
                 json=webhook_config,
                 headers={'Content-Type': 'application/json'}
             )
@@ -288,9 +523,9 @@ class HeliusIntegration:
         """Lista todos los webhooks configurados en Helius"""
         try:
             # URL para listar webhooks
-            helius_list_url = f"https://api.helius.xyz/v0/webhooks?api-key={self.api_key}"
+            helius_list_url = f"{self.base_url}/webhooks?api-key={self.api_key}"
             
-            response = requests.get(helius_list_url)
+            response = self._request('list_webhooks', 'GET', helius_list_url)
             
             if response.status_code == 200:
                 webhooks = response.json()
@@ -308,9 +543,9 @@ class HeliusIntegration:
         """Elimina un webhook específico"""
         try:
             # URL para eliminar webhook
-            delete_url = f"https://api.helius.xyz/v0/webhooks/{webhook_id}?api-key={self.api_key}"
+            delete_url = f"{self.base_url}/webhooks/{webhook_id}?api-key={self.api_key}"
             
-            response = requests.delete(delete_url)
+            response = self._request('delete_webhook', 'DELETE', delete_url)
             
             if response.status_code == 200:
                 logger.info(f"Webhook {webhook_id} eliminado correctamente")
@@ -462,7 +697,7 @@ def setup_webhook(webhook_url, addresses):
             return False
         
         # URL de la API de Helius para webhooks
-        helius_webhook_url = f"https://api.helius.xyz/v0/webhooks?api-key={api_key}"
+        helius_webhook_url = f"{os.getenv('HELIUS_API_URL', HELIUS_API_URL)}/webhooks?api-key={api_key}"
         
         # Configuración del webhook
         webhook_config = {
@@ -515,7 +750,7 @@ def list_webhooks():
             return []
         
         # URL para listar webhooks
-        helius_list_url = f"https://api.helius.xyz/v0/webhooks?api-key={api_key}"
+        helius_list_url = f"{os.getenv('HELIUS_API_URL', HELIUS_API_URL)}/webhooks?api-key={api_key}"
         
         response = requests.get(helius_list_url)
         
@@ -548,7 +783,7 @@ def delete_webhook(webhook_id):
             return False
         
         # URL para eliminar webhook
-        delete_url = f"https://api.helius.xyz/v0/webhooks/{webhook_id}?api-key={api_key}"
+        delete_url = f"{os.getenv('HELIUS_API_URL', HELIUS_API_URL)}/webhooks/{webhook_id}?api-key={api_key}"
         
         response = requests.delete(delete_url)
         
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parser de una sola pasada para transacciones enhanced de Helius
+Recorre nativeTransfers y tokenTransfers una sola vez por transacción y produce
+registros compactos con __slots__. Incluye un modo streaming que decodifica un
+array JSON incrementalmente, para páginas grandes y backfills.
+"""
+
+import codecs
+import json
+
+LAMPORTS_PER_SOL = 1_000_000_000
+
+TYPE_TOKEN = "Token Transfer"
+TYPE_SOL = "SOL Transfer"
+TYPE_OTHER = "Other"
+
+
+class ParsedTransaction:
+    """Registro compacto de una transacción relativa a una wallet"""
+
+    __slots__ = ('signature', 'transaction_type', 'lamports', 'token_amount', 'from_address',
+                 'to_address', 'fee', 'slot', 'timestamp', 'status')
+
+    def __init__(self, signature, transaction_type, lamports, token_amount, from_address,
+                 to_address, fee, slot, timestamp, status):
+        self.signature = signature
+        self.transaction_type = transaction_type
+        self.lamports = lamports          # lamports con signo (negativo = salida), None si no aplica
+        self.token_amount = token_amount  # cantidad de token con signo, None si no aplica
+        self.from_address = from_address
+        self.to_address = to_address
+        self.fee = fee
+        self.slot = slot
+        self.timestamp = timestamp
+        self.status = status
+
+    @property
+    def amount(self):
+        """Cantidad con signo en SOL (o en unidades del token si no hubo SOL)"""
+        if self.lamports is not None:
+            return self.lamports / LAMPORTS_PER_SOL
+        if self.token_amount is not None:
+            return self.token_amount
+        return 0.0
+
+    def __repr__(self):
+        return (f"ParsedTransaction(signature={self.signature!r}, type={self.transaction_type!r}, "
+                f"lamports={self.lamports}, from={self.from_address!r}, to={self.to_address!r})")
+
+
+def parse_transaction(tx_data, wallet_address):
+    """Convierte una transacción enhanced en ParsedTransaction en una sola pasada"""
+    native_transfers = tx_data.get("nativeTransfers") or ()
+    token_transfers = tx_data.get("tokenTransfers") or ()
+
+    lamports = None
+    for transfer in native_transfers:
+        if transfer.get("fromUserAccount") == wallet_address:
+            lamports = -int(transfer.get("amount", 0))
+            break
+        if transfer.get("toUserAccount") == wallet_address:
+            lamports = int(transfer.get("amount", 0))
+            break
+
+    # Las cantidades de token solo se miran si no hubo movimiento de SOL
+    token_amount = None
+    if lamports is None:
+        for transfer in token_transfers:
+            if transfer.get("fromUserAccount") == wallet_address:
+                token_amount = -float(transfer.get("tokenAmount", 0))
+                break
+            if transfer.get("toUserAccount") == wallet_address:
+                token_amount = float(transfer.get("tokenAmount", 0))
+                break
+
+    first = native_transfers[0] if native_transfers else (token_transfers[0] if token_transfers else None)
+
+    if token_transfers:
+        transaction_type = TYPE_TOKEN
+    elif native_transfers:
+        transaction_type = TYPE_SOL
+    else:
+        transaction_type = TYPE_OTHER
+
+    return ParsedTransaction(
+        signature=tx_data.get("signature", ""),
+        transaction_type=transaction_type,
+        lamports=lamports,
+        token_amount=token_amount,
+        from_address=first.get("fromUserAccount", "") if first else "",
+        to_address=first.get("toUserAccount", "") if first else "",
+        fee=tx_data.get("fee", 0),
+        slot=tx_data.get("slot", 0),
+        timestamp=tx_data.get("timestamp", 0),
+        status="success" if tx_data.get("err") is None else "failed"
+    )
+
+
+NUMBER_CHARS = '0123456789+-.eE'
+
+
+def iter_json_array(chunks):
+    """
+    Decodifica incrementalmente un array JSON a partir de trozos de bytes,
+    devolviendo cada elemento en cuanto está completo.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    position = 0
+    chunks = iter(chunks)
+    exhausted = False
+
+    def more():
+        nonlocal buffer, position, exhausted
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            exhausted = True
+            buffer = buffer[position:] + text_decoder.decode(b'', final=True)
+            position = 0
+            return
+        buffer = buffer[position:] + text_decoder.decode(chunk)
+        position = 0
+
+    # Estados: antes del '[', primer elemento o ']', elemento tras ',', ',' o ']' tras un elemento
+    state = 'open'
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n':
+            position += 1
+
+        if position >= len(buffer):
+            if exhausted:
+                raise ValueError("Array JSON incompleto")
+            more()
+            continue
+
+        char = buffer[position]
+        if state == 'open':
+            if char != '[':
+                raise ValueError("Se esperaba un array JSON")
+            position += 1
+            state = 'first'
+            continue
+        if state == 'after':
+            if char == ',':
+                position += 1
+                state = 'value'
+                continue
+            if char == ']':
+                return
+            raise ValueError(f"Se esperaba ',' o ']' y llegó {char!r}")
+        if char == ']':
+            if state == 'first':
+                return
+            raise ValueError("Coma final en el array JSON")
+
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if exhausted:
+                raise
+            more()
+            continue
+        if (not exhausted and isinstance(item, (int, float)) and not isinstance(item, bool)
+                and not buffer[end:].strip(NUMBER_CHARS)):
+            # Un número al final del trozo (p. ej. '5.5e') puede seguir en el siguiente
+            more()
+            continue
+        position = end
+        state = 'after'
+        yield item
+
+
+def iter_parse_transactions(chunks, wallet_address):
+    """Modo streaming: parsea cada transacción conforme llega del socket"""
+    for tx_data in iter_json_array(chunks):
+        yield parse_transaction(tx_data, wallet_address)
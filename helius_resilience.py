@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gobernador de cuota y circuit breakers para las llamadas a Helius
+- TokenBucket: limita las peticiones por segundo al plan contratado. Si no hay
+  token disponible en HELIUS_QUOTA_WAIT segundos, la llamada falla rápido.
+- CircuitBreaker: uno por clase de endpoint (RPC y REST). Tras N fallos
+  consecutivos se abre y las llamadas fallan en milisegundos hasta que pasa el
+  tiempo de reposo; entonces deja pasar una petición de prueba (half-open).
+"""
+
+import os
+import time
+import threading
+
+
+class HeliusUnavailableError(Exception):
+    """La llamada no se realizó por cuota agotada o circuito abierto"""
+
+
+class QuotaExceededError(HeliusUnavailableError):
+    pass
+
+
+class CircuitOpenError(HeliusUnavailableError):
+    pass
+
+
+class TokenBucket:
+    """Token bucket thread-safe"""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.throttled = 0
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout=0.0):
+        """Consume un token esperando como máximo timeout segundos"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+                if now + wait > deadline:
+                    self.throttled += 1
+                    return False
+            time.sleep(wait)
+
+    def snapshot(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                'rate_per_second': self.rate,
+                'burst': self.capacity,
+                'available_tokens': round(self._tokens, 2),
+                'throttled': self.throttled
+            }
+
+
+class CircuitBreaker:
+    """Circuit breaker closed → open → half-open"""
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.rejected = 0
+        self.times_opened = 0
+
+    def allow(self):
+        """True si la petición puede salir; en half-open solo una sonda a la vez"""
+        with self._lock:
+            if self._state == 'closed':
+                return True
+            if self._state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = 'half_open'
+            if self._state == 'half_open' and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = 'closed'
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == 'half_open' or self._failures >= self.failure_threshold:
+                if self._state != 'open':
+                    self.times_opened += 1
+                self._state = 'open'
+                self._opened_at = time.monotonic()
+
+    def release_probe(self):
+        with self._lock:
+            self._probe_in_flight = False
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'rejected': self.rejected,
+                'times_opened': self.times_opened
+            }
+
+
+class HeliusGovernor:
+    """Cuota compartida + un breaker por clase de endpoint ('rpc', 'rest')"""
+
+    def __init__(self):
+        rate = float(os.getenv('HELIUS_RPS', 10))
+        self.bucket = TokenBucket(rate, float(os.getenv('HELIUS_BURST', rate * 2)))
+        self.quota_wait = float(os.getenv('HELIUS_QUOTA_WAIT', 0.5))
+        threshold = int(os.getenv('HELIUS_BREAKER_THRESHOLD', 5))
+        reset_timeout = float(os.getenv('HELIUS_BREAKER_RESET', 30))
+        self.breakers = {
+            'rpc': CircuitBreaker('rpc', threshold, reset_timeout),
+            'rest': CircuitBreaker('rest', threshold, reset_timeout)
+        }
+
+    def before_request(self, endpoint_class):
+        """Lanza HeliusUnavailableError si la llamada no debe salir"""
+        breaker = self.breakers[endpoint_class]
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuito {endpoint_class} abierto")
+        if not self.bucket.acquire(self.quota_wait):
+            # La sonda half-open no llegó a salir: liberarla sin contar fallo
+            breaker.release_probe()
+            raise QuotaExceededError("Cuota de Helius agotada")
+
+    def snapshot(self):
+        return {
+            'quota': self.bucket.snapshot(),
+            'circuits': {name: breaker.snapshot() for name, breaker in self.breakers.items()}
+        }
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servidor local que simula Helius y el RPC de Solana para pruebas sin red
+Implementa los endpoints que usa helius_integration.py:
+  - JSON-RPC (POST /): getBalance, getAccountInfo, getMultipleAccounts,
+    getSignaturesForAddress, getSignatureStatuses, getLatestBlockhash,
+    getBlockHeight, getRecentPrioritizationFees, sendTransaction (con batches)
+  - REST: GET /v0/addresses/<address>/transactions, POST /v0/transactions,
+    GET/POST /v0/webhooks, DELETE /v0/webhooks/<id>
+  - Control del mock: POST /mock/deposit, POST /mock/config, GET /mock/ledger,
+    POST /mock/reset
+
+El libro mayor es determinista (MOCK_SEED): mismas operaciones producen las
+mismas signatures. La latencia y la inyección de errores son configurables.
+
+Uso:
+    python mock_helius_server.py --port 8899 --latency-ms 50 --error-rate 0.05
+    HELIUS_API_URL=http://127.0.0.1:8899/v0 HELIUS_RPC_URL=http://127.0.0.1:8899 python app.py
+"""
+
+import os
+import json
+import time
+import base64
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from urllib.request import Request, urlopen
+
+LAMPORTS_PER_SOL = 1_000_000_000
+SYSTEM_PROGRAM_ID = '11111111111111111111111111111111'
+BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+
+def b58encode(data):
+    """Codificación base58 (sin dependencias externas)"""
+    number = int.from_bytes(data, 'big')
+    encoded = ''
+    while number:
+        number, remainder = divmod(number, 58)
+        encoded = BASE58_ALPHABET[remainder] + encoded
+    padding = len(data) - len(data.lstrip(b'\0'))
+    return '1' * padding + encoded
+
+
+def b58decode(text):
+    number = 0
+    for char in text:
+        number = number * 58 + BASE58_ALPHABET.index(char)
+    padding = len(text) - len(text.lstrip('1'))
+    body = number.to_bytes((number.bit_length() + 7) // 8, 'big') if number else b''
+    return b'\0' * padding + body
+
+
+def _read_compact_u16(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+def parse_transfer_transaction(raw):
+    """
+    Decodifica una transacción legacy serializada y devuelve
+    (signature, [(from, to, lamports), ...]) de sus instrucciones System transfer.
+    """
+    sig_count, offset = _read_compact_u16(raw, 0)
+    signatures = [raw[offset + i * 64: offset + (i + 1) * 64] for i in range(sig_count)]
+    offset += sig_count * 64
+
+    offset += 3  # cabecera del mensaje
+    key_count, offset = _read_compact_u16(raw, offset)
+    keys = [b58encode(raw[offset + i * 32: offset + (i + 1) * 32]) for i in range(key_count)]
+    offset += key_count * 32
+    offset += 32  # recent blockhash
+
+    transfers = []
+    ix_count, offset = _read_compact_u16(raw, offset)
+    for _ in range(ix_count):
+        program_index = raw[offset]
+        offset += 1
+        account_count, offset = _read_compact_u16(raw, offset)
+        accounts = list(raw[offset: offset + account_count])
+        offset += account_count
+        data_len, offset = _read_compact_u16(raw, offset)
+        data = raw[offset: offset + data_len]
+        offset += data_len
+
+        if keys[program_index] == SYSTEM_PROGRAM_ID and len(data) == 12 and int.from_bytes(data[:4], 'little') == 2:
+            transfers.append((keys[accounts[0]], keys[accounts[1]], int.from_bytes(data[4:], 'little')))
+
+    signature = b58encode(signatures[0]) if signatures else None
+    return signature, transfers
+
+
+class MockLedger:
+    """Libro mayor determinista en memoria"""
+
+    def __init__(self, seed=0):
+        self.seed = seed
+        self.reset()
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self.counter = 0
+        self.slot = 1_000
+        self.balances = {}       # {address: lamports}
+        self.transactions = []   # transacciones enhanced, más antigua primero
+        self.by_signature = {}
+        self.webhooks = {}
+
+    def _next_signature(self):
+        self.counter += 1
+        digest = hashlib.sha512(f'{self.seed}:{self.counter}'.encode()).digest()
+        return b58encode(digest)
+
+    def blockhash(self):
+        return b58encode(hashlib.sha256(f'{self.seed}:blockhash:{self.slot // 150}'.encode()).digest())
+
+    def record_transfers(self, transfers, signature=None, fee=5000):
+        """Aplica transferencias y registra una transacción enhanced"""
+        with self._lock:
+            self.slot += 1
+            signature = signature or self._next_signature()
+            if signature in self.by_signature:
+                return self.by_signature[signature]
+
+            native_transfers = []
+            for from_address, to_address, lamports in transfers:
+                self.balances[from_address] = self.balances.get(from_address, 0) - lamports
+                self.balances[to_address] = self.balances.get(to_address, 0) + lamports
+                native_transfers.append({
+                    'fromUserAccount': from_address,
+                    'toUserAccount': to_address,
+                    'amount': lamports
+                })
+            if transfers:
+                payer = transfers[0][0]
+                self.balances[payer] = self.balances.get(payer, 0) - fee
+
+            tx = {
+                'signature': signature,
+                'slot': self.slot,
+                'timestamp': 1_700_000_000 + self.slot,  # determinista
+                'fee': fee,
+                'feePayer': transfers[0][0] if transfers else None,
+                'type': 'TRANSFER',
+                'nativeTransfers': native_transfers,
+                'tokenTransfers': [],
+                'err': None
+            }
+            self.transactions.append(tx)
+            self.by_signature[signature] = tx
+            return tx
+
+    def history(self, address, before=None, until=None, limit=100):
+        """Transacciones de una dirección, más recientes primero"""
+        result = []
+        started = before is None
+        for tx in reversed(self.transactions):
+            if not started:
+                started = tx['signature'] == before
+                continue
+            if until and tx['signature'] == until:
+                break
+            if any(address in (t['fromUserAccount'], t['toUserAccount']) for t in tx['nativeTransfers']):
+                result.append(tx)
+                if len(result) >= limit:
+                    break
+        return result
+
+
+class MockConfig:
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, error_status=503, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+
+
+class MockHeliusHandler(BaseHTTPRequestHandler):
+    ledger: MockLedger = None
+    config: MockConfig = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    # ----------------- Utilidades -----------------
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return None
+        return json.loads(self.rfile.read(length))
+
+    def _simulate_network(self):
+        """Aplica latencia y devuelve True si se debe inyectar un error"""
+        config = self.config
+        if config.latency_ms or config.jitter_ms:
+            time.sleep((config.latency_ms + config.random.uniform(0, config.jitter_ms)) / 1000)
+        if config.error_rate and config.random.random() < config.error_rate:
+            self._send_json(config.error_status, {'error': 'mock injected error'})
+            return True
+        return False
+
+    # ----------------- Rutas -----------------
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [part for part in url.path.split('/') if part]
+
+        if parts == ['mock', 'ledger']:
+            return self._send_json(200, {
+                'balances': self.ledger.balances,
+                'transactions': len(self.ledger.transactions),
+                'slot': self.ledger.slot
+            })
+        if self._simulate_network():
+            return
+
+        if len(parts) == 4 and parts[:2] == ['v0', 'addresses'] and parts[3] == 'transactions':
+            limit = min(int(query.get('limit', ['100'])[0]), 100)
+            return self._send_json(200, self.ledger.history(
+                parts[2], query.get('before', [None])[0], query.get('until', [None])[0], limit))
+        if parts == ['v0', 'webhooks']:
+            return self._send_json(200, list(self.ledger.webhooks.values()))
+        self._send_json(404, {'error': 'not found'})
+
+    def do_DELETE(self):
+        parts = [part for part in urlparse(self.path).path.split('/') if part]
+        if self._simulate_network():
+            return
+        if len(parts) == 3 and parts[:2] == ['v0', 'webhooks']:
+            if self.ledger.webhooks.pop(parts[2], None) is None:
+                return self._send_json(404, {'error': 'webhook not found'})
+            return self._send_json(200, {})
+        self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        parts = [part for part in urlparse(self.path).path.split('/') if part]
+        body = self._read_json()
+
+        if parts[:1] == ['mock']:
+            return self._handle_mock(parts[1:], body or {})
+        if self._simulate_network():
+            return
+
+        if not parts:
+            if isinstance(body, list):
+                return self._send_json(200, [self._handle_rpc(item) for item in body])
+            return self._send_json(200, self._handle_rpc(body or {}))
+        if parts == ['v0', 'transactions']:
+            signatures = (body or {}).get('transactions', [])
+            return self._send_json(200, [self.ledger.by_signature[s] for s in signatures
+                                         if s in self.ledger.by_signature])
+        if parts == ['v0', 'webhooks']:
+            webhook_id = f'mock-webhook-{len(self.ledger.webhooks) + 1}'
+            webhook = dict(body or {}, webhookID=webhook_id)
+            self.ledger.webhooks[webhook_id] = webhook
+            return self._send_json(200, webhook)
+        self._send_json(404, {'error': 'not found'})
+
+    # ----------------- JSON-RPC -----------------
+
+    def _handle_rpc(self, request):
+        method = request.get('method')
+        params = request.get('params') or []
+        ledger = self.ledger
+        context = {'slot': ledger.slot}
+
+        def result(value):
+            return {'jsonrpc': '2.0', 'id': request.get('id'), 'result': value}
+
+        def account(address):
+            lamports = ledger.balances.get(address)
+            if lamports is None:
+                return None
+            return {'lamports': lamports, 'owner': SYSTEM_PROGRAM_ID, 'data': ['', 'base64'],
+                    'executable': False, 'rentEpoch': 0}
+
+        if method == 'getBalance':
+            return result({'context': context, 'value': ledger.balances.get(params[0], 0)})
+        if method == 'getAccountInfo':
+            return result({'context': context, 'value': account(params[0])})
+        if method == 'getMultipleAccounts':
+            return result({'context': context, 'value': [account(address) for address in params[0]]})
+        if method == 'getSignaturesForAddress':
+            options = params[1] if len(params) > 1 else {}
+            txs = ledger.history(params[0], options.get('before'), options.get('until'),
+                                 min(options.get('limit', 1000), 1000))
+            return result([{'signature': tx['signature'], 'slot': tx['slot'], 'err': None,
+                            'blockTime': tx['timestamp'], 'confirmationStatus': 'finalized'} for tx in txs])
+        if method == 'getSignatureStatuses':
+            return result({'context': context, 'value': [
+                {'slot': ledger.by_signature[s]['slot'], 'confirmations': None, 'err': None,
+                 'confirmationStatus': 'finalized'} if s in ledger.by_signature else None
+                for s in params[0]
+            ]})
+        if method == 'getLatestBlockhash':
+            return result({'context': context, 'value': {
+                'blockhash': ledger.blockhash(), 'lastValidBlockHeight': ledger.slot + 150}})
+        if method == 'getBlockHeight':
+            return result(ledger.slot)
+        if method == 'getRecentPrioritizationFees':
+            return result([{'slot': ledger.slot - i, 'prioritizationFee': 1000} for i in range(20)])
+        if method == 'sendTransaction':
+            encoding = (params[1] if len(params) > 1 else {}).get('encoding', 'base58')
+            raw = base64.b64decode(params[0]) if encoding == 'base64' else b58decode(params[0])
+            try:
+                signature, transfers = parse_transfer_transaction(raw)
+            except (IndexError, ValueError) as e:
+                return {'jsonrpc': '2.0', 'id': request.get('id'),
+                        'error': {'code': -32602, 'message': f'invalid transaction: {e}'}}
+            ledger.record_transfers(transfers, signature=signature)
+            return result(signature)
+
+        return {'jsonrpc': '2.0', 'id': request.get('id'),
+                'error': {'code': -32601, 'message': f'Method not found: {method}'}}
+
+    # ----------------- Control del mock -----------------
+
+    def _handle_mock(self, parts, body):
+        if parts == ['deposit']:
+            # Simula un depósito on-chain y lo envía a los webhooks registrados
+            lamports = int(body.get('lamports') or float(body.get('sol', 0)) * LAMPORTS_PER_SOL)
+            from_address = body['from']
+            self.ledger.balances.setdefault(from_address, lamports + 10_000_000)
+            tx = self.ledger.record_transfers([(from_address, body['to'], lamports)])
+            delivered = self._deliver_webhooks(tx) if body.get('deliver_webhook', True) else 0
+            return self._send_json(200, {'transaction': tx, 'webhooks_delivered': delivered})
+        if parts == ['fund']:
+            self.ledger.balances[body['address']] = self.ledger.balances.get(body['address'], 0) + int(body['lamports'])
+            return self._send_json(200, {'balance': self.ledger.balances[body['address']]})
+        if parts == ['config']:
+            for key in ('latency_ms', 'jitter_ms', 'error_rate', 'error_status'):
+                if key in body:
+                    setattr(self.config, key, type(getattr(self.config, key))(body[key]))
+            return self._send_json(200, vars(self.config) | {'random': None})
+        if parts == ['reset']:
+            self.ledger.reset()
+            return self._send_json(200, {'success': True})
+        self._send_json(404, {'error': 'not found'})
+
+    def _deliver_webhooks(self, tx):
+        delivered = 0
+        for webhook in list(self.ledger.webhooks.values()):
+            addresses = set(webhook.get('accountAddresses') or [])
+            involved = {t['toUserAccount'] for t in tx['nativeTransfers']}
+            involved |= {t['fromUserAccount'] for t in tx['nativeTransfers']}
+            if not addresses & involved:
+                continue
+            payload = json.dumps({'type': 'enhanced', 'transactions': [tx]}).encode('utf-8')
+            try:
+                urlopen(Request(webhook['webhookURL'], data=payload,
+                                headers={'Content-Type': 'application/json'}), timeout=5).close()
+                delivered += 1
+            except Exception as e:
+                print(f"⚠️ Error entregando webhook a {webhook['webhookURL']}: {e}")
+        return delivered
+
+
+def create_server(host='127.0.0.1', port=8899, latency_ms=0, jitter_ms=0, error_rate=0.0,
+                  error_status=503, seed=0):
+    """Crea el servidor (sin arrancarlo); útil para usarlo desde scripts de prueba"""
+    handler = type('Handler', (MockHeliusHandler,), {
+        'ledger': MockLedger(seed),
+        'config': MockConfig(latency_ms, jitter_ms, error_rate, error_status, seed)
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock local de Helius/Solana RPC')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=int(os.getenv('MOCK_HELIUS_PORT', 8899)))
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--seed', type=int, default=int(os.getenv('MOCK_SEED', 0)))
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, args.latency_ms, args.jitter_ms,
+                           args.error_rate, args.error_status, args.seed)
+    print(f"🧪 Mock de Helius escuchando en http://{args.host}:{args.port}")
+    print(f"   HELIUS_API_URL=http://{args.host}:{args.port}/v0")
+    print(f"   HELIUS_RPC_URL=http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
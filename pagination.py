@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Paginación por clave (keyset) para historiales
+Las páginas se ordenan por (created_at, id) descendente y cada una continúa
+desde la última fila de la anterior con un WHERE sobre esa clave, así que el
+coste por página es constante aunque la wallet tenga cientos de miles de filas
+(OFFSET tendría que recorrer todas las anteriores). El cursor es opaco para el
+cliente: base64 de la clave de la última fila.
+
+El total de filas de un historial se cachea por wallet y filtro: contar cuesta
+lo mismo que recorrer el historial entero.
+"""
+
+import os
+import json
+import time
+import base64
+import threading
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = int(os.getenv('HISTORY_MAX_PAGE_SIZE', 100))
+
+
+def encode_cursor(created_at, row_id):
+    payload = json.dumps([created_at.isoformat(), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) del cursor; ValueError si no es válido"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+def page_size(limit, default=DEFAULT_PAGE_SIZE):
+    """Tamaño de página acotado a [1, MAX_PAGE_SIZE]"""
+    if not limit:
+        return default
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+
+def keyset_page(query, created_column, id_column, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Una página de query (ORM) ordenada por (created_at, id) descendente.
+    Devuelve (filas, next_cursor); next_cursor es None en la última página.
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(or_(created_column < created_at,
+                                 and_(created_column == created_at, id_column < row_id)))
+    rows = query.order_by(created_column.desc(), id_column.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, created_column.key), getattr(last, id_column.key))
+
+
+class CountCache:
+    """Totales de historial por (wallet, filtro) con TTL e invalidación por wallet"""
+
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = ttl if ttl is not None else float(os.getenv('HISTORY_COUNT_TTL', 60))
+        self.max_entries = max_entries or int(os.getenv('HISTORY_COUNT_MAX_ENTRIES', 50_000))
+        self._lock = threading.Lock()
+        self._entries = {}  # {(wallet, filtro): (total, contado_en)}
+        self._by_wallet = {}  # {wallet: {filtros}}
+        self._generation = 0
+
+        # Métricas
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, wallet_address, key, count):
+        """Total cacheado o count() si no está o venció"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((wallet_address, key))
+            if entry and now - entry[1] < self.ttl:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self._generation
+        total = count()
+        with self._lock:
+            # Un conteo que se solapó con una invalidación no se guarda
+            if generation == self._generation:
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+                    self._by_wallet.clear()
+                self._entries[(wallet_address, key)] = (total, time.monotonic())
+                self._by_wallet.setdefault(wallet_address, set()).add(key)
+        return total
+
+    def invalidate(self, *wallet_addresses):
+        """Descarta los totales de las wallets con filas nuevas (tras el commit)"""
+        with self._lock:
+            self._generation += 1
+            for wallet_address in wallet_addresses:
+                for key in self._by_wallet.pop(wallet_address, ()):
+                    self._entries.pop((wallet_address, key), None)
+
+    def get_metrics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+            }
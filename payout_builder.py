@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Construcción de transacciones de pago desde la wallet custodial
+Una transacción legacy de Solana admite varias instrucciones de transferencia;
+aquí se calcula cuántas caben en el límite de 1232 bytes y se construye y firma
+la transacción con todas ellas.
+"""
+
+import os
+import json
+
+from solders.keypair import Keypair
+from solders.pubkey import Pubkey
+from solders.hash import Hash
+from solders.message import Message
+from solders.transaction import Transaction
+from solders.system_program import transfer, TransferParams
+from solders.compute_budget import set_compute_unit_limit, set_compute_unit_price
+
+# Tamaño máximo de una transacción serializada (MTU de paquete IPv6 - cabeceras)
+MAX_TRANSACTION_SIZE = 1232
+
+# Unidades de cómputo reservadas: instrucciones de Compute Budget + una por transferencia
+BASE_COMPUTE_UNITS = 1_000
+TRANSFER_COMPUTE_UNITS = 300
+
+
+def _compact_len(n):
+    """Bytes que ocupa un entero en formato compact-u16"""
+    if n < 0x80:
+        return 1
+    if n < 0x4000:
+        return 2
+    return 3
+
+
+def estimate_transaction_size(num_transfers, with_compute_budget=False):
+    """
+    Tamaño en bytes de una transacción con num_transfers transferencias,
+    suponiendo el peor caso (todos los destinos distintos).
+    """
+    num_accounts = 2 + num_transfers  # pagador + System Program + destinos
+    num_instructions = num_transfers
+    instruction_bytes = 17 * num_transfers  # programa, 2 cuentas, 12 bytes de datos
+    if with_compute_budget:
+        num_accounts += 1
+        num_instructions += 2
+        instruction_bytes += 8 + 12  # SetComputeUnitLimit (u32) + SetComputeUnitPrice (u64)
+
+    size = 1 + 64                                          # firmas
+    size += 3                                              # cabecera del mensaje
+    size += _compact_len(num_accounts) + 32 * num_accounts  # cuentas
+    size += 32                                             # blockhash reciente
+    size += _compact_len(num_instructions) + instruction_bytes
+    return size
+
+
+def max_transfers_per_transaction(with_compute_budget=False):
+    """Máximo de transferencias que caben en una transacción"""
+    n = 1
+    while estimate_transaction_size(n + 1, with_compute_budget) <= MAX_TRANSACTION_SIZE:
+        n += 1
+    return n
+
+
+def is_valid_destination(destination):
+    """True si destination es una clave pública de Solana (base58, 32 bytes)"""
+    try:
+        Pubkey.from_string(destination)
+        return True
+    except (ValueError, TypeError):
+        return False
+
+
+def load_custodial_keypair(secret=None):
+    """
+    Carga el keypair custodial desde CUSTODIAL_WALLET_SEED. Acepta frase semilla
+    (12/24 palabras), array JSON de 64 bytes o clave secreta en base58.
+    """
+    secret = (secret or os.getenv('CUSTODIAL_WALLET_SEED') or '').strip()
+    if not secret:
+        raise ValueError("CUSTODIAL_WALLET_SEED no configurada")
+    if secret.startswith('['):
+        return Keypair.from_bytes(bytes(json.loads(secret)))
+    if ' ' in secret:
+        return Keypair.from_seed_phrase_and_passphrase(secret, "")
+    return Keypair.from_base58_string(secret)
+
+
+def build_transfer_transaction(keypair, transfers, recent_blockhash, compute_unit_price=None):
+    """
+    Construye y firma una transacción con una transferencia por pago.
+    transfers: lista de (destino, lamports). compute_unit_price (micro-lamports
+    por CU) añade la comisión de prioridad. Devuelve (firma, bytes serializados).
+    No realiza ninguna llamada RPC.
+    """
+    with_compute_budget = compute_unit_price is not None
+    if not transfers:
+        raise ValueError("No hay transferencias que enviar")
+    if len(transfers) > max_transfers_per_transaction(with_compute_budget):
+        raise ValueError(f"Demasiadas transferencias para una transacción: {len(transfers)}")
+
+    payer = keypair.pubkey()
+    instructions = []
+    if with_compute_budget:
+        instructions.append(set_compute_unit_limit(BASE_COMPUTE_UNITS + TRANSFER_COMPUTE_UNITS * len(transfers)))
+        instructions.append(set_compute_unit_price(int(compute_unit_price)))
+    instructions.extend(
+        transfer(TransferParams(from_pubkey=payer, to_pubkey=Pubkey.from_string(destination), lamports=int(lamports)))
+        for destination, lamports in transfers
+    )
+    blockhash = Hash.from_string(recent_blockhash)
+    message = Message.new_with_blockhash(instructions, payer, blockhash)
+    transaction = Transaction([keypair], message, blockhash)
+    return str(transaction.signatures[0]), bytes(transaction)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caché LRU/TTL de perfiles de usuario por wallet
+- Lectura directa (read-through): si la wallet no está en caché se carga de la
+  base de datos y se guarda.
+- Las rutas que modifican fichas o perfil invalidan la wallet tras el commit;
+  el TTL acota lo que puedan tardar en verse cambios hechos fuera de la app.
+- Una carga que empezó antes de una invalidación no se guarda, así que una
+  lectura lenta nunca reinstala un saldo ya superado.
+- Índice secundario username -> wallet para load_user_chips.
+"""
+
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Columnas de user_profiles que se guardan en caché (last_login lo lleva ActivityTracker)
+PROFILE_FIELDS = ('wallet_address', 'username', 'chips', 'total_games', 'total_wins', 'created_at')
+
+
+class ProfileCache:
+    """Perfiles recientes en memoria con expulsión LRU y caducidad por TTL"""
+
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = ttl if ttl is not None else float(os.getenv('PROFILE_CACHE_TTL', 30))
+        self.max_entries = max_entries or int(os.getenv('PROFILE_CACHE_MAX_ENTRIES', 50_000))
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # {wallet: (perfil, cargado_en)}, del menos al más reciente
+        self._usernames = {}  # {username: wallet}
+        self._generation = 0  # Se incrementa en cada invalidación
+
+        # Métricas
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self.discarded_loads = 0
+
+    # ----------------- Lecturas -----------------
+
+    def get(self, wallet_address, load):
+        """
+        Perfil de la wallet (dict con PROFILE_FIELDS) o None si no existe.
+        load(wallet_address) lo lee de la base de datos en caso de fallo.
+        """
+        with self._lock:
+            profile = self._lookup(wallet_address)
+            if profile is not None:
+                return profile
+            generation = self._generation
+        return self._load(load, wallet_address, generation)
+
+    def get_by_username(self, username, load):
+        """Igual que get, pero por username; load(username) devuelve el perfil"""
+        with self._lock:
+            wallet_address = self._usernames.get(username)
+            profile = self._lookup(wallet_address) if wallet_address else None
+            if profile is not None and profile['username'] == username:
+                return profile
+            if wallet_address is None:
+                self.misses += 1
+            generation = self._generation
+        return self._load(load, username, generation)
+
+    def _lookup(self, wallet_address):
+        """Entrada fresca o None; se llama con el lock tomado"""
+        entry = self._entries.get(wallet_address)
+        if entry is None:
+            self.misses += 1
+            return None
+        profile, loaded_at = entry
+        if time.monotonic() - loaded_at >= self.ttl:
+            self._drop(wallet_address)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(wallet_address)
+        self.hits += 1
+        return profile
+
+    def _load(self, load, key, generation):
+        with self._lock:
+            self.loads += 1
+        profile = load(key)
+        if profile is None:
+            return None
+        with self._lock:
+            if generation != self._generation:
+                # Hubo una escritura mientras se leía: servir sin guardar
+                self.discarded_loads += 1
+            else:
+                self._store(profile)
+        return profile
+
+    # ----------------- Escrituras -----------------
+
+    def set(self, profile):
+        """Guarda un perfil recién escrito (p. ej. tras crearlo)"""
+        with self._lock:
+            self._store(profile)
+
+    def _store(self, profile):
+        wallet_address = profile['wallet_address']
+        self._drop(wallet_address)
+        self._entries[wallet_address] = (profile, time.monotonic())
+        self._usernames[profile['username']] = wallet_address
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, wallet_address):
+        entry = self._entries.pop(wallet_address, None)
+        if entry and self._usernames.get(entry[0]['username']) == wallet_address:
+            del self._usernames[entry[0]['username']]
+
+    def invalidate(self, *wallet_addresses):
+        """Descarta las wallets indicadas; llamar después del commit que las modificó"""
+        with self._lock:
+            self._generation += 1
+            for wallet_address in wallet_addresses:
+                self._drop(wallet_address)
+            self.invalidations += len(wallet_addresses)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._usernames.clear()
+
+    def get_metrics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'loads': self.loads,
+                'discarded_loads': self.discarded_loads,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions
+            }
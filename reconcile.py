@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Conciliación on-chain / off-chain
+- Solvencia: compara el SOL de la wallet custodial con la suma de
+  user_profiles.chips / TOKENS_PER_SOL.
+- Libro mayor: cruza (merge-join ordenado) los saldos player:* del libro mayor
+  con user_profiles.chips.
+- Depósitos: verifica que cada signature de depósito en user_transactions
+  existe en la cadena y no falló, con getSignatureStatuses en lotes de 256.
+
+Todo se recorre por bloques con paginación por clave, así que la memoria es
+acotada y el tiempo lineal en el número de filas.
+
+Uso:
+    python reconcile.py --output reconcile_report.json
+    python reconcile.py --skip-signatures
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, Table, Column, Integer, String, Float, MetaData, select
+
+from chip_ledger import ChipLedger, player_account, CUSTODIAL, HOUSE
+
+logger = logging.getLogger(__name__)
+
+LAMPORTS_PER_SOL = 1_000_000_000
+STATUS_BATCH_SIZE = 256  # Máximo de firmas por getSignatureStatuses
+MAX_SAMPLES = 100  # Ejemplos de discrepancias incluidos en el reporte
+
+metadata = MetaData()
+
+# Solo las columnas que necesita la conciliación (las tablas las define app.py)
+user_profiles = Table(
+    'user_profiles', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('wallet_address', String(50)),
+    Column('chips', Integer),
+)
+
+user_transactions = Table(
+    'user_transactions', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('wallet_address', String(50)),
+    Column('transaction_type', String(20)),
+    Column('amount', Float),
+    Column('signature', String(100)),
+)
+
+
+def is_onchain_signature(signature):
+    """Las signatures de Solana son 64 bytes en base58 (87-88 caracteres)"""
+    return bool(signature) and 80 <= len(signature) <= 90 and not signature.startswith('withdraw_')
+
+
+class Reconciler:
+    """Job de conciliación con memoria acotada"""
+
+    def __init__(self, engine, helius=None, custodial_address=None, chunk_size=None, rpc_workers=None):
+        self.engine = engine
+        self.helius = helius
+        self.custodial_address = custodial_address
+        self.chunk_size = chunk_size or int(os.getenv('RECONCILE_CHUNK_SIZE', 10_000))
+        self.rpc_workers = rpc_workers or int(os.getenv('RECONCILE_RPC_WORKERS', 8))
+        self.tokens_per_sol = int(os.getenv('TOKENS_PER_SOL', 100000))
+
+    # ----------------- Recorridos por bloques -----------------
+
+    def _iter_profiles(self, order_by_wallet=False):
+        """(wallet, chips) de todos los perfiles, por bloques"""
+        key = user_profiles.c.wallet_address if order_by_wallet else user_profiles.c.id
+        last = '' if order_by_wallet else 0
+        while True:
+            with self.engine.connect() as conn:
+                rows = conn.execute(
+                    select(user_profiles.c.id, user_profiles.c.wallet_address, user_profiles.c.chips)
+                    .where(key > last).order_by(key).limit(self.chunk_size)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row.wallet_address, row.chips or 0
+            last = rows[-1].wallet_address if order_by_wallet else rows[-1].id
+
+    def _iter_deposit_chunks(self):
+        """Bloques de (id, signature) de depósitos"""
+        last_id = 0
+        while True:
+            with self.engine.connect() as conn:
+                rows = conn.execute(
+                    select(user_transactions.c.id, user_transactions.c.signature)
+                    .where(user_transactions.c.transaction_type == 'deposit')
+                    .where(user_transactions.c.id > last_id)
+                    .order_by(user_transactions.c.id)
+                    .limit(self.chunk_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1].id
+
+    # ----------------- Comprobaciones -----------------
+
+    def check_solvency(self):
+        """SOL custodial frente a las fichas emitidas"""
+        total_chips = 0
+        profiles = 0
+        for _, chips in self._iter_profiles():
+            total_chips += chips
+            profiles += 1
+
+        liability_lamports = total_chips * LAMPORTS_PER_SOL // self.tokens_per_sol
+        result = {
+            'profiles': profiles,
+            'total_chips': total_chips,
+            'liability_sol': liability_lamports / LAMPORTS_PER_SOL,
+            'custodial_sol': None,
+            'drift_sol': None,
+            'solvent': None
+        }
+        if self.helius and self.custodial_address:
+            custodial_sol = self.helius.get_sol_balance(self.custodial_address, raise_errors=True)
+            drift_lamports = round(custodial_sol * LAMPORTS_PER_SOL) - liability_lamports
+            result.update({
+                'custodial_sol': custodial_sol,
+                'drift_sol': drift_lamports / LAMPORTS_PER_SOL,
+                'solvent': drift_lamports >= 0
+            })
+        return result
+
+    def check_ledger(self):
+        """Merge-join ordenado de saldos player:* del libro mayor y user_profiles"""
+        ledger = ChipLedger(self.engine, chunk_size=self.chunk_size)
+        prefix = player_account('')
+        ledger_iter = ((account[len(prefix):], balance) for account, balance in ledger.iter_balances(prefix))
+        profiles_iter = self._iter_profiles(order_by_wallet=True)
+
+        mismatches = 0
+        samples = []
+        compared = 0
+        ledger_row = next(ledger_iter, None)
+        profile_row = next(profiles_iter, None)
+        while ledger_row or profile_row:
+            if profile_row and (not ledger_row or profile_row[0] < ledger_row[0]):
+                wallet, chips, balance = profile_row[0], profile_row[1], 0
+                profile_row = next(profiles_iter, None)
+            elif ledger_row and (not profile_row or ledger_row[0] < profile_row[0]):
+                wallet, chips, balance = ledger_row[0], None, ledger_row[1]
+                ledger_row = next(ledger_iter, None)
+            else:
+                wallet, chips, balance = profile_row[0], profile_row[1], ledger_row[1]
+                profile_row = next(profiles_iter, None)
+                ledger_row = next(ledger_iter, None)
+            compared += 1
+            if (chips or 0) != balance:
+                mismatches += 1
+                if len(samples) < MAX_SAMPLES:
+                    samples.append({'wallet_address': wallet, 'chips': chips, 'ledger_balance': balance})
+
+        return {
+            'accounts_compared': compared,
+            'mismatches': mismatches,
+            'samples': samples,
+            'custodial_balance': ledger.balance(CUSTODIAL)['balance'],
+            'house_balance': ledger.balance(HOUSE)['balance']
+        }
+
+    def check_deposit_signatures(self):
+        """Cada depósito registrado debe existir en la cadena sin error"""
+        checked = 0
+        skipped = 0
+        missing = 0
+        failed = 0
+        samples = []
+
+        with ThreadPoolExecutor(max_workers=self.rpc_workers) as pool:
+            for rows in self._iter_deposit_chunks():
+                signatures = []
+                for row in rows:
+                    if is_onchain_signature(row.signature):
+                        signatures.append(row.signature)
+                    else:
+                        skipped += 1
+                batches = [signatures[i:i + STATUS_BATCH_SIZE] for i in range(0, len(signatures), STATUS_BATCH_SIZE)]
+                for batch, statuses in zip(batches, pool.map(self.helius.get_signature_statuses, batches)):
+                    for signature, status in zip(batch, statuses):
+                        checked += 1
+                        if status is None:
+                            missing += 1
+                            problem = 'missing'
+                        elif status.get('err') is not None:
+                            failed += 1
+                            problem = 'failed'
+                        else:
+                            continue
+                        if len(samples) < MAX_SAMPLES:
+                            samples.append({'signature': signature, 'problem': problem})
+
+        return {
+            'checked': checked,
+            'skipped_non_onchain': skipped,
+            'missing': missing,
+            'failed_onchain': failed,
+            'samples': samples
+        }
+
+    def run(self, check_signatures=True):
+        started = time.time()
+        report = {'started_at': started, 'solvency': self.check_solvency(), 'ledger': self.check_ledger()}
+        if check_signatures and self.helius:
+            report['deposit_signatures'] = self.check_deposit_signatures()
+        report['duration_seconds'] = round(time.time() - started, 2)
+        report['ok'] = (
+            report['solvency']['solvent'] is not False
+            and report['ledger']['mismatches'] == 0
+            and not report.get('deposit_signatures', {}).get('missing')
+            and not report.get('deposit_signatures', {}).get('failed_onchain')
+        )
+        return report
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Conciliación on-chain / off-chain de fichas y depósitos')
+    parser.add_argument('--db-url', default=os.getenv('DB_URL', 'sqlite:///game.db'))
+    parser.add_argument('--output', help='Archivo JSON del reporte (por defecto, stdout)')
+    parser.add_argument('--chunk-size', type=int, default=None)
+    parser.add_argument('--skip-signatures', action='store_true', help='No verificar signatures on-chain')
+    args = parser.parse_args()
+
+    helius = None
+    api_key = os.getenv('HELIUS_API_KEY')
+    if api_key:
+        from helius_integration import HeliusIntegration
+        helius = HeliusIntegration(api_key, os.getenv('HELIUS_NETWORK', 'devnet'))
+    else:
+        print("⚠️ HELIUS_API_KEY no configurada: se omiten las comprobaciones on-chain", file=sys.stderr)
+
+    custodial_address = os.getenv('CUSTODIAL_ADDRESS')
+    reconciler = Reconciler(create_engine(args.db_url), helius, custodial_address, chunk_size=args.chunk_size)
+    report = reconciler.run(check_signatures=not args.skip_signatures)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+        print(f"{'✅' if report['ok'] else '❌'} Reporte de conciliación guardado en {args.output}")
+    else:
+        print(output)
+    sys.exit(0 if report['ok'] else 1)
+
+
+if __name__ == '__main__':
+    main()
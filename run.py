@@ -0,0 +1,12 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Punto de entrada del servidor: python run.py
+La aplicación se importa dentro del bloque __main__. Los procesos del pool de
+firma se crean con 'spawn' e importan este script al arrancar: así no vuelven
+a ejecutar la aplicación (hilos, workers, base de datos).
+"""
+
+if __name__ == '__main__':
+    from app import app, socketio
+    socketio.run(app, debug=True)
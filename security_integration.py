@@ -14,6 +14,7 @@ from functools import wraps
 from collections import defaultdict
 import os
 from flask import request, jsonify
+from audit_archive import AuditArchiver
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -24,6 +25,7 @@ class SecurityManager:
     def __init__(self):
         self.rate_limits = defaultdict(list)
         self.init_security_tables()
+        self.audit_archiver = AuditArchiver()
     
     def init_security_tables(self):
         """Inicializa tablas de seguridad si no existen"""
@@ -100,6 +102,70 @@ class SecurityManager:
         except Exception as e:
             logger.error(f"❌ Error en auditoría: {e}")
     
+    def get_audit_logs(self, wallet_address, limit=50, include_archive=False, since=None, until=None):
+        """
+        Obtiene los logs de auditoría más recientes de una wallet.
+        since/until ('YYYY-MM-DD', inclusivos) acotan la búsqueda. Con
+        include_archive solo se descomprimen los días archivados dentro del rango;
+        sin since se miran los últimos AUDIT_ARCHIVE_LOOKBACK_DAYS días.
+        """
+        try:
+            if include_archive and since is None:
+                lookback_days = int(os.getenv('AUDIT_ARCHIVE_LOOKBACK_DAYS', 30))
+                since = (datetime.utcnow().date() - timedelta(days=lookback_days)).isoformat()
+
+            conn = sqlite3.connect('casino.db')
+            cursor = conn.cursor()
+            
+            query = '''
+                SELECT action, details, ip_address, risk_level, created_at
+                FROM audit_logs
+                WHERE wallet_address = ?
+            '''
+            params = [wallet_address]
+            if since:
+                query += ' AND created_at >= ?'
+                params.append(since)
+            if until:
+                query += ' AND DATE(created_at) <= ?'
+                params.append(until)
+            query += ' ORDER BY id DESC LIMIT ?'
+            params.append(limit)
+            cursor.execute(query, params)
+            
+            logs = [
+                {
+                    'action': row[0],
+                    'details': json.loads(row[1]) if row[1] else None,
+                    'ip_address': row[2],
+                    'risk_level': row[3],
+                    'created_at': row[4]
+                }
+                for row in cursor.fetchall()
+            ]
+            conn.close()
+            
+            # Completar con particiones archivadas del rango (de la más reciente a la más antigua)
+            if include_archive and len(logs) < limit:
+                for day in reversed(self.audit_archiver.archived_days(since, until)):
+                    day_entries = list(self.audit_archiver.scan_archive(wallet_address, since=day, until=day))
+                    for entry in reversed(day_entries):
+                        logs.append({
+                            'action': entry['action'],
+                            'details': json.loads(entry['details']) if entry['details'] else None,
+                            'ip_address': entry['ip_address'],
+                            'risk_level': entry['risk_level'],
+                            'created_at': entry['created_at']
+                        })
+                        if len(logs) >= limit:
+                            return logs
+            
+            return logs
+            
+        except Exception as e:
+            logger.error(f"❌ Error obteniendo logs de auditoría: {e}")
+            return []
+    
     def check_daily_limits(self, wallet_address, withdrawal_amount_sol):
         """Verifica límites diarios de retiro"""
         try:
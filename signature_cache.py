@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caché de deduplicación de signatures para el flujo de depósitos
+- LRU de signatures procesadas recientemente: un acierto es un duplicado seguro
+  y se rechaza sin leer la base de datos (reintentos de webhook, replays).
+- Filtro de Bloom sobre todo el historial: si dice "no visto" la signature es
+  nueva con certeza y se omite el SELECT. Si dice "quizá", se consulta la BD.
+El índice único de la base de datos sigue siendo la garantía final: si no
+existe, disable_fast_path() obliga a consultar la BD en cada signature.
+"""
+
+import os
+import math
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Filtro de Bloom simple sobre un bytearray"""
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class SignatureDedupCache:
+    """LRU de signatures recientes + filtro de Bloom del historial completo"""
+
+    def __init__(self, lru_size=None, bloom_capacity=None, error_rate=0.001):
+        self.lru_size = lru_size or int(os.getenv('SIGNATURE_LRU_SIZE', 50_000))
+        self.bloom_capacity = bloom_capacity or int(os.getenv('SIGNATURE_BLOOM_CAPACITY', 1_000_000))
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self._recent = OrderedDict()
+        self._bloom = BloomFilter(self.bloom_capacity, error_rate)
+        self._count = 0
+        self.fast_path = True  # Omitir el SELECT cuando el Bloom dice "no visto"
+
+        # Métricas
+        self.duplicates_rejected = 0
+        self.db_lookups_skipped = 0
+        self.db_lookups = 0
+
+    def rebuild(self, signatures, expected_count=0):
+        """Reconstruye el filtro de Bloom a partir de un iterable de signatures"""
+        capacity = max(self.bloom_capacity, expected_count * 2)
+        bloom = BloomFilter(capacity, self.error_rate)
+        count = 0
+        for signature in signatures:
+            if signature:
+                bloom.add(signature)
+                count += 1
+        with self._lock:
+            self._bloom = bloom
+            self._count = count
+            self.bloom_capacity = capacity
+        logger.info(f"✅ Filtro de signatures reconstruido: {count} signatures")
+        return count
+
+    def is_duplicate(self, signature):
+        """True si la signature se procesó hace poco (duplicado seguro, sin BD)"""
+        with self._lock:
+            if signature in self._recent:
+                self._recent.move_to_end(signature)
+                self.duplicates_rejected += 1
+                return True
+            return False
+
+    def needs_db_check(self, signature):
+        """False si la signature es nueva con certeza y se puede omitir el SELECT"""
+        with self._lock:
+            if not self.fast_path or signature in self._bloom:
+                self.db_lookups += 1
+                return True
+            self.db_lookups_skipped += 1
+            return False
+
+    def disable_fast_path(self, reason):
+        """Consulta siempre la BD (sin índice único el Bloom no basta para deduplicar)"""
+        with self._lock:
+            self.fast_path = False
+        logger.warning(f"⚠️ Deduplicación sin atajo del filtro de Bloom: {reason}")
+
+    def add(self, signature):
+        """Marca una signature como procesada"""
+        if not signature:
+            return
+        with self._lock:
+            self._recent[signature] = True
+            self._recent.move_to_end(signature)
+            if len(self._recent) > self.lru_size:
+                self._recent.popitem(last=False)
+            self._bloom.add(signature)
+            self._count += 1
+            if self._count > self.bloom_capacity:
+                logger.warning("⚠️ Filtro de signatures por encima de su capacidad; reconstruir al reiniciar")
+
+    def get_metrics(self):
+        with self._lock:
+            return {
+                'recent_signatures': len(self._recent),
+                'bloom_entries': self._count,
+                'bloom_capacity': self.bloom_capacity,
+                'fast_path': self.fast_path,
+                'duplicates_rejected': self.duplicates_rejected,
+                'db_lookups': self.db_lookups,
+                'db_lookups_skipped': self.db_lookups_skipped
+            }
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servicio de firma de lotes de pago en un pool de procesos
+La firma ed25519 y la serialización de transacciones son trabajo de CPU; con
+un pool de procesos una ráfaga de retiros (p. ej. al terminar un torneo) usa
+todos los núcleos. Cada proceso carga el keypair custodial una sola vez, al
+arrancar, directamente desde su entorno: la clave nunca viaja por el pool.
+
+Los procesos se crean con 'spawn': hacer fork de la aplicación, que ya tiene
+hilos (workers de webhooks, timers, pool de SQLAlchemy, SocketIO), puede dejar
+al hijo bloqueado en un lock que tenía otro hilo en el momento del fork.
+"""
+
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from payout_builder import load_custodial_keypair, build_transfer_transaction
+
+logger = logging.getLogger(__name__)
+
+# Keypair del proceso worker, cargado por el initializer
+_worker_keypair = None
+
+
+def _init_worker():
+    global _worker_keypair
+    _worker_keypair = load_custodial_keypair()
+
+
+def _sign_batch(transfers, recent_blockhash, compute_unit_price):
+    return build_transfer_transaction(_worker_keypair, transfers, recent_blockhash, compute_unit_price)
+
+
+class SigningService:
+    """Firma lotes de transferencias en paralelo"""
+
+    def __init__(self, workers=None, timeout=None):
+        self.workers = workers or int(os.getenv('SIGNING_WORKERS', os.cpu_count() or 1))
+        self.timeout = timeout or float(os.getenv('SIGNING_TIMEOUT', 30))
+        self._executor = None
+        self._lock = threading.Lock()
+
+        # Métricas
+        self.batches_signed = 0
+        self.transfers_signed = 0
+        self.timeouts = 0
+        self.broken_pools = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+                print(f"✍️ Pool de firma iniciado con {self.workers} procesos")
+            return self._executor
+
+    def sign_batches(self, batches, recent_blockhash, compute_unit_price=None):
+        """
+        Firma varios lotes [(destino, lamports), ...] con el mismo blockhash.
+        Devuelve [(firma, bytes serializados), ...] en el mismo orden.
+        Si un lote tarda más de SIGNING_TIMEOUT segundos se lanza TimeoutError, y
+        si un proceso muere se lanza BrokenProcessPool. En ambos casos el pool se
+        descarta: el siguiente intento arranca procesos nuevos.
+        """
+        if not batches:
+            return []
+        executor = self._get_executor()
+        deadline = time.monotonic() + self.timeout
+        try:
+            futures = [executor.submit(_sign_batch, transfers, recent_blockhash, compute_unit_price)
+                       for transfers in batches]
+            results = [future.result(timeout=max(deadline - time.monotonic(), 0)) for future in futures]
+        except TimeoutError:
+            logger.error(f"Firma de lotes sin respuesta tras {self.timeout}s: se reinicia el pool")
+            self._discard_executor(executor, timed_out=True)
+            raise
+        except BrokenProcessPool:
+            logger.error("Un proceso del pool de firma terminó de forma abrupta: se reinicia el pool")
+            self._discard_executor(executor)
+            raise
+        with self._lock:
+            self.batches_signed += len(batches)
+            self.transfers_signed += sum(len(transfers) for transfers in batches)
+        return results
+
+    def _discard_executor(self, executor, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.broken_pools += 1
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def get_metrics(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'started': self._executor is not None,
+                'timeout': self.timeout,
+                'timeouts': self.timeouts,
+                'broken_pools': self.broken_pools,
+                'batches_signed': self.batches_signed,
+                'transfers_signed': self.transfers_signed
+            }
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Fixtures comunes
+- memory_engine: SQLite en memoria (una conexión compartida) para probar los
+  módulos por separado.
+- mock_helius: mock_helius_server.py en un puerto libre.
+- app_module: app.py importado contra el mock y una base SQLite temporal (los
+  hilos de fondo de la app necesitan conexiones reales, no una en memoria).
+  SecurityManager y AuditArchiver abren 'casino.db' relativo al directorio de
+  trabajo, así que la sesión corre en un directorio temporal.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import importlib
+
+import pytest
+import requests
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.pool import StaticPool
+
+import mock_helius_server
+
+
+@pytest.fixture
+def memory_engine():
+    engine = create_engine('sqlite://', poolclass=StaticPool,
+                           connect_args={'check_same_thread': False})
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(scope='session')
+def mock_helius():
+    server = mock_helius_server.create_server('127.0.0.1', 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope='session')
+def custodial_keypair():
+    from solders.keypair import Keypair
+    return Keypair()
+
+
+@pytest.fixture(scope='session')
+def app_module(mock_helius, custodial_keypair, tmp_path_factory):
+    workdir = tmp_path_factory.mktemp('workdir')
+    # No se restaura al terminar: los hilos de la app viven hasta el fin del proceso
+    os.chdir(workdir)
+    db_path = workdir / 'game.db'
+    os.environ.update({
+        'DB_URL': f'sqlite:///{db_path}',
+        'HELIUS_API_KEY': 'test',
+        'HELIUS_API_URL': f'{mock_helius}/v0',
+        'HELIUS_RPC_URL': mock_helius,
+        'CUSTODIAL_ADDRESS': str(custodial_keypair.pubkey()),
+        'CUSTODIAL_WALLET_SEED': json.dumps(list(bytes(custodial_keypair))),
+        # El worker de retiros solo corre al encolar (notify); los tests lo esperan
+        'WITHDRAWAL_POLL_INTERVAL': '3600',
+        'WITHDRAWAL_FLUSH_WINDOW': '0',
+        'AUDIT_ARCHIVE_DIR': str(workdir / 'audit_archive'),
+    })
+    if 'app' in sys.modules:
+        return sys.modules['app']
+    return importlib.import_module('app')
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def wait_for():
+    def wait(predicate, timeout=30, interval=0.1):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            value = predicate()
+            if value:
+                return value
+            time.sleep(interval)
+        raise AssertionError('Tiempo de espera agotado')
+    return wait
+
+
+@pytest.fixture
+def new_wallet():
+    from solders.keypair import Keypair
+    return lambda: str(Keypair().pubkey())
+
+
+@pytest.fixture
+def profile_chips(app_module):
+    """Fichas de la wallet leídas de la base de datos (sin la caché de perfiles)"""
+    def read(wallet_address):
+        app_module.profile_cache.invalidate(wallet_address)
+        return app_module.load_profile(wallet_address)['chips']
+    return read
+
+
+@pytest.fixture
+def ledger_balance(app_module):
+    return lambda wallet_address: app_module.chip_ledger.balance(app_module.player_account(wallet_address))['balance']
+
+
+@pytest.fixture
+def deposit_tx(mock_helius, custodial_keypair):
+    """Depósito on-chain en el mock; devuelve la transacción enhanced"""
+    def make(from_address, sol):
+        response = requests.post(f'{mock_helius}/mock/deposit', json={
+            'from': from_address, 'to': str(custodial_keypair.pubkey()),
+            'sol': sol, 'deliver_webhook': False
+        }, timeout=5)
+        response.raise_for_status()
+        return response.json()['transaction']
+    return make
+
+
+@pytest.fixture
+def deposit_rows(app_module):
+    """Filas de depósito con la signature dada en user_transactions"""
+    def count(signature):
+        table = app_module.UserTransaction.__table__
+        with app_module.engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(table)
+                                .where(table.c.signature == signature)
+                                .where(table.c.transaction_type == 'deposit')).scalar()
+    return count
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""Archivo diario de audit_logs: rotación idempotente y consultas acotadas por fecha"""
+
+import os
+import gzip
+import json
+import sqlite3
+
+import pytest
+
+from audit_archive import AuditArchiver, AUDIT_COLUMNS
+
+SCHEMA = '''
+    CREATE TABLE audit_logs (
+        id INTEGER PRIMARY KEY,
+        wallet_address VARCHAR(50),
+        action VARCHAR(50) NOT NULL,
+        details TEXT,
+        ip_address VARCHAR(45),
+        user_agent TEXT,
+        risk_level VARCHAR(20) DEFAULT 'low',
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+@pytest.fixture
+def archiver(tmp_path):
+    db_path = str(tmp_path / 'audit.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute(SCHEMA)
+    conn.commit()
+    conn.close()
+    return AuditArchiver(db_path=db_path, archive_dir=str(tmp_path / 'archive'), hot_days=7)
+
+
+def insert_logs(archiver, rows):
+    """rows: [(id, wallet, action, created_at), ...]"""
+    conn = sqlite3.connect(archiver.db_path)
+    conn.executemany('INSERT INTO audit_logs (id, wallet_address, action, details, ip_address, user_agent, '
+                     'risk_level, created_at) VALUES (?, ?, ?, NULL, NULL, NULL, ?, ?)',
+                     [(id_, wallet, action, 'low', created_at) for id_, wallet, action, created_at in rows])
+    conn.commit()
+    conn.close()
+
+
+def hot_ids(archiver):
+    conn = sqlite3.connect(archiver.db_path)
+    try:
+        return [row[0] for row in conn.execute('SELECT id FROM audit_logs ORDER BY id')]
+    finally:
+        conn.close()
+
+
+def archived_ids(archiver, day):
+    with gzip.open(archiver.partition_path(day), 'rt', encoding='utf-8') as archive:
+        return [json.loads(line)['id'] for line in archive if line.strip()]
+
+
+DAY = '2025-01-10'
+ROWS = [(1, 'w1', 'login', f'{DAY} 08:00:00'), (2, 'w2', 'withdraw', f'{DAY} 09:00:00'),
+        (3, 'w1', 'login', '2025-01-11 00:00:00')]
+
+
+def test_archive_partition_moves_one_day(archiver):
+    insert_logs(archiver, ROWS)
+    assert archiver.cold_partitions() == [DAY, '2025-01-11']
+
+    assert archiver.archive_partition(DAY) == 2
+    assert archived_ids(archiver, DAY) == [1, 2]
+    assert hot_ids(archiver) == [3]
+    entry = next(archiver.scan_archive(wallet_address='w2'))
+    assert set(entry) == set(AUDIT_COLUMNS)
+    assert entry['action'] == 'withdraw'
+
+
+def test_rerun_after_crash_before_delete_does_not_duplicate(archiver):
+    insert_logs(archiver, ROWS[:2])
+    archiver.archive_partition(DAY)
+    # Caída entre el renombrado y el DELETE: las filas siguen en la tabla
+    insert_logs(archiver, ROWS[:2])
+
+    assert archiver.archive_partition(DAY) == 0
+    assert archived_ids(archiver, DAY) == [1, 2]
+    assert hot_ids(archiver) == []
+
+
+def test_later_rows_are_appended_to_existing_partition(archiver):
+    insert_logs(archiver, ROWS[:1])
+    archiver.archive_partition(DAY)
+    insert_logs(archiver, [(5, 'w1', 'logout', f'{DAY} 23:59:59')])
+
+    assert archiver.archive_partition(DAY) == 1
+    assert archived_ids(archiver, DAY) == [1, 5]
+    assert os.listdir(archiver.archive_dir) == [f'audit_{DAY}.jsonl.gz']
+
+
+def test_rotate_archives_every_cold_day(archiver):
+    insert_logs(archiver, ROWS)
+    assert archiver.rotate() == 3
+    assert archiver.archived_days() == [DAY, '2025-01-11']
+    assert archiver.archived_days(since='2025-01-11') == ['2025-01-11']
+    assert hot_ids(archiver) == []
+
+
+def test_get_audit_logs_only_reads_archive_days_in_range(app_module, archiver, monkeypatch):
+    security_manager = app_module.security_manager
+    insert_logs(archiver, [(n, 'w-range', 'login', f'2025-02-0{n} 12:00:00') for n in range(1, 6)])
+    archiver.rotate()
+
+    scanned = []
+    scan_archive = archiver.scan_archive
+
+    def recording_scan(*args, **kwargs):
+        scanned.append(kwargs['since'])
+        return scan_archive(*args, **kwargs)
+
+    monkeypatch.setattr(archiver, 'scan_archive', recording_scan)
+    monkeypatch.setattr(security_manager, 'audit_archiver', archiver)
+
+    logs = security_manager.get_audit_logs('w-range', include_archive=True, since='2025-02-03', until='2025-02-04')
+    assert [log['created_at'] for log in logs] == ['2025-02-04 12:00:00', '2025-02-03 12:00:00']
+    assert scanned == ['2025-02-04', '2025-02-03']
+
+    # Sin since solo se miran los últimos AUDIT_ARCHIVE_LOOKBACK_DAYS días
+    scanned.clear()
+    assert security_manager.get_audit_logs('w-range', include_archive=True) == []
+    assert scanned == []
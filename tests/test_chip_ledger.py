@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""Libro mayor: asientos balanceados, saldos con checkpoint y auditoría"""
+
+import pytest
+from sqlalchemy import update
+
+from chip_ledger import ChipLedger, HOUSE, CUSTODIAL, player_account, pot_account, ledger_checkpoints
+
+
+@pytest.fixture
+def ledger(memory_engine):
+    return ChipLedger(memory_engine, checkpoint_interval=3600, chunk_size=2)
+
+
+def post(ledger, lines, entry_type='game', reference=None):
+    with ledger.engine.begin() as conn:
+        return ledger.post(conn, lines, entry_type, reference)
+
+
+def test_unbalanced_entry_is_rejected(ledger):
+    with pytest.raises(ValueError):
+        post(ledger, [(HOUSE, -10), (player_account('w1'), 9)])
+    assert ledger.is_empty()
+
+
+def test_zero_lines_are_skipped(ledger):
+    assert post(ledger, [(HOUSE, 0), (player_account('w1'), 0)]) is None
+    assert ledger.is_empty()
+
+
+def test_balance_checkpoint_and_tail(ledger):
+    alice, bob = player_account('alice'), player_account('bob')
+    post(ledger, [(HOUSE, -100), (alice, 100)], 'grant')
+    post(ledger, [(HOUSE, -100), (bob, 100)], 'grant')
+    post(ledger, [(CUSTODIAL, -1_000), (alice, 1_000)], 'deposit', reference='sig-1')
+
+    assert ledger.checkpoint() == 4  # house, custodial, alice y bob, en bloques de 2
+    checkpoint_id = ledger.last_checkpoint['entry_id']
+
+    post(ledger, [(alice, -50), (pot_account('room'), 50)])
+    post(ledger, [(pot_account('room'), -50), (bob, 50)])
+
+    balance = ledger.balance(alice)
+    assert balance['balance'] == 1_050
+    assert balance['checkpoint_entry_id'] == checkpoint_id
+    assert balance['tail_entries'] == 1
+    assert ledger.balance(bob)['balance'] == 150
+    assert ledger.balance(pot_account('room'))['balance'] == 0
+    # Saldo histórico en el checkpoint
+    assert ledger.balance(alice, as_of_entry_id=checkpoint_id)['balance'] == 1_100
+
+    # Un segundo checkpoint solo escribe las cuentas que cambiaron (alice, bob, pot)
+    assert ledger.checkpoint() == 3
+    assert ledger.checkpoint() == 0
+    assert ledger.balance(alice)['tail_entries'] == 0
+    assert ledger.balance(alice)['balance'] == 1_050
+
+
+def test_open_balances_posts_against_house(ledger):
+    balances = [(player_account(f'w{n}'), 100 * n) for n in range(5)]
+    assert ledger.open_balances(balances) == 4  # el saldo cero no se asienta
+    assert ledger.balance(HOUSE)['balance'] == -1_000
+    assert ledger.balance(player_account('w3'))['balance'] == 300
+    assert ledger.audit()['balanced']
+
+
+def test_iter_balances_by_prefix(ledger):
+    post(ledger, [(HOUSE, -30), (player_account('a'), 10), (player_account('b'), 20)], 'grant')
+    assert dict(ledger.iter_balances(prefix='player:')) == {player_account('a'): 10, player_account('b'): 20}
+
+
+def test_audit_detects_checkpoint_mismatch(ledger):
+    alice = player_account('alice')
+    post(ledger, [(HOUSE, -100), (alice, 100)], 'grant')
+    ledger.checkpoint()
+
+    audit = ledger.audit()
+    assert audit['balanced'] is True
+    assert audit['total'] == 0
+    assert audit['checkpoint_mismatches'] == []
+
+    with ledger.engine.begin() as conn:
+        conn.execute(update(ledger_checkpoints).where(ledger_checkpoints.c.account == alice).values(balance=90))
+    mismatches = ledger.audit()['checkpoint_mismatches']
+    assert mismatches == [{'account': alice, 'checkpoint': 90, 'entries': 100}]
+
+
+def test_game_sync_applies_delta_against_pot(app_module, client, new_wallet, profile_chips, ledger_balance):
+    wallet = new_wallet()
+    client.post('/api/user/profile', json={'wallet_address': wallet, 'username': f'u_{wallet[:8]}'})
+    player = app_module.Player('sid', f'u_{wallet[:8]}', 100)
+
+    # Un depósito durante la partida no se pisa al sincronizar
+    db = app_module.SessionLocal()
+    app_module.credit_chips(db, wallet, 500)
+    app_module.chip_ledger.post(db, [(CUSTODIAL, -500), (player_account(wallet), 500)], 'deposit')
+    db.commit()
+    db.close()
+
+    player.chips -= 30
+    app_module.sync_all_players_chips([player], 'room-sync')
+    player.chips += 10
+    app_module.sync_all_players_chips([player], 'room-sync')
+
+    assert profile_chips(wallet) == 580
+    assert ledger_balance(wallet) == 580
+    assert app_module.chip_ledger.balance(pot_account('room-sync'))['balance'] == 20
+    with pytest.raises(ValueError):
+        app_module.sync_all_players_chips([player], None)
+
+
+class RecordingConnection:
+    def __init__(self, dialect_name):
+        self.dialect = type('Dialect', (), {'name': dialect_name})()
+        self.statements = []
+
+    def execute(self, statement):
+        self.statements.append(str(statement))
+
+
+def test_checkpoint_locks_out_writers_on_postgresql(ledger):
+    conn = RecordingConnection('postgresql')
+    assert ledger._lock_entries(conn)
+    assert conn.statements == ['LOCK TABLE ledger_entries IN SHARE MODE']
+
+    # Sin un bloqueo equivalente no se arriesga un checkpoint por detrás de una transacción abierta
+    conn = RecordingConnection('mysql')
+    assert not ledger._lock_entries(conn)
+    assert conn.statements == []
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""Mutaciones atómicas de fichas"""
+
+
+def test_apply_chip_delta_never_goes_negative(app_module, client, new_wallet, profile_chips):
+    wallet = new_wallet()
+    assert client.post('/api/user/profile', json={'wallet_address': wallet}).status_code == 200
+
+    db = app_module.SessionLocal()
+    try:
+        assert app_module.apply_chip_delta(db, wallet, -101) is None
+        assert app_module.apply_chip_delta(db, wallet, -100) == 0
+        assert app_module.apply_chip_delta(db, wallet, -1) is None
+        assert app_module.apply_chip_delta(db, new_wallet(), 10) is None  # perfil inexistente
+        db.commit()
+    finally:
+        db.close()
+    assert profile_chips(wallet) == 0
+
+
+def test_profile_update_sets_chips_and_posts_adjustment(client, new_wallet, profile_chips, ledger_balance):
+    wallet = new_wallet()
+    created = client.post('/api/user/profile', json={'wallet_address': wallet, 'username': 'ana'})
+    assert created.get_json()['game_tokens'] == 100
+
+    response = client.post('/api/user/profile', json={'wallet_address': wallet, 'chips': 750, 'username': 'bea'})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['game_tokens'], body['username']) == (750, 'bea')
+    assert profile_chips(wallet) == 750
+    assert ledger_balance(wallet) == 750
+
+
+def test_profile_rejects_invalid_chips(client, new_wallet, profile_chips):
+    wallet = new_wallet()
+    client.post('/api/user/profile', json={'wallet_address': wallet})
+    for chips in (-5, '10', 1.5, True):
+        response = client.post('/api/user/profile', json={'wallet_address': wallet, 'chips': chips})
+        assert response.status_code == 400
+    assert profile_chips(wallet) == 100
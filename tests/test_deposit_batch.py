@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Depósitos por lote de un webhook enhanced contra el mock de Helius"""
+
+from sqlalchemy import event
+
+
+def test_batch_credits_each_signature_once(app_module, deposit_tx, deposit_rows, new_wallet,
+                                           profile_chips, ledger_balance):
+    wallet = new_wallet()
+    first = deposit_tx(wallet, 0.01)
+    second = deposit_tx(wallet, 0.02)
+
+    # La misma signature dos veces en el payload solo se acredita una vez
+    assert app_module.process_webhook_transactions_batch([first, first, second]) == 2
+    assert deposit_rows(first['signature']) == 1
+    assert deposit_rows(second['signature']) == 1
+    # Perfil nuevo: 100 fichas iniciales + 1 000 + 2 000
+    assert profile_chips(wallet) == 3_100
+    assert ledger_balance(wallet) == 3_100
+
+
+def test_batch_credits_several_wallets(app_module, deposit_tx, new_wallet, profile_chips, ledger_balance):
+    wallets = [new_wallet() for _ in range(3)]
+    txs = [deposit_tx(wallet, 0.01 * (n + 1)) for n, wallet in enumerate(wallets)]
+    txs.append(deposit_tx(wallets[0], 0.05))
+
+    assert app_module.process_webhook_transactions_batch(txs) == 4
+    assert [profile_chips(wallet) for wallet in wallets] == [6_100, 2_100, 3_100]
+    assert [ledger_balance(wallet) for wallet in wallets] == [6_100, 2_100, 3_100]
+
+
+def test_batch_falls_back_when_signature_was_credited_elsewhere(app_module, deposit_tx, deposit_rows, new_wallet,
+                                                                profile_chips, ledger_balance, monkeypatch):
+    """Si otra vía acreditó una signature del lote, el índice único lo detecta"""
+    wallet = new_wallet()
+    credited = deposit_tx(wallet, 0.01)
+    fresh = deposit_tx(wallet, 0.03)
+    assert app_module.auto_process_deposit(wallet, 0.01, credited['signature']) is True
+
+    # Simular que la caché no lo sabe: el lote choca con el índice y reprocesa uno a uno
+    app_module.signature_cache._recent.clear()
+    monkeypatch.setattr(app_module.signature_cache, 'needs_db_check', lambda signature: False)
+    assert app_module.process_webhook_transactions_batch([credited, fresh]) == 1
+
+    assert deposit_rows(credited['signature']) == 1
+    assert deposit_rows(fresh['signature']) == 1
+    assert profile_chips(wallet) == 4_100
+    assert ledger_balance(wallet) == 4_100
+
+
+def test_batch_uses_one_statement_per_table(app_module, client, deposit_tx, new_wallet, profile_chips,
+                                            ledger_balance):
+    known, other_known, fresh = new_wallet(), new_wallet(), new_wallet()
+    for wallet in (known, other_known):
+        assert client.post('/api/user/profile', json={'wallet_address': wallet}).status_code == 200
+    txs = [deposit_tx(known, 0.01), deposit_tx(other_known, 0.02), deposit_tx(fresh, 0.03), deposit_tx(known, 0.04)]
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split('(')[0].split(' SET ')[0].strip())
+
+    event.listen(app_module.engine, 'before_cursor_execute', record)
+    try:
+        assert app_module.process_webhook_transactions_batch(txs) == 4
+    finally:
+        event.remove(app_module.engine, 'before_cursor_execute', record)
+
+    writes = [statement for statement in statements if not statement.startswith('SELECT')]
+    assert writes.count('UPDATE user_profiles') == 1
+    assert writes.count('INSERT INTO user_profiles') == 1
+    assert writes.count('INSERT INTO ledger_entries') == 1
+    assert [profile_chips(wallet) for wallet in (known, other_known, fresh)] == [5_100, 2_100, 3_100]
+    assert [ledger_balance(wallet) for wallet in (known, other_known, fresh)] == [5_100, 2_100, 3_100]
+    assert app_module.chip_ledger.audit()['balanced']
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""Contadores materializados de depósitos"""
+
+from sqlalchemy import Table, Column, Integer, String, Float, DateTime, MetaData, select
+
+from deposit_metrics import DepositMetrics, deposit_metrics as deposit_metrics_table
+
+
+def saved_totals(engine):
+    with engine.connect() as conn:
+        row = conn.execute(select(deposit_metrics_table).where(deposit_metrics_table.c.id == 1)).first()
+        return row.total_processed, row.total_chips
+
+
+def test_deposit_metrics_count_recorded_deposits(app_module, deposit_tx, new_wallet):
+    before = app_module.deposit_metrics.get_metrics()['total_processed']
+    saved_before = saved_totals(app_module.engine)
+    wallet = new_wallet()
+    txs = [deposit_tx(wallet, 0.01) for _ in range(3)]
+    assert app_module.process_webhook_transactions_batch(txs) == 3
+
+    assert app_module.deposit_metrics.get_metrics()['total_processed'] == before + 3
+    # Los totales guardados se actualizaron en la misma transacción que los depósitos
+    processed, chips = saved_totals(app_module.engine)
+    assert processed == saved_before[0] + 3
+    assert chips == saved_before[1] + 3 * 1_000
+
+    # Un arranque nuevo parte de los totales guardados, sin marca de agua
+    restarted = DepositMetrics(app_module.engine, app_module.UserTransaction.__table__)
+    restarted.load()
+    assert restarted.get_metrics()['total_processed'] == processed
+
+
+def test_rolled_back_deposit_is_not_counted(memory_engine):
+    transactions = Table('user_transactions', MetaData(), Column('id', Integer, primary_key=True),
+                         Column('transaction_type', String(20)), Column('amount', Float),
+                         Column('created_at', DateTime))
+    transactions.metadata.create_all(bind=memory_engine)
+    metrics = DepositMetrics(memory_engine, transactions)
+    metrics.load()
+
+    with memory_engine.begin() as conn:
+        conn.execute(metrics.build_update(2, 500, when=100.0))
+    try:
+        with memory_engine.begin() as conn:
+            conn.execute(metrics.build_update(1, 70, when=50.0))
+            raise RuntimeError('el depósito falla antes del commit')
+    except RuntimeError:
+        pass
+
+    assert saved_totals(memory_engine) == (2, 500)
+    metrics.load()
+    snapshot = metrics.get_metrics()
+    assert (snapshot['total_processed'], snapshot['total_chips']) == (2, 500)
+    assert snapshot['last_activity'] == '1970-01-01T00:01:40'
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Parser de transacciones enhanced y decodificación incremental del array JSON"""
+
+import json
+
+import pytest
+
+from helius_parser import iter_json_array, iter_parse_transactions, parse_transaction, TYPE_SOL, TYPE_TOKEN
+
+WALLET = '7xKXtg2CW87d97TXJSDpbD5jBkheTqA83TZRuJosgAsU'
+OTHER = '9WzDXwBbmkg8ZTbNMqUxvQRAyrZzDsGYdLVL9zYtAWWM'
+MINT = 'EPjFWdd5AufqSSqeM2qN1xzybapC8G4wEGGkZwyTDt1v'
+
+# Página de /v0/addresses/<wallet>/transactions tal como la devuelve Helius
+HELIUS_PAGE = [
+    {
+        'description': f'{WALLET} transferred 0.5 SOL to {OTHER}.',
+        'type': 'TRANSFER',
+        'source': 'SYSTEM_PROGRAM',
+        'fee': 5000,
+        'feePayer': WALLET,
+        'signature': '5h6xBEauJ3PK6SWCZ1PGjBvj8vDdWG3KpwATGy1ARAXFSDwt8GFXM7W5Ncn16wmqokgpiKRLuS83KUxyZyv2sUYv',
+        'slot': 171942732,
+        'timestamp': 1673445241,
+        'tokenTransfers': [],
+        'nativeTransfers': [{'fromUserAccount': WALLET, 'toUserAccount': OTHER, 'amount': 500_000_000}],
+        'accountData': [
+            {'account': WALLET, 'nativeBalanceChange': -500_005_000, 'tokenBalanceChanges': []},
+            {'account': OTHER, 'nativeBalanceChange': 500_000_000, 'tokenBalanceChanges': []},
+        ],
+        'transactionError': None,
+        'instructions': [{'accounts': [WALLET, OTHER], 'data': '3Bxs411Dtc7pkFQj',
+                          'programId': '11111111111111111111111111111111', 'innerInstructions': []}],
+        'events': {},
+    },
+    {
+        'description': 'Pago de \"torneo\" — ñandú \\ barra, emoji 🎲 y é',
+        'type': 'TRANSFER',
+        'source': 'SOLANA_PROGRAM_LIBRARY',
+        'fee': 10000,
+        'feePayer': OTHER,
+        'signature': '2nBhEBYYvfaAe16UMNqRHre4YNSskvuYgx3M6E4JP1oDYvZEJHvoPzyUidNgNX5r9sTyN1J9UxtbCXy2rqYcuyuv',
+        'slot': 171942800,
+        'timestamp': 1673445300,
+        'tokenTransfers': [{'fromTokenAccount': 'A' * 44, 'toTokenAccount': 'B' * 44,
+                            'fromUserAccount': OTHER, 'toUserAccount': WALLET,
+                            'tokenAmount': 12.5, 'mint': MINT, 'tokenStandard': 'Fungible'}],
+        'nativeTransfers': [],
+        'accountData': [{'account': WALLET, 'nativeBalanceChange': 0, 'tokenBalanceChanges': [
+            {'userAccount': WALLET, 'tokenAccount': 'B' * 44, 'mint': MINT,
+             'rawTokenAmount': {'tokenAmount': '12500000', 'decimals': 6}}]}],
+        'transactionError': {'error': 'custom program error: 0x1'},
+        'instructions': [],
+        'events': {'compressed': None, 'nested': [[1, 2.5e-3, [True, False, None]], {'a': {'b': {'c': []}}}]},
+    },
+]
+
+
+def split_at(data, *cuts):
+    bounds = (0, *cuts, len(data))
+    return [data[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+def decode(chunks):
+    return list(iter_json_array(chunks))
+
+
+def test_matches_json_loads_on_helius_page():
+    payload = json.dumps(HELIUS_PAGE).encode('utf-8')
+    assert decode([payload]) == json.loads(payload)
+
+
+@pytest.mark.parametrize('indent', [None, 2])
+def test_every_two_chunk_split_matches_json_loads(indent):
+    """Cortes dentro de strings, escapes, caracteres multibyte y objetos anidados"""
+    payload = json.dumps(HELIUS_PAGE, ensure_ascii=False, indent=indent).encode('utf-8')
+    expected = json.loads(payload)
+    for cut in range(1, len(payload)):
+        assert decode(split_at(payload, cut)) == expected, f'corte en el byte {cut}'
+
+
+def test_byte_by_byte_chunks():
+    payload = json.dumps(HELIUS_PAGE, ensure_ascii=False).encode('utf-8')
+    assert decode(payload[i:i + 1] for i in range(len(payload))) == HELIUS_PAGE
+
+
+def test_escape_split_across_chunks():
+    payload = b'[{"s": "a\\"b\\\\c\\u00e9"}]'
+    backslash = payload.index(b'\\')
+    unicode_escape = payload.index(b'\\u')
+    assert decode(split_at(payload, backslash + 1, unicode_escape + 3)) == [{'s': 'a"b\\cé'}]
+
+
+def test_number_split_across_chunks():
+    assert decode([b'[12', b'34, 5', b'.5e', b'1]']) == [1234, 55.0]
+    assert decode([b'[tr', b'ue, nu', b'll]']) == [True, None]
+
+
+@pytest.mark.parametrize('chunks', [[b'[]'], [b'  [ \n ]  '], [b'[', b']'], [b'', b'[', b'', b']']])
+def test_empty_array(chunks):
+    assert decode(chunks) == []
+
+
+def test_items_are_yielded_before_the_array_ends():
+    def chunks():
+        yield b'[{"a": 1},'
+        raise AssertionError('no debería pedir más datos antes de devolver el primer elemento')
+
+    items = iter_json_array(chunks())
+    assert next(items) == {'a': 1}
+
+
+@pytest.mark.parametrize('chunks', [
+    [],
+    [b''],
+    [b'[{"a": 1}'],
+    [b'[{"a": 1},'],
+    [b'[{"a": ', b'1'],
+    [b'["sin cerrar'],
+])
+def test_truncated_input(chunks):
+    with pytest.raises(ValueError):
+        decode(chunks)
+
+
+@pytest.mark.parametrize('payload', [
+    b'{"a": 1}',
+    b'[1 2]',
+    b'[1,,2]',
+    b'[1,]',
+    b'[,1]',
+    b'[{"a": 1}}]',
+    b'[nope]',
+])
+def test_invalid_input(payload):
+    with pytest.raises(ValueError):
+        decode([payload])
+
+
+def test_streaming_parse_matches_single_parse():
+    payload = json.dumps(HELIUS_PAGE).encode('utf-8')
+    streamed = list(iter_parse_transactions(split_at(payload, 100, 700, 1500), WALLET))
+    direct = [parse_transaction(tx, WALLET) for tx in HELIUS_PAGE]
+    assert [repr(tx) for tx in streamed] == [repr(tx) for tx in direct]
+
+    sent, received = streamed
+    assert (sent.transaction_type, sent.lamports, sent.amount, sent.status) == (TYPE_SOL, -500_000_000, -0.5, 'success')
+    assert (received.transaction_type, received.token_amount, received.lamports) == (TYPE_TOKEN, 12.5, None)
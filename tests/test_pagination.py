@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Cursores de paginación por clave y totales cacheados"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from pagination import encode_cursor, decode_cursor, keyset_page, page_size, CountCache, MAX_PAGE_SIZE
+
+Base = declarative_base()
+
+
+class Row(Base):
+    __tablename__ = 'rows'
+    id = Column(Integer, primary_key=True)
+    wallet_address = Column(String(50))
+    created_at = Column(DateTime)
+
+
+@pytest.fixture
+def session(memory_engine):
+    Base.metadata.create_all(bind=memory_engine)
+    db = sessionmaker(bind=memory_engine)()
+    start = datetime(2025, 1, 1)
+    # Dos filas por instante para probar el desempate por id
+    db.add_all(Row(id=n, wallet_address='w', created_at=start + timedelta(seconds=n // 2)) for n in range(1, 12))
+    db.commit()
+    yield db
+    db.close()
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2025, 3, 4, 5, 6, 7, 890123)
+    assert decode_cursor(encode_cursor(created_at, 42)) == (created_at, 42)
+
+
+@pytest.mark.parametrize('cursor', ['', 'no-es-base64!', encode_cursor(datetime(2025, 1, 1), 1)[:-3], 'WzFd'])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_page_size_bounds():
+    assert page_size(None) == 20
+    assert page_size(0, default=5) == 5
+    assert page_size(-3) == 1
+    assert page_size(10 ** 6) == MAX_PAGE_SIZE
+
+
+def test_keyset_pages_cover_all_rows_once(session):
+    query = session.query(Row).filter(Row.wallet_address == 'w')
+    seen = []
+    cursor = None
+    pages = 0
+    while True:
+        rows, cursor = keyset_page(query, Row.created_at, Row.id, cursor, limit=3)
+        seen.extend(row.id for row in rows)
+        pages += 1
+        if cursor is None:
+            break
+    assert seen == list(range(11, 0, -1))
+    assert pages == 4
+
+
+def test_keyset_exact_multiple_has_no_empty_last_page(session):
+    query = session.query(Row).filter(Row.id <= 6)
+    rows, cursor = keyset_page(query, Row.created_at, Row.id, None, limit=3)
+    assert [row.id for row in rows] == [6, 5, 4]
+    rows, cursor = keyset_page(query, Row.created_at, Row.id, cursor, limit=3)
+    assert [row.id for row in rows] == [3, 2, 1]
+    assert cursor is None
+
+
+def test_keyset_ties_on_created_at(session):
+    # ids 4 y 5 comparten created_at: el cursor en 5 debe continuar en 4
+    query = session.query(Row)
+    row5 = session.get(Row, 5)
+    rows, _ = keyset_page(query, Row.created_at, Row.id, encode_cursor(row5.created_at, 5), limit=2)
+    assert [row.id for row in rows] == [4, 3]
+
+
+def test_count_cache_hits_and_invalidation():
+    cache = CountCache(ttl=60)
+    counts = iter([3, 4])
+    assert cache.get('w', 'all', lambda: next(counts)) == 3
+    assert cache.get('w', 'all', lambda: next(counts)) == 3
+    cache.invalidate('w')
+    assert cache.get('w', 'all', lambda: next(counts)) == 4
+    assert cache.get_metrics()['hits'] == 1
+
+
+def test_count_cache_discards_count_overlapping_invalidation():
+    cache = CountCache(ttl=60)
+
+    def count():
+        cache.invalidate('w')  # una escritura llega mientras se cuenta
+        return 7
+
+    assert cache.get('w', 'all', count) == 7
+    assert cache.get('w', 'all', lambda: 8) == 8
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Caché de deduplicación de signatures (LRU + filtro de Bloom)"""
+
+from signature_cache import SignatureDedupCache
+
+
+def test_recent_signature_is_duplicate():
+    cache = SignatureDedupCache(lru_size=2, bloom_capacity=100)
+    cache.add('a')
+    assert cache.is_duplicate('a')
+    assert not cache.is_duplicate('b')
+
+
+def test_lru_evicts_but_bloom_remembers():
+    cache = SignatureDedupCache(lru_size=2, bloom_capacity=100)
+    for signature in ('a', 'b', 'c'):
+        cache.add(signature)
+    assert not cache.is_duplicate('a')
+    assert cache.needs_db_check('a')  # el Bloom lo vio: consultar la BD
+
+
+def test_unseen_signature_skips_db_check():
+    cache = SignatureDedupCache(lru_size=10, bloom_capacity=1_000)
+    cache.rebuild([f'sig-{n}' for n in range(100)], expected_count=100)
+    assert cache.needs_db_check('sig-42')
+    assert not cache.needs_db_check('nueva')
+    assert cache.get_metrics()['db_lookups_skipped'] == 1
+
+
+def test_disabled_fast_path_always_checks_db():
+    cache = SignatureDedupCache(lru_size=10, bloom_capacity=1_000)
+    cache.disable_fast_path('sin índice único')
+    assert cache.needs_db_check('nueva')
+    assert cache.get_metrics()['fast_path'] is False
+
+
+def test_replayed_deposit_is_ignored(app_module, deposit_tx, deposit_rows, new_wallet, profile_chips):
+    wallet = new_wallet()
+    tx = deposit_tx(wallet, 0.01)
+    assert app_module.process_webhook_transactions_batch([tx]) == 1
+
+    # Reintento reciente (LRU) y reintento tras vaciar la caché (Bloom + BD)
+    assert app_module.process_webhook_transactions_batch([tx]) == 0
+    app_module.signature_cache._recent.clear()
+    assert app_module.process_webhook_transactions_batch([tx]) == 0
+    assert app_module.auto_process_deposit(wallet, 0.01, tx['signature']) is False
+
+    assert deposit_rows(tx['signature']) == 1
+    assert profile_chips(wallet) == 1_100
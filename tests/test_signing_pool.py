@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""Pool de firma: un proceso muerto descarta el pool y el siguiente lote arranca otro"""
+
+import os
+import json
+import signal
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from solders.hash import Hash
+from solders.keypair import Keypair
+
+from signing_pool import SigningService
+
+
+@pytest.fixture
+def signing_service(monkeypatch, custodial_keypair):
+    # Los procesos (spawn) heredan el entorno al arrancar
+    monkeypatch.setenv('CUSTODIAL_WALLET_SEED', json.dumps(list(bytes(custodial_keypair))))
+    service = SigningService(workers=1, timeout=60)
+    yield service
+    service.shutdown()
+
+
+def test_broken_pool_is_replaced(signing_service):
+    batch = [[(str(Keypair().pubkey()), 1_000)]]
+    blockhash = str(Hash.default())
+    assert len(signing_service.sign_batches(batch, blockhash)) == 1
+
+    executor = signing_service._executor
+    for process in list(executor._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+        process.join()
+
+    with pytest.raises(BrokenProcessPool):
+        signing_service.sign_batches(batch, blockhash)
+    assert signing_service._executor is None
+    assert signing_service.get_metrics()['broken_pools'] == 1
+
+    signature, raw = signing_service.sign_batches(batch, blockhash)[0]
+    assert signing_service._executor is not executor
+    assert signature and raw
+    assert signing_service.get_metrics()['batches_signed'] == 2
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""Transiciones de webhook_inbox: done, reintento y failed"""
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+
+from webhook_queue import WebhookQueue, webhook_inbox
+
+
+def drain(webhook_queue):
+    """Un ciclo del despachador y de los workers, sin hilos"""
+    webhook_queue._dispatch_pending()
+    for index, work in enumerate(webhook_queue._worker_queues):
+        while not work.empty():
+            webhook_queue._process_unit(index, *work.get_nowait())
+
+
+def inbox_row(engine, inbox_id):
+    with engine.connect() as conn:
+        return conn.execute(select(webhook_inbox).where(webhook_inbox.c.id == inbox_id)).first()
+
+
+def payload(*signatures):
+    return {'type': 'enhanced', 'transactions': [{'signature': s} for s in signatures]}
+
+
+def test_processed_payload_is_done(memory_engine):
+    seen = []
+    webhook_queue = WebhookQueue(memory_engine, lambda txs: seen.extend(txs) or len(txs), workers=2)
+    inbox_id = webhook_queue.enqueue(payload('a', 'b', 'c'))
+
+    drain(webhook_queue)
+
+    row = inbox_row(memory_engine, inbox_id)
+    assert row.status == 'done'
+    assert row.attempts == 1
+    assert sorted(tx['signature'] for tx in seen) == ['a', 'b', 'c']
+    assert webhook_queue.processed_transactions == 3
+
+
+def test_handler_error_retries_until_max_attempts(memory_engine):
+    calls = []
+
+    def handler(transactions):
+        calls.append(transactions)
+        raise OperationalError('UPDATE', {}, Exception('database is locked'))
+
+    webhook_queue = WebhookQueue(memory_engine, handler, workers=1, max_attempts=3)
+    inbox_id = webhook_queue.enqueue(payload('a'))
+
+    for attempt in (1, 2):
+        drain(webhook_queue)
+        row = inbox_row(memory_engine, inbox_id)
+        assert row.status == 'pending'
+        assert row.attempts == attempt
+        assert row.error == 'error en worker'
+
+    drain(webhook_queue)
+    row = inbox_row(memory_engine, inbox_id)
+    assert row.status == 'failed'
+    assert row.attempts == 3
+    assert len(calls) == 3
+    assert webhook_queue.failed_payloads == 1
+
+    # Una fila fallida ya no se despacha
+    drain(webhook_queue)
+    assert len(calls) == 3
+
+
+def test_retry_succeeds_after_transient_error(memory_engine):
+    failures = [OperationalError('UPDATE', {}, Exception('database is locked'))]
+
+    def handler(transactions):
+        if failures:
+            raise failures.pop()
+        return len(transactions)
+
+    webhook_queue = WebhookQueue(memory_engine, handler, workers=1)
+    inbox_id = webhook_queue.enqueue(payload('a'))
+
+    drain(webhook_queue)
+    assert inbox_row(memory_engine, inbox_id).status == 'pending'
+    drain(webhook_queue)
+    row = inbox_row(memory_engine, inbox_id)
+    assert row.status == 'done'
+    assert row.attempts == 2
+
+
+def test_payload_goes_to_one_worker_in_one_call(memory_engine):
+    calls = []
+    webhook_queue = WebhookQueue(memory_engine, lambda txs: calls.append(txs) or len(txs), workers=4)
+    signatures = [f'sig-{n}' for n in range(20)]
+    inbox_id = webhook_queue.enqueue(payload(*signatures))
+
+    webhook_queue._dispatch_pending()
+    queued = [work.qsize() for work in webhook_queue._worker_queues]
+    assert sorted(queued) == [0, 0, 0, 1]
+    assert queued.index(1) == webhook_queue._worker_for(signatures[0])
+    for index, work in enumerate(webhook_queue._worker_queues):
+        while not work.empty():
+            webhook_queue._process_unit(index, *work.get_nowait())
+
+    assert [[tx['signature'] for tx in txs] for txs in calls] == [signatures]
+    assert inbox_row(memory_engine, inbox_id).status == 'done'
+
+
+def test_failure_retries_whole_payload(memory_engine):
+    def handler(transactions):
+        raise RuntimeError('boom')
+
+    webhook_queue = WebhookQueue(memory_engine, handler, workers=4)
+    inbox_id = webhook_queue.enqueue(payload(*[f'sig-{n}' for n in range(20)]))
+    drain(webhook_queue)
+
+    assert inbox_row(memory_engine, inbox_id).status == 'pending'
+    assert webhook_queue.processed_transactions == 0
+
+
+def test_invalid_payload_fails_without_retry(memory_engine):
+    webhook_queue = WebhookQueue(memory_engine, lambda txs: len(txs), workers=1)
+    with memory_engine.begin() as conn:
+        inbox_id = conn.execute(webhook_inbox.insert().values(
+            payload='{no es json', status='pending', attempts=0, received_at=0.0
+        )).inserted_primary_key[0]
+
+    drain(webhook_queue)
+
+    row = inbox_row(memory_engine, inbox_id)
+    assert row.status == 'failed'
+    assert row.error.startswith('payload inválido')
+
+
+def test_app_handler_propagates_database_errors(app_module, monkeypatch, custodial_keypair):
+    """process_queued_transactions no debe tragarse los errores de BD"""
+    def locked(*args, **kwargs):
+        raise OperationalError('UPDATE', {}, Exception('database is locked'))
+
+    monkeypatch.setattr(app_module, 'credit_chips_batch', locked)
+    tx = {'signature': 'sig-db-error',
+          'nativeTransfers': [{'fromUserAccount': 'F' * 44, 'toUserAccount': str(custodial_keypair.pubkey()),
+                               'amount': 10_000_000}]}
+
+    with pytest.raises(OperationalError):
+        app_module.process_queued_transactions([tx])
+    assert app_module.process_webhook_transactions_batch([tx]) == 0
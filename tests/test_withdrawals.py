@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""Retiros contra el mock de Helius: estados de la cola, reembolsos e idempotencia"""
+
+import itertools
+
+import pytest
+import requests
+from sqlalchemy import select, update
+
+from withdrawal_worker import withdrawal_queue
+
+_addresses = itertools.count(1)
+
+
+def post_withdrawal(client, wallet, destination, chip_amount=1_000, key=None):
+    # Una IP por petición: el endpoint limita 5 retiros cada 10 minutos por IP
+    headers = {'Idempotency-Key': key} if key else {}
+    return client.post('/api/withdraw/request', headers=headers,
+                       environ_base={'REMOTE_ADDR': f'10.0.0.{next(_addresses)}'},
+                       json={'wallet_address': wallet, 'chip_amount': chip_amount,
+                             'destination_address': destination})
+
+
+@pytest.fixture
+def funded_wallet(client, new_wallet):
+    def make(chips=5_000):
+        wallet = new_wallet()
+        assert client.post('/api/user/profile', json={'wallet_address': wallet}).status_code == 200
+        assert client.post('/api/user/profile', json={'wallet_address': wallet, 'chips': chips}).status_code == 200
+        return wallet
+    return make
+
+
+def user_transaction_status(app_module, transaction_id):
+    table = app_module.UserTransaction.__table__
+    with app_module.engine.connect() as conn:
+        return conn.execute(select(table.c.status).where(table.c.id == transaction_id)).scalar()
+
+
+def submitted_withdrawal(app_module, wallet, destination, chip_amount, signature, attempts):
+    """Retiro ya enviado cuya transacción nunca llegó a la cadena"""
+    db = app_module.SessionLocal()
+    try:
+        assert app_module.apply_chip_delta(db, wallet, -chip_amount) is not None
+        withdrawal_tx = app_module.UserTransaction(wallet_address=wallet, transaction_type='withdraw',
+                                                   amount=chip_amount, status='pending')
+        db.add(withdrawal_tx)
+        db.flush()
+        lamports = chip_amount * 9_500
+        app_module.chip_ledger.post(db, app_module.withdrawal_ledger_lines(wallet, chip_amount, lamports),
+                                    'withdraw', reference=str(withdrawal_tx.id))
+        db.execute(app_module.withdrawal_worker.build_insert(
+            f'key-{signature}', withdrawal_tx.id, wallet, destination, lamports, chip_amount,
+            status='submitted', signature=signature))
+        db.execute(update(withdrawal_queue).where(withdrawal_queue.c.signature == signature)
+                   .values(last_valid_block_height=0, attempts=attempts))
+        db.commit()
+        return withdrawal_tx.id
+    finally:
+        db.close()
+        app_module.profile_cache.invalidate(wallet)
+
+
+def test_withdrawal_is_signed_sent_and_confirmed(app_module, client, funded_wallet, new_wallet,
+                                                 mock_helius, wait_for, profile_chips, ledger_balance):
+    wallet, destination = funded_wallet(), new_wallet()
+
+    response = post_withdrawal(client, wallet, destination)
+    assert response.status_code == 200
+    withdrawal_id = response.get_json()['withdrawal_id']
+    assert profile_chips(wallet) == 4_000
+
+    status = wait_for(lambda: (lambda s: s if s['state'] == 'confirmed' else None)(
+        client.get(f'/api/withdraw/status/{withdrawal_id}').get_json()))
+    assert status['lamports'] == 9_500_000
+    assert user_transaction_status(app_module, withdrawal_id) == 'completed'
+
+    balances = requests.get(f'{mock_helius}/mock/ledger', timeout=5).json()['balances']
+    assert balances[destination] == 9_500_000
+    assert ledger_balance(wallet) == 4_000
+
+
+def test_failed_withdrawal_refunds_chips(app_module, funded_wallet, new_wallet, profile_chips, ledger_balance):
+    wallet = funded_wallet()
+    max_attempts = app_module.withdrawal_worker.max_attempts
+    withdrawal_id = submitted_withdrawal(app_module, wallet, new_wallet(), 1_000, 'lost-signature-1', max_attempts)
+    assert profile_chips(wallet) == 4_000
+
+    app_module.withdrawal_worker._poll_statuses()
+
+    row = app_module.withdrawal_worker.get_by_user_transaction(withdrawal_id)
+    assert row.status == 'failed'
+    assert row.error == 'intentos agotados'
+    assert user_transaction_status(app_module, withdrawal_id) == 'failed'
+    assert profile_chips(wallet) == 5_000
+    assert ledger_balance(wallet) == 5_000
+    assert app_module.chip_ledger.audit()['balanced']
+
+    # Finalizar de nuevo no reembolsa dos veces
+    app_module.withdrawal_worker._finalize('lost-signature-1', 'failed', error='repetido')
+    assert profile_chips(wallet) == 5_000
+
+
+def test_expired_withdrawal_is_requeued(app_module, funded_wallet, new_wallet, profile_chips):
+    wallet = funded_wallet()
+    withdrawal_id = submitted_withdrawal(app_module, wallet, new_wallet(), 1_000, 'lost-signature-2', 1)
+
+    app_module.withdrawal_worker._poll_statuses()
+
+    row = app_module.withdrawal_worker.get_by_user_transaction(withdrawal_id)
+    assert row.status == 'queued'
+    assert row.signature is None
+    assert row.error == 'blockhash expirado'
+    assert user_transaction_status(app_module, withdrawal_id) == 'pending'
+    assert profile_chips(wallet) == 4_000
+
+
+def test_idempotency_key_is_scoped_to_wallet(app_module, client, funded_wallet, new_wallet, wait_for,
+                                             profile_chips):
+    wallet, other_wallet, destination = funded_wallet(), funded_wallet(), new_wallet()
+
+    first = post_withdrawal(client, wallet, destination, key='same-key')
+    again = post_withdrawal(client, wallet, destination, key='same-key')
+    assert first.status_code == again.status_code == 200
+    assert first.get_json()['withdrawal_id'] == again.get_json()['withdrawal_id']
+    assert profile_chips(wallet) == 4_000
+
+    other = post_withdrawal(client, other_wallet, destination, key='same-key')
+    assert other.status_code == 409
+    assert profile_chips(other_wallet) == 5_000
+
+    # Dejar que el worker termine este retiro antes del siguiente test
+    withdrawal_id = first.get_json()['withdrawal_id']
+    wait_for(lambda: app_module.withdrawal_worker.get_by_user_transaction(withdrawal_id).status == 'confirmed')
+
+
+def test_withdrawal_rejects_insufficient_chips(client, funded_wallet, new_wallet, profile_chips):
+    wallet = funded_wallet(chips=1_500)
+    response = post_withdrawal(client, wallet, new_wallet(), chip_amount=2_000)
+    assert response.status_code == 400
+    assert profile_chips(wallet) == 1_500
+
+
+def test_withdrawal_rejects_invalid_destination(client, funded_wallet, profile_chips):
+    wallet = funded_wallet()
+    for destination in ('0' * 44, 'x' * 10, 12345):
+        response = post_withdrawal(client, wallet, destination)
+        assert response.status_code == 400
+    assert profile_chips(wallet) == 5_000
+
+
+def test_invalid_queued_destination_fails_without_blocking_batch(app_module, client, funded_wallet, new_wallet,
+                                                                 wait_for, profile_chips):
+    """Una fila con destino inválido se reembolsa y el resto del lote se firma"""
+    bad_wallet, wallet = funded_wallet(), funded_wallet()
+    db = app_module.SessionLocal()
+    try:
+        app_module.apply_chip_delta(db, bad_wallet, -1_000)
+        bad_tx = app_module.UserTransaction(wallet_address=bad_wallet, transaction_type='withdraw',
+                                            amount=1_000, status='pending')
+        db.add(bad_tx)
+        db.flush()
+        app_module.chip_ledger.post(db, app_module.withdrawal_ledger_lines(bad_wallet, 1_000, 9_500_000),
+                                    'withdraw', reference=str(bad_tx.id))
+        db.execute(app_module.withdrawal_worker.build_insert('bad-destination', bad_tx.id, bad_wallet,
+                                                             '0' * 44, 9_500_000, 1_000))
+        db.commit()
+        bad_id = bad_tx.id
+    finally:
+        db.close()
+
+    response = post_withdrawal(client, wallet, new_wallet())
+    withdrawal_id = response.get_json()['withdrawal_id']
+
+    wait_for(lambda: app_module.withdrawal_worker.get_by_user_transaction(withdrawal_id).status == 'confirmed')
+    bad_row = app_module.withdrawal_worker.get_by_user_transaction(bad_id)
+    assert bad_row.status == 'failed'
+    assert bad_row.error == 'destino o monto inválido'
+    assert user_transaction_status(app_module, bad_id) == 'failed'
+    assert profile_chips(bad_wallet) == 5_000
+
+
+def test_worker_disabled_without_custodial_seed(app_module, client, funded_wallet, new_wallet, memory_engine,
+                                                monkeypatch, profile_chips):
+    monkeypatch.delenv('CUSTODIAL_WALLET_SEED', raising=False)
+    worker = app_module.WithdrawalWorker(memory_engine, app_module.helius_client)
+    assert not worker.enabled
+    assert 'CUSTODIAL_WALLET_SEED' in worker.unavailable_reason
+
+    # La app rechaza los retiros en lugar de acumularlos en queued
+    monkeypatch.setattr(app_module.withdrawal_worker, 'unavailable_reason', worker.unavailable_reason)
+    wallet = funded_wallet()
+    response = post_withdrawal(client, wallet, new_wallet())
+    assert response.status_code == 503
+    assert profile_chips(wallet) == 5_000
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Autenticación de wallets en Socket.IO por firma de un nonce
+1. El cliente pide un desafío para su wallet; el servidor genera un nonce de
+   un solo uso ligado a la sesión (sid) y devuelve el mensaje a firmar.
+2. El cliente lo firma con la wallet (Phantom signMessage) y envía la firma.
+3. El servidor verifica la firma ed25519 contra la clave pública de la wallet
+   y solo entonces asocia la sesión a la wallet.
+Tras verificar se entrega un token firmado (HMAC) con caducidad para que las
+reconexiones no vuelvan a pedir una firma al usuario.
+"""
+
+import os
+import hmac
+import time
+import base64
+import hashlib
+import secrets
+import threading
+import logging
+
+from solders.pubkey import Pubkey
+from solders.signature import Signature
+
+logger = logging.getLogger(__name__)
+
+
+class WalletAuthenticator:
+    """Desafíos pendientes por sesión y verificación de firmas de wallet"""
+
+    def __init__(self, secret_key, nonce_ttl=None, token_ttl=None):
+        self.secret_key = secret_key.encode() if isinstance(secret_key, str) else secret_key
+        self.nonce_ttl = nonce_ttl or float(os.getenv('WALLET_AUTH_NONCE_TTL', 300))
+        self.token_ttl = token_ttl or int(os.getenv('WALLET_AUTH_TOKEN_TTL', 86400))
+        self._lock = threading.Lock()
+        self._challenges = {}  # {sid: (wallet_address, mensaje, caduca_en)}
+
+        # Métricas
+        self.verified = 0
+        self.rejected = 0
+
+    @staticmethod
+    def challenge_message(wallet_address, nonce):
+        return f"La Más Alta Gana: autenticar la wallet {wallet_address}\nNonce: {nonce}"
+
+    def issue(self, sid, wallet_address):
+        """Genera el desafío de la sesión (reemplaza al anterior) y devuelve el mensaje a firmar"""
+        message = self.challenge_message(wallet_address, secrets.token_urlsafe(24))
+        with self._lock:
+            self._challenges[sid] = (wallet_address, message, time.monotonic() + self.nonce_ttl)
+        return message
+
+    def verify(self, sid, wallet_address, signature):
+        """
+        True si signature (base64 o base58) firma el desafío pendiente de la
+        sesión para esa wallet. El desafío se consume aunque la firma falle.
+        """
+        with self._lock:
+            challenge = self._challenges.pop(sid, None)
+        if not challenge or challenge[0] != wallet_address or time.monotonic() > challenge[2]:
+            self._count(False)
+            return False
+        try:
+            pubkey = Pubkey.from_string(wallet_address)
+            valid = self._parse_signature(signature).verify(pubkey, challenge[1].encode())
+        except Exception as e:
+            logger.warning(f"Firma de wallet inválida para {wallet_address}: {e}")
+            valid = False
+        self._count(valid)
+        return valid
+
+    @staticmethod
+    def _parse_signature(signature):
+        try:
+            raw = base64.b64decode(signature, validate=True)
+            if len(raw) == 64:
+                return Signature.from_bytes(raw)
+        except ValueError:
+            pass
+        return Signature.from_string(signature)
+
+    def discard(self, sid):
+        """Olvida el desafío pendiente de una sesión desconectada"""
+        with self._lock:
+            self._challenges.pop(sid, None)
+
+    def _count(self, valid):
+        with self._lock:
+            if valid:
+                self.verified += 1
+            else:
+                self.rejected += 1
+
+    # ----------------- Tokens de sesión -----------------
+
+    def _mac(self, wallet_address, expires):
+        return hmac.new(self.secret_key, f"{wallet_address}:{expires}".encode(), hashlib.sha256).hexdigest()
+
+    def issue_token(self, wallet_address):
+        """Token wallet:caducidad:hmac para reautenticar sin firmar de nuevo"""
+        expires = int(time.time()) + self.token_ttl
+        return f"{wallet_address}:{expires}:{self._mac(wallet_address, expires)}"
+
+    def verify_token(self, wallet_address, token):
+        try:
+            token_wallet, expires, mac = token.split(':')
+            expires = int(expires)
+        except (AttributeError, ValueError):
+            return False
+        return (token_wallet == wallet_address and expires > time.time()
+                and hmac.compare_digest(mac, self._mac(wallet_address, expires)))
+
+    def get_metrics(self):
+        with self._lock:
+            return {
+                'pending_challenges': len(self._challenges),
+                'verified': self.verified,
+                'rejected': self.rejected
+            }
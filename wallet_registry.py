@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Registro wallet → sesiones Socket.IO
+Permite enviar notificaciones solo a las sesiones de una wallet (su sala
+'wallet:<address>') en lugar de hacer broadcast a todos los clientes.
+"""
+
+import threading
+
+
+def wallet_room(wallet_address):
+    """Nombre de la sala Socket.IO asociada a una wallet"""
+    return f'wallet:{wallet_address}'
+
+
+class WalletSocketRegistry:
+    """Índice bidireccional wallet ↔ sid con conteos de presencia"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sids_by_wallet = {}  # {wallet_address: set(sid)}
+        self._wallet_by_sid = {}   # {sid: wallet_address}
+
+    def register(self, sid, wallet_address):
+        """Asocia una sesión a una wallet; devuelve la wallet anterior si cambió"""
+        with self._lock:
+            previous = self._wallet_by_sid.get(sid)
+            if previous == wallet_address:
+                return None
+            if previous:
+                self._discard(sid, previous)
+            self._wallet_by_sid[sid] = wallet_address
+            self._sids_by_wallet.setdefault(wallet_address, set()).add(sid)
+            return previous
+
+    def unregister(self, sid):
+        """Elimina una sesión; devuelve la wallet a la que estaba asociada"""
+        with self._lock:
+            wallet_address = self._wallet_by_sid.pop(sid, None)
+            if wallet_address:
+                self._discard(sid, wallet_address)
+            return wallet_address
+
+    def _discard(self, sid, wallet_address):
+        sids = self._sids_by_wallet.get(wallet_address)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self._sids_by_wallet[wallet_address]
+
+    def session_count(self, wallet_address):
+        with self._lock:
+            return len(self._sids_by_wallet.get(wallet_address, ()))
+
+    def is_online(self, wallet_address):
+        return self.session_count(wallet_address) > 0
+
+    def get_presence(self):
+        with self._lock:
+            return {
+                'online_wallets': len(self._sids_by_wallet),
+                'wallet_sessions': len(self._wallet_by_sid)
+            }
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cola de ingesta asíncrona para webhooks de Helius
+El endpoint guarda el payload crudo en la tabla webhook_inbox y responde 200 de
+inmediato. Un despachador lee la tabla en orden y entrega cada payload completo
+a un worker de depósitos, elegido por hash de su primera signature: todas sus
+transacciones se acreditan en un solo lote (un commit), y un reenvío del mismo
+payload cae en el mismo worker, en orden.
+"""
+
+import os
+import json
+import time
+import queue
+import threading
+import logging
+from zlib import crc32
+
+from sqlalchemy import Table, Column, Integer, Float, String, Text, MetaData, select, update, func
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+webhook_inbox = Table(
+    'webhook_inbox', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('payload', Text, nullable=False),
+    Column('status', String(20), default='pending', index=True),  # pending, processing, done, failed
+    Column('attempts', Integer, default=0),
+    Column('error', String(200), nullable=True),
+    Column('received_at', Float, nullable=False),
+    Column('processed_at', Float, nullable=True),
+)
+
+
+def extract_webhook_transactions(webhook_data):
+    """Devuelve la lista de transacciones contenidas en un payload de webhook"""
+    webhook_type = webhook_data.get('type')
+    if webhook_type == 'enhanced':
+        return webhook_data.get('transactions', [])
+    elif webhook_type == 'transaction':
+        return [webhook_data]
+    return []
+
+
+class WebhookQueue:
+    """Cola durable de webhooks con un pool de workers de depósitos"""
+
+    def __init__(self, engine, handler, workers=None, max_attempts=None, poll_interval=0.5):
+        """
+        handler(transactions) recibe todas las transacciones de un payload y
+        devuelve cuántas se procesaron.
+        """
+        self.engine = engine
+        self.handler = handler
+        self.worker_count = workers or int(os.getenv('WEBHOOK_WORKERS', 4))
+        self.max_attempts = max_attempts or int(os.getenv('WEBHOOK_MAX_ATTEMPTS', 5))
+        self.poll_interval = poll_interval
+
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._worker_queues = [queue.Queue() for _ in range(self.worker_count)]
+        self._started = False
+
+        # Métricas
+        self.enqueued_total = 0
+        self.processed_payloads = 0
+        self.processed_transactions = 0
+        self.failed_payloads = 0
+        self.last_lag_seconds = 0.0
+
+        metadata.create_all(bind=engine)
+
+    # ----------------- Ingesta -----------------
+
+    def enqueue(self, webhook_data):
+        """Persiste el payload crudo y despierta al despachador"""
+        with self.engine.begin() as conn:
+            result = conn.execute(webhook_inbox.insert().values(
+                payload=json.dumps(webhook_data),
+                status='pending',
+                attempts=0,
+                received_at=time.time()
+            ))
+            inbox_id = result.inserted_primary_key[0]
+
+        with self._lock:
+            self.enqueued_total += 1
+        self._wakeup.set()
+        return inbox_id
+
+    # ----------------- Procesamiento -----------------
+
+    def start(self):
+        """Arranca el despachador y los workers (reanuda lo que quedó en vuelo)"""
+        if self._started:
+            return
+        self._started = True
+
+        # Tras un reinicio, lo que estaba en 'processing' vuelve a la cola.
+        # Reprocesar es seguro: los depósitos se deduplican por signature.
+        with self.engine.begin() as conn:
+            conn.execute(update(webhook_inbox)
+                         .where(webhook_inbox.c.status == 'processing')
+                         .values(status='pending'))
+
+        for index in range(self.worker_count):
+            threading.Thread(target=self._worker_loop, args=(index,), daemon=True,
+                             name=f'webhook-worker-{index}').start()
+        threading.Thread(target=self._dispatch_loop, daemon=True, name='webhook-dispatcher').start()
+        logger.info(f"✅ Cola de webhooks iniciada con {self.worker_count} workers")
+
+    def _worker_for(self, signature):
+        return crc32((signature or '').encode('utf-8')) % self.worker_count
+
+    def _dispatch_loop(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                self._dispatch_pending()
+            except Exception as e:
+                logger.error(f"❌ Error despachando webhooks: {e}")
+
+    def _dispatch_pending(self, batch_size=100):
+        with self.engine.begin() as conn:
+            rows = conn.execute(
+                select(webhook_inbox.c.id, webhook_inbox.c.payload, webhook_inbox.c.received_at)
+                .where(webhook_inbox.c.status == 'pending')
+                .order_by(webhook_inbox.c.id)
+                .limit(batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            conn.execute(update(webhook_inbox)
+                         .where(webhook_inbox.c.id.in_([row.id for row in rows]))
+                         .values(status='processing', attempts=webhook_inbox.c.attempts + 1))
+
+        for row in rows:
+            try:
+                transactions = extract_webhook_transactions(json.loads(row.payload))
+            except Exception as e:
+                self._finish_row(row.id, error=f'payload inválido: {e}', retry=False)
+                continue
+
+            if not transactions:
+                self._finish_row(row.id)
+                continue
+
+            index = self._worker_for(transactions[0].get('signature'))
+            self._worker_queues[index].put((row.id, row.received_at, transactions))
+
+    def _worker_loop(self, index):
+        work = self._worker_queues[index]
+        while True:
+            self._process_unit(index, *work.get())
+
+    def _process_unit(self, index, inbox_id, received_at, transactions):
+        """Pasa las transacciones de un payload al handler y anota el resultado de su fila"""
+        error = None
+        try:
+            processed = self.handler(transactions) or 0
+            with self._lock:
+                self.processed_transactions += processed
+        except Exception as e:
+            error = 'error en worker'
+            logger.error(f"❌ Error en worker de webhooks {index}: {e}")
+        self.last_lag_seconds = time.time() - received_at
+        self._finish_row(inbox_id, error=error)
+
+    def _finish_row(self, inbox_id, error=None, retry=True):
+        with self.engine.begin() as conn:
+            if error is None:
+                conn.execute(update(webhook_inbox)
+                             .where(webhook_inbox.c.id == inbox_id)
+                             .values(status='done', error=None, processed_at=time.time()))
+                with self._lock:
+                    self.processed_payloads += 1
+                return
+
+            attempts = conn.execute(select(webhook_inbox.c.attempts)
+                                    .where(webhook_inbox.c.id == inbox_id)).scalar() or 0
+            status = 'pending' if retry and attempts < self.max_attempts else 'failed'
+            conn.execute(update(webhook_inbox)
+                         .where(webhook_inbox.c.id == inbox_id)
+                         .values(status=status, error=error[:200], processed_at=time.time()))
+            if status == 'failed':
+                with self._lock:
+                    self.failed_payloads += 1
+
+    # ----------------- Métricas -----------------
+
+    def get_metrics(self):
+        """Profundidad de la cola, retraso y contadores de procesamiento"""
+        with self.engine.connect() as conn:
+            depth = conn.execute(
+                select(func.count()).select_from(webhook_inbox)
+                .where(webhook_inbox.c.status.in_(['pending', 'processing']))
+            ).scalar() or 0
+            oldest = conn.execute(
+                select(func.min(webhook_inbox.c.received_at))
+                .where(webhook_inbox.c.status.in_(['pending', 'processing']))
+            ).scalar()
+
+        return {
+            'queue_depth': depth,
+            'in_memory_units': sum(q.qsize() for q in self._worker_queues),
+            'oldest_pending_lag_seconds': round(time.time() - oldest, 3) if oldest else 0.0,
+            'last_processed_lag_seconds': round(self.last_lag_seconds, 3),
+            'enqueued_total': self.enqueued_total,
+            'processed_payloads': self.processed_payloads,
+            'processed_transactions': self.processed_transactions,
+            'failed_payloads': self.failed_payloads,
+            'workers': self.worker_count
+        }
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Worker durable de retiros
+Cada retiro se persiste en la tabla withdrawal_queue y avanza por una máquina
+de estados:
+
+    queued → signed → submitted → confirmed
+                                 ↘ failed
+
+- queued: insertado por /api/withdraw/request junto con el descuento de fichas.
+- signed: la transacción del lote (varios pagos) se firma y se guarda ANTES de
+  enviarla; tras un reinicio se reenvían exactamente los mismos bytes, que
+  tienen la misma firma, así que nunca se paga dos veces.
+- submitted: enviada; se confirma con getSignatureStatuses en lotes.
+- Si el blockhash expira (lastValidBlockHeight superado) sin que la firma
+  aparezca en la cadena, el pago vuelve a queued y se firma de nuevo.
+"""
+
+import os
+import time
+import base64
+import threading
+import logging
+
+from sqlalchemy import Table, Column, Index, Integer, BigInteger, Float, String, Text, MetaData, select, update, func
+
+from payout_builder import (load_custodial_keypair, build_transfer_transaction, max_transfers_per_transaction,
+                            is_valid_destination)
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+withdrawal_queue = Table(
+    'withdrawal_queue', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('idempotency_key', String(100), nullable=False),
+    Column('user_transaction_id', Integer, nullable=False, index=True),
+    Column('wallet_address', String(50), nullable=False),
+    Column('destination', String(50), nullable=False),
+    Column('lamports', BigInteger, nullable=False),
+    Column('chip_amount', Integer, nullable=False),
+    Column('status', String(20), default='queued', index=True),  # queued, signed, submitted, confirmed, failed
+    Column('signature', String(100), nullable=True, index=True),
+    Column('raw_transaction', Text, nullable=True),  # transacción firmada en base64
+    Column('last_valid_block_height', BigInteger, nullable=True),
+    Column('attempts', Integer, default=0),
+    Column('error', String(200), nullable=True),
+    Column('created_at', Float, nullable=False),
+    Column('updated_at', Float, nullable=False),
+    # La clave de idempotencia es única por wallet
+    Index('uq_withdrawal_queue_wallet_idempotency', 'wallet_address', 'idempotency_key', unique=True),
+)
+
+# getSignatureStatuses acepta hasta 256 firmas por llamada
+STATUS_BATCH_SIZE = 256
+
+
+class WithdrawalWorker:
+    """Procesa la tabla withdrawal_queue en segundo plano"""
+
+    def __init__(self, engine, helius, on_final=None, blockhash_cache=None, signing_service=None,
+                 flush_window=None, max_batch_size=None, max_attempts=None, poll_interval=None):
+        """
+        on_final(conn, results) recibe [{'user_transaction_id', 'status', 'signature',
+        'chip_amount', 'lamports'}, ...] cuando los retiros llegan a confirmed o
+        failed. Se ejecuta en la misma transacción que cambia su estado: si
+        falla, nada se confirma y el retiro se vuelve a finalizar en el próximo
+        ciclo. Puede devolver una función que se llama tras el commit.
+        blockhash_cache (BlockhashCache) evita las RPC de blockhash, altura y
+        comisión de prioridad al firmar y al detectar expiraciones.
+        signing_service (SigningService) firma los lotes en un pool de procesos.
+        """
+        self.engine = engine
+        self.helius = helius
+        self.on_final = on_final
+        self.blockhash_cache = blockhash_cache
+        self.signing_service = signing_service
+        self.flush_window = flush_window if flush_window is not None else float(os.getenv('WITHDRAWAL_FLUSH_WINDOW', 2.0))
+        limit = max_transfers_per_transaction(with_compute_budget=blockhash_cache is not None)
+        self.max_batch_size = min(max_batch_size or int(os.getenv('WITHDRAWAL_BATCH_SIZE', limit)), limit)
+        self.max_attempts = max_attempts or int(os.getenv('WITHDRAWAL_MAX_ATTEMPTS', 5))
+        self.poll_interval = poll_interval or float(os.getenv('WITHDRAWAL_POLL_INTERVAL', 2.0))
+
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._keypair = None
+        self._started = False
+        # Sin wallet custodial no se puede firmar: el worker no arranca y los retiros se rechazan
+        self.unavailable_reason = None
+        if helius is not None:
+            try:
+                self._keypair = load_custodial_keypair()
+            except ValueError as e:
+                self.unavailable_reason = str(e)
+                logger.error(f"❌ Worker de retiros deshabilitado: {e}")
+
+        # Métricas
+        self.batches_signed = 0
+        self.transactions_sent = 0
+        self.resigned_expired = 0
+        self.confirmed_total = 0
+        self.failed_total = 0
+
+        metadata.create_all(bind=engine)
+        # create_all no agrega índices a tablas existentes
+        for index in withdrawal_queue.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+    @property
+    def enabled(self):
+        return self.helius is not None and self.unavailable_reason is None
+
+    # ----------------- Ingesta -----------------
+
+    def build_insert(self, idempotency_key, user_transaction_id, wallet_address, destination,
+                     lamports, chip_amount, status='queued', signature=None):
+        """
+        Sentencia INSERT del retiro, para ejecutarla en la misma transacción que
+        descuenta las fichas
+        """
+        now = time.time()
+        return withdrawal_queue.insert().values(
+            idempotency_key=idempotency_key,
+            user_transaction_id=user_transaction_id,
+            wallet_address=wallet_address,
+            destination=destination,
+            lamports=int(lamports),
+            chip_amount=int(chip_amount),
+            status=status,
+            signature=signature,
+            attempts=0,
+            created_at=now,
+            updated_at=now
+        )
+
+    def notify(self):
+        """Despierta al worker tras encolar un retiro"""
+        self._wakeup.set()
+
+    def get_by_idempotency_key(self, conn, wallet_address, idempotency_key):
+        return conn.execute(select(withdrawal_queue)
+                            .where(withdrawal_queue.c.wallet_address == wallet_address)
+                            .where(withdrawal_queue.c.idempotency_key == idempotency_key)).first()
+
+    def idempotency_key_taken(self, conn, wallet_address, idempotency_key):
+        """True si otra wallet ya usó la clave"""
+        return conn.execute(select(withdrawal_queue.c.id)
+                            .where(withdrawal_queue.c.idempotency_key == idempotency_key)
+                            .where(withdrawal_queue.c.wallet_address != wallet_address)
+                            .limit(1)).first() is not None
+
+    def get_by_user_transaction(self, user_transaction_id):
+        with self.engine.connect() as conn:
+            return conn.execute(select(withdrawal_queue)
+                                .where(withdrawal_queue.c.user_transaction_id == user_transaction_id)).first()
+
+    # ----------------- Procesamiento -----------------
+
+    def start(self):
+        """Arranca el worker; los retiros en vuelo se retoman desde su estado persistido"""
+        if self._started or not self.enabled:
+            return
+        self._started = True
+        threading.Thread(target=self._run, daemon=True, name='withdrawal-worker').start()
+        print(f"💸 Worker de retiros iniciado (ventana {self.flush_window}s, hasta {self.max_batch_size} pagos por transacción)")
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"❌ Error en worker de retiros: {e}")
+
+    def run_once(self):
+        """Un ciclo completo: firmar lotes, enviar firmados y confirmar enviados"""
+        self._sign_queued()
+        self._submit_signed()
+        self._poll_statuses()
+
+    def _get_keypair(self):
+        if self._keypair is None:
+            self._keypair = load_custodial_keypair()
+        return self._keypair
+
+    def _sign_queued(self):
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(withdrawal_queue.c.id, withdrawal_queue.c.destination,
+                       withdrawal_queue.c.lamports, withdrawal_queue.c.created_at)
+                .where(withdrawal_queue.c.status == 'queued')
+                .order_by(withdrawal_queue.c.id)
+                .limit(self.max_batch_size * max(10, self.signing_service.workers if self.signing_service else 0))
+            ).fetchall()
+        if not rows:
+            return
+        # Un destino inválido haría fallar el lote entero en cada ciclo: esos
+        # retiros se dan por fallidos (se reembolsan) y el resto se firma
+        invalid = {row.id for row in rows if not is_valid_destination(row.destination) or row.lamports <= 0}
+        if invalid:
+            self._fail_queued(sorted(invalid), 'destino o monto inválido')
+            rows = [row for row in rows if row.id not in invalid]
+            if not rows:
+                return
+        # Esperar a llenar el lote salvo que el pago más antiguo agote la ventana
+        if len(rows) < self.max_batch_size and time.time() - rows[0].created_at < self.flush_window:
+            return
+
+        if self.blockhash_cache:
+            recent_blockhash, last_valid_block_height = self.blockhash_cache.get()
+            compute_unit_price = self.blockhash_cache.priority_fee()
+        else:
+            recent_blockhash, last_valid_block_height = self.helius.get_latest_blockhash()
+            compute_unit_price = None
+        batches = [rows[start:start + self.max_batch_size] for start in range(0, len(rows), self.max_batch_size)]
+        transfers = [[(row.destination, row.lamports) for row in batch] for batch in batches]
+        if self.signing_service:
+            # Los lotes se firman en paralelo en el pool de procesos
+            signed = self.signing_service.sign_batches(transfers, recent_blockhash, compute_unit_price)
+        else:
+            keypair = self._get_keypair()
+            signed = [build_transfer_transaction(keypair, batch_transfers, recent_blockhash, compute_unit_price)
+                      for batch_transfers in transfers]
+
+        for batch, (signature, raw_transaction) in zip(batches, signed):
+            # Persistir la transacción firmada antes de enviarla
+            with self.engine.begin() as conn:
+                result = conn.execute(
+                    update(withdrawal_queue)
+                    .where(withdrawal_queue.c.id.in_([row.id for row in batch]))
+                    .where(withdrawal_queue.c.status == 'queued')
+                    .values(status='signed', signature=signature,
+                            raw_transaction=base64.b64encode(raw_transaction).decode('ascii'),
+                            last_valid_block_height=last_valid_block_height,
+                            attempts=withdrawal_queue.c.attempts + 1, updated_at=time.time())
+                )
+                if result.rowcount != len(batch):
+                    # Otro proceso tomó alguno de estos pagos: descartar esta firma
+                    raise RuntimeError("Lote de retiros modificado concurrentemente")
+            with self._lock:
+                self.batches_signed += 1
+
+    def _submit_signed(self):
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(withdrawal_queue.c.signature, withdrawal_queue.c.raw_transaction)
+                .where(withdrawal_queue.c.status == 'signed')
+                .group_by(withdrawal_queue.c.signature, withdrawal_queue.c.raw_transaction)
+            ).fetchall()
+
+        for row in rows:
+            try:
+                self.helius.send_raw_transaction(base64.b64decode(row.raw_transaction))
+            except Exception as e:
+                # Se reintenta en el próximo ciclo; si el blockhash expira se vuelve a firmar
+                logger.error(f"Error enviando lote de retiros {row.signature}: {e}")
+                continue
+            with self.engine.begin() as conn:
+                conn.execute(update(withdrawal_queue)
+                             .where(withdrawal_queue.c.signature == row.signature)
+                             .where(withdrawal_queue.c.status == 'signed')
+                             .values(status='submitted', updated_at=time.time()))
+            with self._lock:
+                self.transactions_sent += 1
+            logger.info(f"Lote de retiros enviado: {row.signature}")
+
+    def _poll_statuses(self):
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(withdrawal_queue.c.signature, func.max(withdrawal_queue.c.last_valid_block_height))
+                .where(withdrawal_queue.c.status.in_(['signed', 'submitted']))
+                .group_by(withdrawal_queue.c.signature)
+            ).fetchall()
+        if not rows:
+            return
+
+        block_height = None
+        for start in range(0, len(rows), STATUS_BATCH_SIZE):
+            chunk = rows[start:start + STATUS_BATCH_SIZE]
+            statuses = self.helius.get_signature_statuses([row[0] for row in chunk])
+            for (signature, last_valid_block_height), status in zip(chunk, statuses):
+                try:
+                    if status is None:
+                        if block_height is None:
+                            block_height = (self.blockhash_cache.block_height() if self.blockhash_cache
+                                            else self.helius.get_block_height())
+                        if last_valid_block_height is not None and block_height > last_valid_block_height:
+                            self._expire(signature)
+                    elif status.get('err') is not None:
+                        self._finalize(signature, 'failed', error=str(status['err']))
+                    elif status.get('confirmationStatus') in ('confirmed', 'finalized'):
+                        self._finalize(signature, 'confirmed')
+                except Exception as e:
+                    # El lote sigue en signed/submitted y se reintenta en el próximo ciclo
+                    logger.error(f"Error finalizando lote de retiros {signature}: {e}")
+
+    def _expire(self, signature):
+        """El blockhash expiró sin que la transacción llegara a la cadena: volver a firmar"""
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                update(withdrawal_queue)
+                .where(withdrawal_queue.c.signature == signature)
+                .where(withdrawal_queue.c.status.in_(['signed', 'submitted']))
+                .where(withdrawal_queue.c.attempts < self.max_attempts)
+                .values(status='queued', signature=None, raw_transaction=None,
+                        last_valid_block_height=None, error='blockhash expirado',
+                        updated_at=time.time())
+            )
+        with self._lock:
+            self.resigned_expired += result.rowcount
+        # Los que agotaron los intentos se dan por fallidos
+        self._finalize(signature, 'failed', error='intentos agotados')
+
+    def _finalize(self, signature, status, error=None):
+        self._finalize_where(withdrawal_queue.c.signature == signature, ('signed', 'submitted'), status, error)
+
+    def _fail_queued(self, ids, error):
+        """Retiros que no se pueden firmar: pasan a failed sin salir de queued"""
+        logger.error(f"Retiros {ids} no se pueden firmar: {error}")
+        self._finalize_where(withdrawal_queue.c.id.in_(ids), ('queued',), 'failed', error)
+
+    def _finalize_where(self, condition, from_statuses, status, error=None):
+        with self.engine.begin() as conn:
+            rows = conn.execute(
+                select(withdrawal_queue.c.user_transaction_id, withdrawal_queue.c.chip_amount,
+                       withdrawal_queue.c.lamports, withdrawal_queue.c.signature)
+                .where(condition)
+                .where(withdrawal_queue.c.status.in_(from_statuses))
+            ).fetchall()
+            if not rows:
+                return
+            conn.execute(update(withdrawal_queue)
+                         .where(condition)
+                         .where(withdrawal_queue.c.status.in_(from_statuses))
+                         .values(status=status, error=error[:200] if error else None,
+                                 raw_transaction=None, updated_at=time.time()))
+            # Reembolsos e historial en la misma transacción que el estado final
+            after_commit = None
+            if self.on_final:
+                after_commit = self.on_final(conn, [
+                    {'user_transaction_id': row.user_transaction_id, 'status': status, 'signature': row.signature,
+                     'chip_amount': row.chip_amount, 'lamports': row.lamports}
+                    for row in rows
+                ])
+
+        with self._lock:
+            if status == 'confirmed':
+                self.confirmed_total += len(rows)
+            else:
+                self.failed_total += len(rows)
+        if after_commit:
+            after_commit()
+
+    # ----------------- Métricas -----------------
+
+    def get_metrics(self):
+        """Retiros por estado, antigüedad del más viejo pendiente y contadores"""
+        with self.engine.connect() as conn:
+            by_status = dict(conn.execute(
+                select(withdrawal_queue.c.status, func.count()).group_by(withdrawal_queue.c.status)
+            ).fetchall())
+            oldest = conn.execute(
+                select(func.min(withdrawal_queue.c.created_at))
+                .where(withdrawal_queue.c.status.in_(['queued', 'signed', 'submitted']))
+            ).scalar()
+
+        return {
+            'enabled': self.enabled,
+            'unavailable_reason': self.unavailable_reason,
+            'by_status': by_status,
+            'oldest_in_flight_seconds': round(time.time() - oldest, 3) if oldest else 0.0,
+            'flush_window': self.flush_window,
+            'max_batch_size': self.max_batch_size,
+            'batches_signed': self.batches_signed,
+            'transactions_sent': self.transactions_sent,
+            'resigned_expired': self.resigned_expired,
+            'confirmed_total': self.confirmed_total,
+            'failed_total': self.failed_total
+        }